@@ -0,0 +1,46 @@
+import time
+from generate_dataset import LLMStats, RateLimiter, generate_ordered
+from fake_llm import FakeLLM
+
+# Compares per-paragraph and batched prompting against the local FakeLLM.
+# Latency is modelled as a fixed round-trip plus a per-prompt-token cost.
+NUM_PARAGRAPHS = 200
+BATCH_SIZES = [1, 4, 8, 16]
+LATENCY = 0.3
+PER_TOKEN_LATENCY = 0.0002
+DROP_RATE = 0.05
+MAX_WORKERS = 8
+
+def make_paragraphs(n):
+    return [f"Paragraph {i}: The Reserve Bank reviewed liquidity conditions, credit growth and "
+            f"the regulatory framework for payment system operators during the year {2000 + i % 25}. "
+            f"Measures announced included revisions to prudential norms and reporting requirements."
+            for i in range(n)]
+
+def run(paras, batch_size):
+    llm = FakeLLM(latency=LATENCY, per_token_latency=PER_TOKEN_LATENCY, drop_rate=DROP_RATE)
+    stats = LLMStats()
+    limiter = RateLimiter(10**6, 10**9)
+    items = ((i, paras[max(0, i - 2):i], paras[i]) for i in range(len(paras)))
+    start = time.monotonic()
+    results = list(generate_ordered(items, llm_fn=llm, limiter=limiter, stats=stats,
+                                    batch_size=batch_size, max_workers=MAX_WORKERS))
+    elapsed = time.monotonic() - start
+    answered = sum(1 for _, r in results if r is not None)
+    return stats, elapsed, answered
+
+def main():
+    paras = make_paragraphs(NUM_PARAGRAPHS)
+    baseline = None
+    print(f"{'batch':>5} {'calls':>6} {'tokens':>8} {'wall s':>7} {'answered':>8} {'token save':>10} {'time save':>9}")
+    for batch_size in BATCH_SIZES:
+        stats, elapsed, answered = run(paras, batch_size)
+        if baseline is None:
+            baseline = (stats.prompt_tokens, elapsed)
+        token_save = 100 * (1 - stats.prompt_tokens / baseline[0])
+        time_save = 100 * (1 - elapsed / baseline[1])
+        print(f"{batch_size:>5} {stats.calls:>6} {stats.prompt_tokens:>8} {elapsed:>7.2f} "
+              f"{answered:>8} {token_save:>9.1f}% {time_save:>8.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import random
+from compare_models import BASE_MODEL, FINETUNED_MODEL, print_report, run_batch, user_prompt
+from ollama_stub import StubModel, start_stub
+
+# compare_models.py batch mode against ollama_stub.py: the stub's fine-tuned model answers with
+# the reference and the base model with a generic answer, each with a fixed time to first token
+# and token rate. Reports measured TTFT/decode rates, connection reuse and the speedup of
+# concurrent requests over one-at-a-time; tests/test_compare_models.py checks the scoring.
+NUM_PROMPTS = 24
+BASE_TTFT, BASE_RATE = 0.15, 80.0
+FINETUNED_TTFT, FINETUNED_RATE = 0.10, 120.0
+WORDS = ("the reserve bank revised repo rate inflation target liquidity credit growth banks payment "
+         "systems deposits regulation monetary committee percent basis points").split()
+
+def make_samples(rng: random.Random):
+    return [{"instruction": "Answer the question based on the provided context from the financial report.",
+             "input": f"Question: What did the report say about {rng.choice(WORDS)} in year {2000 + i}?",
+             "output": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 40)))}
+            for i in range(NUM_PROMPTS)]
+
+def main():
+    samples = make_samples(random.Random(3407))
+    models = {
+        BASE_MODEL: StubModel(BASE_TTFT, BASE_RATE, default_answer=" ".join(["The report discusses monetary policy and its effects."] * 4)),
+        FINETUNED_MODEL: StubModel(FINETUNED_TTFT, FINETUNED_RATE, answers={user_prompt(s): s["output"] for s in samples}),
+    }
+    server = start_stub(models)
+    api_url = f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+    handler = server.RequestHandlerClass
+
+    serial = run_batch(samples, [BASE_MODEL, FINETUNED_MODEL], concurrency=1, api_url=api_url)
+    handler.connections = 0
+    concurrent = run_batch(samples, [BASE_MODEL, FINETUNED_MODEL], concurrency=8, api_url=api_url)
+    connections = handler.connections
+    server.shutdown()
+    print_report(concurrent)
+
+    base, tuned = concurrent["summary"][BASE_MODEL], concurrent["summary"][FINETUNED_MODEL]
+    print(f"\nTTFT p50 {base['ttft_s']['p50'] * 1000:.0f}/{tuned['ttft_s']['p50'] * 1000:.0f} ms "
+          f"(stub {BASE_TTFT * 1000:.0f}/{FINETUNED_TTFT * 1000:.0f} ms), decode "
+          f"{base['tokens_per_s_median']:.0f}/{tuned['tokens_per_s_median']:.0f} tok/s (stub {BASE_RATE:.0f}/{FINETUNED_RATE:.0f})")
+    print(f"{connections} connections for {2 * NUM_PROMPTS} requests")
+    print(f"Concurrency 8 vs 1: {serial['wall_seconds']:.1f}s -> {concurrent['wall_seconds']:.1f}s "
+          f"({serial['wall_seconds'] / concurrent['wall_seconds']:.1f}x)")
+
+if __name__ == "__main__":
+    main()
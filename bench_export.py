@@ -0,0 +1,69 @@
+import os
+import sys
+import time
+import tempfile
+import fix_export
+from fix_export import DiskMonitor, export, find_tools, run_measured, target_path
+
+# GGUF export of a tiny randomly initialised Qwen2 (real Qwen2 tokenizer, so llama.cpp accepts it):
+# the old serial flow (f16 GGUF, then one llama-quantize per target) vs fix_export.export(),
+# which runs the quantizations concurrently and, for a Q8_0-only export, skips the f16 GGUF.
+# Needs llama.cpp (LLAMA_CPP_DIR) with llama-quantize built; BENCH_TOKENIZER may point at a local copy.
+# The export plan (shared f16 GGUF, no leftovers, skipped re-runs) is tested in tests/test_fix_export.py.
+BENCH_TOKENIZER = os.environ.get("BENCH_TOKENIZER", "Qwen/Qwen2.5-0.5B-Instruct")
+QUANTS = ["Q4_K_M", "Q5_K_M", "Q8_0"]
+HIDDEN_SIZE = 512  # K-quants work on 256-wide blocks
+LAYERS = 4
+
+def make_model(path: str):
+    from transformers import AutoTokenizer, Qwen2Config, Qwen2ForCausalLM
+    import torch
+    tokenizer = AutoTokenizer.from_pretrained(BENCH_TOKENIZER)
+    torch.manual_seed(3407)
+    config = Qwen2Config(vocab_size=len(tokenizer), hidden_size=HIDDEN_SIZE, intermediate_size=4 * HIDDEN_SIZE,
+                         num_hidden_layers=LAYERS, num_attention_heads=8, num_key_value_heads=4,
+                         tie_word_embeddings=False, torch_dtype="bfloat16")
+    Qwen2ForCausalLM(config).to(torch.bfloat16).save_pretrained(path)
+    tokenizer.save_pretrained(path)
+
+def serial_export(source_dir: str, output_dir: str, quants) -> dict:
+    # What fix_export.py used to do, extended to every target
+    convert_script, quantize_bin = find_tools()
+    f16_path = os.path.join(output_dir, "model-f16.gguf")
+    outputs = [f16_path] + [target_path(q, output_dir) for q in quants]
+    start = time.monotonic()
+    with DiskMonitor(outputs) as disk:
+        run_measured("serial-f16", [sys.executable, convert_script, source_dir, "--outfile", f16_path, "--outtype", "f16"])
+        for quant in quants:
+            run_measured(f"serial-{quant}", [quantize_bin, f16_path, target_path(quant, output_dir), quant])
+    return {"wall_seconds": time.monotonic() - start, "peak_disk_bytes": disk.peak}
+
+def main():
+    convert_script, quantize_bin = find_tools()
+    if not os.path.exists(quantize_bin):
+        print(f"llama-quantize not found under {fix_export.llama_cpp_dir}; set LLAMA_CPP_DIR.")
+        sys.exit(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        source_dir = os.path.join(tmp, "merged")
+        make_model(source_dir)
+        fix_export.fix_tokenizer_files(source_dir)
+        dirs = {name: os.path.join(tmp, name) for name in ("serial", "export", "serial_q8", "export_q8")}
+        for path in dirs.values():
+            os.makedirs(path)
+
+        serial = serial_export(source_dir, dirs["serial"], QUANTS)
+        concurrent = export(source_dir, QUANTS, dirs["export"])
+        start = time.monotonic()
+        rerun = export(source_dir, QUANTS, dirs["export"])
+        rerun_seconds = time.monotonic() - start
+        serial_q8 = serial_export(source_dir, dirs["serial_q8"], ["Q8_0"])
+        direct_q8 = export(source_dir, ["Q8_0"], dirs["export_q8"])
+
+        print(f"Model: {fix_export.dir_size(source_dir) / 2**20:.1f} MB of safetensors, {os.cpu_count()} CPUs")
+        for label, r in ((f"Serial f16 + {len(QUANTS)} quantizations", serial), ("fix_export.export()", concurrent),
+                         ("Serial f16 + Q8_0", serial_q8), ("fix_export.export() Q8_0 direct", direct_q8)):
+            print(f"{label:<34} {r['wall_seconds']:6.1f}s, peak GGUF disk {r['peak_disk_bytes'] / 2**20:6.1f} MB")
+        print(f"{'Re-run, unchanged source':<34} {rerun_seconds:6.1f}s ({len(rerun['targets'])} targets rebuilt)")
+
+if __name__ == "__main__":
+    main()
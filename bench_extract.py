@@ -0,0 +1,31 @@
+import os
+import time
+import tempfile
+from pdf_extract import extract_pages
+from synthetic_reports import make_report
+
+# Pages/second of uncached extraction at different worker counts, plus a warm-cache re-read.
+NUM_PARAGRAPHS = 600  # ~100 pages
+WORKER_COUNTS = sorted({1, 2, 4, os.cpu_count() or 1})
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "synthetic_report.pdf")
+        make_report(pdf_path, NUM_PARAGRAPHS)
+
+        print(f"{'workers':>7} {'pages':>6} {'seconds':>8} {'pages/s':>8}")
+        for workers in WORKER_COUNTS:
+            start = time.perf_counter()
+            pages = sum(1 for _ in extract_pages(pdf_path, workers=workers, cache_dir=None))
+            elapsed = time.perf_counter() - start
+            print(f"{workers:>7} {pages:>6} {elapsed:>8.2f} {pages / elapsed:>8.1f}")
+
+        cache_dir = os.path.join(tmp, "cache")
+        list(extract_pages(pdf_path, workers=1, cache_dir=cache_dir))
+        start = time.perf_counter()
+        pages = sum(1 for _ in extract_pages(pdf_path, cache_dir=cache_dir))
+        elapsed = time.perf_counter() - start
+        print(f"{'cached':>7} {pages:>6} {elapsed:>8.2f} {pages / elapsed:>8.1f}")
+
+if __name__ == "__main__":
+    main()
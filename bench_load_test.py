@@ -0,0 +1,27 @@
+from compare_models import FINETUNED_MODEL
+from load_test import LOAD_OPTIONS, print_run, run_load
+from ollama_stub import StubModel, start_stub
+
+# load_test.py against ollama_stub.py with injected latency and failures, 2 server slots: what the
+# harness reports for 1, 2 and 8 closed-loop users and an open loop. Saturation, queueing and error
+# accounting are checked in tests/test_load_test.py.
+TTFT = 0.1
+TOKENS_PER_S = 100.0
+PREFILL_TOKENS_PER_S = 5000.0
+ERROR_RATE = 0.05
+PARALLEL = 2
+DURATION = 8.0
+
+def main():
+    server = start_stub({FINETUNED_MODEL: StubModel(TTFT, TOKENS_PER_S, prefill_tokens_per_s=PREFILL_TOKENS_PER_S,
+                                                    error_rate=ERROR_RATE)}, parallel=PARALLEL)
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+    for users in (1, 2, 8):
+        run = run_load(url, LOAD_OPTIONS, mode="closed", concurrency=users, duration=DURATION)
+        print_run(f"closed loop, {users} users", run, over_time=False)
+    open_run = run_load(url, LOAD_OPTIONS, mode="open", rate=4.0, duration=DURATION)
+    print_run("open loop, 4 req/s", open_run)
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import copy
+import time
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import torch
+import fix_export
+from lora_server import Batcher, GenerationRequest, LoraEngine
+from synthetic_reports import make_paragraph
+from tiny_model import make_tiny_tokenizer
+
+# lora_server.py on a small randomly initialised Qwen2 with four random (non-zero) LoRA adapters,
+# against the one-merged-model-per-variant setup fix_export.py produces today: weight memory, adapter
+# load time and a mixed workload. With LLAMA_CPP_DIR set, also exports one adapter as a GGUF LoRA.
+# Output equality with the merged models, the LRU and the HTTP API are checked in tests/test_lora_server.py.
+HIDDEN_SIZE = 256
+LAYERS = 4
+LORA_RANK = 16
+ADAPTERS = ["circulars", "kyc", "payments", "nbfc"]
+PROMPTS = ["What is the repo rate?", "Explain the KYC norms for small accounts.",
+           "Can a PPI issuer store card data?", "How are frauds reported?", "What is CRAR?"]
+NEW_TOKENS = 24
+WORKLOAD_REQUESTS = 64
+WORKLOAD_CONCURRENCY = 8
+
+def make_base(tokenizer):
+    from transformers import Qwen2Config, Qwen2ForCausalLM
+    torch.manual_seed(3407)
+    config = Qwen2Config(vocab_size=len(tokenizer), hidden_size=HIDDEN_SIZE, intermediate_size=4 * HIDDEN_SIZE,
+                         num_hidden_layers=LAYERS, num_attention_heads=8, num_key_value_heads=4,
+                         tie_word_embeddings=False, eos_token_id=tokenizer.eos_token_id,
+                         pad_token_id=tokenizer.pad_token_id)
+    return Qwen2ForCausalLM(config).eval()
+
+def make_adapters(base, adapters_dir: str):
+    # init_lora_weights=False gives random A and B, so every adapter changes the outputs
+    from peft import LoraConfig, get_peft_model
+    paths = {}
+    for seed, name in enumerate(ADAPTERS):
+        torch.manual_seed(seed)
+        config = LoraConfig(r=LORA_RANK, lora_alpha=LORA_RANK, init_lora_weights=False, task_type="CAUSAL_LM",
+                            target_modules=["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"])
+        model = get_peft_model(copy.deepcopy(base), config)
+        paths[name] = os.path.join(adapters_dir, name)
+        model.save_pretrained(paths[name])
+    return paths
+
+def param_bytes(model) -> int:
+    return sum(p.numel() * p.element_size() for p in model.parameters())
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def greedy(model, tokenizer, prompt: str):
+    inputs = tokenizer([prompt], return_tensors="pt")
+    with torch.inference_mode():
+        output = model.generate(**inputs, max_new_tokens=NEW_TOKENS, do_sample=False,
+                                pad_token_id=tokenizer.pad_token_id)
+    row = output[0, inputs["input_ids"].shape[1]:].tolist()
+    return row[:row.index(tokenizer.eos_token_id)] if tokenizer.eos_token_id in row else row
+
+def run_workload(batcher: Batcher, workload):
+    start = time.perf_counter()
+
+    def one(item):
+        sent = time.perf_counter()
+        batcher.submit(GenerationRequest(item[0], item[1], NEW_TOKENS)).result()
+        return time.perf_counter() - sent
+
+    with ThreadPoolExecutor(max_workers=WORKLOAD_CONCURRENCY) as pool:
+        latencies = sorted(pool.map(one, workload))
+    return time.perf_counter() - start, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+def run_merged_workload(merged, tokenizer, workload):
+    # One loaded model per variant with one slot each (Ollama's default), all serving at once
+    locks = {name: threading.Lock() for name in merged}
+    start = time.perf_counter()
+
+    def one(item):
+        sent = time.perf_counter()
+        with locks[item[0]]:
+            greedy(merged[item[0]], tokenizer, item[1])
+        return time.perf_counter() - sent
+
+    with ThreadPoolExecutor(max_workers=WORKLOAD_CONCURRENCY) as pool:
+        latencies = sorted(pool.map(one, workload))
+    return time.perf_counter() - start, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+def main():
+    from peft import PeftModel
+    torch.set_num_threads(4)
+    rng = random.Random(0)
+    tokenizer = make_tiny_tokenizer([make_paragraph(rng) for _ in range(500)] + PROMPTS)
+    tokenizer.padding_side = "left"
+    with tempfile.TemporaryDirectory() as tmp:
+        base = make_base(tokenizer)
+        adapters = make_adapters(base, os.path.join(tmp, "adapters"))
+
+        # Today's layout: one merged model per variant (plus the base)
+        rss_before = rss_bytes()
+        merged = {None: base}
+        for name, path in adapters.items():
+            merged[name] = PeftModel.from_pretrained(copy.deepcopy(base), path).merge_and_unload().eval()
+        merged_rss = rss_bytes() - rss_before
+        merged_bytes = sum(param_bytes(m) for m in merged.values())
+
+        rss_before = rss_bytes()
+        engine = LoraEngine(copy.deepcopy(base), tokenizer, adapters, max_loaded=len(adapters))
+        engine.generate([GenerationRequest(name, PROMPTS[0], 1) for name in adapters])
+        shared_rss = rss_bytes() - rss_before
+        shared_bytes = param_bytes(engine.model)
+        print(f"weights: {len(adapters)} merged variants + base {merged_bytes / 2**20:.1f} MB "
+              f"(RSS +{merged_rss / 2**20:.0f} MB), shared base + {len(adapters)} adapters "
+              f"{shared_bytes / 2**20:.1f} MB (RSS +{shared_rss / 2**20:.0f} MB)")
+
+        # LRU: two slots, a cycle of three adapters evicts on every new name
+        lru = LoraEngine(copy.deepcopy(base), tokenizer, adapters, max_loaded=2)
+        for name in ["circulars", "kyc", "circulars", "payments", "circulars", "kyc"]:
+            lru.generate([GenerationRequest(name, PROMPTS[0], 1)])
+        print(f"LRU of 2: {lru.stats['loads']} loads, {lru.stats['evictions']} evictions, "
+              f"{lru.stats['load_seconds'] / lru.stats['loads'] * 1000:.0f} ms per load")
+
+        # Mixed workload: every variant gets traffic at the same time
+        names = [None] + list(adapters)
+        workload = [(names[i % len(names)], PROMPTS[i % len(PROMPTS)]) for i in range(WORKLOAD_REQUESTS)]
+        rows = {"merged variants": run_merged_workload(merged, tokenizer, workload)}
+        for mode in ("swap", "mixed"):
+            engine.mode = mode
+            rows[f"shared, {mode}"] = run_workload(Batcher(engine), workload)
+        print(f"\n{WORKLOAD_REQUESTS} requests over {len(names)} variants, {NEW_TOKENS} new tokens, "
+              f"concurrency {WORKLOAD_CONCURRENCY}")
+        print(f"{'':<16} {'wall s':>7} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8}")
+        for label, (wall, p50, p95) in rows.items():
+            print(f"{label:<16} {wall:>7.2f} {WORKLOAD_REQUESTS / wall:>7.1f} {p50 * 1000:>8.0f} {p95 * 1000:>8.0f}")
+
+        if os.path.exists(os.path.join(fix_export.llama_cpp_dir, "convert_lora_to_gguf.py")):
+            from gguf import GGUFReader
+            base_dir = os.path.join(tmp, "base")
+            base.save_pretrained(base_dir)
+            result = fix_export.export_lora_adapter(adapters["kyc"], base_dir, tmp)
+            tensors = GGUFReader(result["path"]).tensors
+            lora_bytes = sum(os.path.getsize(os.path.join(adapters["kyc"], f)) for f in os.listdir(adapters["kyc"]))
+            print(f"GGUF LoRA: {len(tensors)} tensors, {result['size_bytes'] / 2**20:.2f} MB "
+                  f"(adapter {lora_bytes / 2**20:.2f} MB, base {param_bytes(base) / 2**20:.1f} MB)")
+        else:
+            print("skip GGUF LoRA export: set LLAMA_CPP_DIR to a llama.cpp checkout")
+
+if __name__ == "__main__":
+    main()
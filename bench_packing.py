@@ -0,0 +1,85 @@
+import os
+import glob
+import json
+import time
+import random
+from typing import Dict, List
+import torch
+import torch.nn.functional as F
+from packing import IGNORE_INDEX, PackedCollator, pack_samples, packing_efficiency
+from tiny_model import TINY_VOCAB_SIZE, make_tiny_model
+
+# Packed vs padded training on a tiny CPU model: real tokens/second and loss after one epoch.
+# Sample lengths come from the finetune_data shards when present, synthetic otherwise.
+# Loss/gradient parity with unpacked training is checked in tests/test_packing.py.
+FINETUNE_DIR = "finetune_data"
+NUM_SAMPLES = 96
+MAX_LENGTH = 512
+BATCH_SIZE = 2  # Unpacked batch size, as in train.py
+LEARNING_RATE = 1e-3
+
+def sample_lengths(rng: random.Random) -> List[int]:
+    lengths = []
+    for path in sorted(glob.glob(os.path.join(FINETUNE_DIR, "train", "*", "*.jsonl"))):
+        with open(path, 'r', encoding='utf-8') as f:
+            lengths += [json.loads(line)["num_tokens"] for line in f]
+    if len(lengths) >= NUM_SAMPLES:
+        return [min(n, MAX_LENGTH) for n in rng.sample(lengths, NUM_SAMPLES)]
+    return [max(16, min(MAX_LENGTH, int(rng.lognormvariate(5.3, 0.6)))) for _ in range(NUM_SAMPLES)]
+
+def padded_batch(samples: List[List[int]]) -> Dict[str, torch.Tensor]:
+    seq = max(len(s) for s in samples)
+    return {
+        "input_ids": torch.tensor([s + [0] * (seq - len(s)) for s in samples]),
+        "attention_mask": torch.tensor([[1] * len(s) + [0] * (seq - len(s)) for s in samples]),
+        "labels": torch.tensor([s + [IGNORE_INDEX] * (seq - len(s)) for s in samples]),
+    }
+
+def loss_sum(model, batch: Dict[str, torch.Tensor]):
+    # Summed next-token loss and token count, so packed and padded batches compare exactly
+    inputs = {k: v for k, v in batch.items() if k != "labels"}
+    logits = model(**inputs).logits[:, :-1]
+    labels = batch["labels"][:, 1:]
+    loss = F.cross_entropy(logits.reshape(-1, logits.shape[-1]).float(), labels.reshape(-1),
+                           ignore_index=IGNORE_INDEX, reduction="sum")
+    return loss, int((labels != IGNORE_INDEX).sum())
+
+def train_epoch(model, batches) -> float:
+    optimizer = torch.optim.AdamW(model.parameters(), lr=LEARNING_RATE)
+    start = time.perf_counter()
+    for batch in batches:
+        loss, n = loss_sum(model, batch)
+        (loss / n).backward()
+        optimizer.step()
+        optimizer.zero_grad()
+    return time.perf_counter() - start
+
+def main():
+    torch.set_num_threads(max(1, os.cpu_count() // 2))
+    rng = random.Random(3407)
+    lengths = sample_lengths(rng)
+    samples = [[rng.randrange(1, TINY_VOCAB_SIZE) for _ in range(n)] for n in lengths]
+    packed = pack_samples(samples, MAX_LENGTH)
+    real_tokens = sum(lengths)
+    order = list(range(len(samples)))
+    rng.shuffle(order)
+    padded = [padded_batch([samples[i] for i in order[j:j + BATCH_SIZE]]) for j in range(0, len(order), BATCH_SIZE)]
+    padded_tokens = sum(b["input_ids"].numel() for b in padded)
+    print(f"{len(samples)} samples, {real_tokens} tokens, max length {MAX_LENGTH}")
+    print(f"Unpacked: {len(padded)} batches of {BATCH_SIZE}, {real_tokens / padded_tokens:.1%} real tokens")
+    print(f"Packed:   {len(packed)} sequences, {packing_efficiency(packed, MAX_LENGTH):.1%} filled")
+
+    collator = PackedCollator(pad_token_id=0)
+    results = {}
+    for name, batches in [("unpacked", padded), ("packed", [collator([p]) for p in packed])]:
+        model = make_tiny_model()
+        elapsed = train_epoch(model, batches)
+        with torch.no_grad():
+            eval_loss = sum(loss_sum(model, padded_batch([s]))[0].item() for s in samples)
+        results[name] = (elapsed, eval_loss / (real_tokens - len(samples)))
+        print(f"{name:>8}: {len(batches)} steps in {elapsed:.2f}s, {real_tokens / elapsed:,.0f} real tokens/s, "
+              f"loss after one epoch {results[name][1]:.4f}")
+    print(f"Packed speedup: {results['unpacked'][0] / results['packed'][0]:.2f}x real tokens/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import os
+import sys
+import glob
+import json
+import time
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime, timezone
+from functools import partial
+from typing import Dict, Optional
+import torch
+import generate_dataset
+import prepare_finetune_dataset
+from dataset_store import DATASET_FILE, atomic_write_json, iter_dataset
+from fake_llm import FakeLLM
+from generate_dataset import filter_paragraphs, get_paragraphs
+from packing import PackedCollator, PackedDataset
+from pdf_extract import extract_pages
+from prepare_finetune_dataset import convert_to_alpaca, sample_text
+from pretokenize import load_or_build
+from segment import segment_pages
+from synthetic_reports import make_corpus
+from tiny_model import make_tiny_model, make_tiny_tokenizer
+from token_counts import TokenCounter
+
+# Every stage of the data and training pipeline on a synthetic corpus, offline: PDF extraction,
+# segmentation, Q&A generation (generate_dataset.main against FakeLLM), Alpaca/ChatML formatting,
+# dataset preparation, pre-tokenization and a tiny-model training step. Each stage reports one
+# headline throughput; results go to bench_pipeline.json together with the git commit, and are
+# compared with a saved baseline (--save-baseline) so a stage that slows down beyond its
+# tolerance fails the run. That the stages produce the right output is checked in tests/test_pipeline.py.
+NUM_REPORTS = 3
+PARAGRAPHS_PER_REPORT = 400
+LLM_LATENCY = 0.02  # Seconds per FakeLLM call
+LLM_PER_TOKEN_LATENCY = 0.0
+SEGMENT_REPEATS = 10  # Segmentation and formatting are too fast to time reliably in one pass
+FORMAT_REPEATS = 40
+ROUNDS = 5  # In-process stages are timed this many times and the fastest round counts
+TRAIN_STEPS = 20
+TRAIN_MAX_LENGTH = 512
+RESULTS_FILE = "bench_pipeline.json"
+BASELINE_FILE = "bench_pipeline_baseline.json"
+# Largest allowed drop in a stage's throughput against the baseline; run-to-run noise on a shared
+# CPU is around 20% for the stages timed once
+REGRESSION_TOLERANCE = {"extract": 0.35, "segment": 0.25, "generate": 0.3, "format": 0.25,
+                        "prepare": 0.35, "tokenize": 0.35, "train_step": 0.35}
+
+def fastest(fn, rounds: int = ROUNDS) -> float:
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def stage_result(seconds: float, items: int, unit: str, **extra) -> Dict:
+    return dict(extra, seconds=seconds, items=items, unit=unit, throughput=items / seconds if seconds else 0.0)
+
+def stage_extract(paths) -> (Dict, Dict):
+    start = time.perf_counter()
+    pages = {path: list(extract_pages(path, cache_dir=None)) for path in paths}
+    seconds = time.perf_counter() - start
+    return stage_result(seconds, sum(len(p) for p in pages.values()), "pages"), pages
+
+def stage_segment(pages: Dict) -> Dict:
+    def run():
+        for _ in range(SEGMENT_REPEATS):
+            counts.append(sum(len(list(filter_paragraphs(segment_pages(report)))) for report in pages.values()))
+
+    counts = []
+    seconds = fastest(run) / SEGMENT_REPEATS
+    paragraphs = counts[-1]
+    # The single-block entry point, on the same text
+    text = "\n\n".join("\n\n".join(report) for report in pages.values())
+    legacy_seconds = fastest(lambda: get_paragraphs(text))
+    return stage_result(seconds, paragraphs, "paragraphs", get_paragraphs_mb_per_s=len(text) / 2**20 / legacy_seconds)
+
+def stage_generate(latency: float) -> Dict:
+    # The real generate_dataset.main() in the current directory; quotas are lifted so the number
+    # tracks our pipeline, not the Gemini rate limits
+    llm = FakeLLM(latency=latency, per_token_latency=LLM_PER_TOKEN_LATENCY, seed=0)
+    generate_dataset.LLM_CACHE_MODE = "off"
+    generate_dataset.REQUESTS_PER_MINUTE = 10**9
+    generate_dataset.TOKENS_PER_MINUTE = 10**12
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        generate_dataset.main(llm_fn=llm)
+    seconds = time.perf_counter() - start
+    entries = sum(1 for _ in iter_dataset(DATASET_FILE))
+    # Time the calls alone would take on MAX_CONCURRENT_REQUESTS connections
+    llm_bound = llm.calls * latency / generate_dataset.MAX_CONCURRENT_REQUESTS
+    return stage_result(seconds, entries, "entries", llm_calls=llm.calls, llm_bound_seconds=llm_bound)
+
+def stage_format() -> Dict:
+    entries = list(iter_dataset(DATASET_FILE))
+    def run():
+        for _ in range(FORMAT_REPEATS):
+            for entry in entries:
+                sample_text(convert_to_alpaca(entry))
+
+    return stage_result(fastest(run), FORMAT_REPEATS * len(entries), "samples")
+
+def stage_prepare(tokenizer_file: str) -> Dict:
+    prepare_finetune_dataset.TokenCounter = partial(TokenCounter, tokenizer_path=tokenizer_file)
+    runs = []
+    for _ in range(2):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            prepare_finetune_dataset.main()
+        runs.append(time.perf_counter() - start)
+    with open(prepare_finetune_dataset.MANIFEST_FILE, 'r') as f:
+        manifest = json.load(f)
+    samples = sum(manifest["samples"].values())
+    return stage_result(runs[0], samples, "samples", unchanged_rerun_seconds=runs[1], splits=manifest["samples"])
+
+def stage_tokenize(tokenizer) -> (Dict, object):
+    train_files = sorted(glob.glob(os.path.join(prepare_finetune_dataset.OUTPUT_DIR, "train", "*", "*.jsonl")))
+    start = time.perf_counter()
+    samples, _ = load_or_build(train_files, tokenizer, "pretokenized")
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    load_or_build(train_files, tokenizer, "pretokenized")
+    warm = time.perf_counter() - start
+    return stage_result(cold, int(samples.meta["num_tokens"]), "tokens", samples=len(samples),
+                        cached_seconds=warm), samples
+
+def stage_train(samples) -> Dict:
+    torch.manual_seed(3407)
+    model = make_tiny_model()
+    dataset = PackedDataset(samples, TRAIN_MAX_LENGTH)
+    collator = PackedCollator(pad_token_id=0)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
+    rows = [collator([dataset[i % len(dataset)]]) for i in range(TRAIN_STEPS + 1)]
+    tokens, seconds, losses = 0, 0.0, []
+    for step, batch in enumerate(rows):
+        start = time.perf_counter()
+        loss = model(**batch).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+        if step:  # The first step is warm-up
+            seconds += time.perf_counter() - start
+            tokens += int((batch["labels"] != -100).sum())
+        losses.append(loss.item())
+    return stage_result(seconds, tokens, "tokens", steps=TRAIN_STEPS, packed_rows=len(dataset),
+                        first_loss=losses[0], last_loss=losses[-1])
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(stages: Dict, baseline: Optional[Dict]):
+    # Adds baseline/ratio/regressed to each stage; returns the names of regressed stages
+    regressed = []
+    for name, stage in stages.items():
+        reference = (baseline or {}).get("stages", {}).get(name)
+        stage["max_regression"] = REGRESSION_TOLERANCE[name]
+        if not reference or not reference.get("throughput"):
+            continue
+        stage["baseline_throughput"] = reference["throughput"]
+        stage["ratio"] = stage["throughput"] / reference["throughput"]
+        stage["regressed"] = stage["ratio"] < 1 - REGRESSION_TOLERANCE[name]
+        if stage["regressed"]:
+            regressed.append(name)
+    return regressed
+
+def main():
+    # python bench_pipeline.py [--reports 3] [--paragraphs 400] [--latency 0.02]
+    #                          [--baseline bench_pipeline_baseline.json] [--save-baseline]
+    args = sys.argv[1:]
+
+    def option(flag, default):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    reports = int(option("--reports", NUM_REPORTS))
+    paragraphs = int(option("--paragraphs", PARAGRAPHS_PER_REPORT))
+    latency = float(option("--latency", LLM_LATENCY))
+    results_path = os.path.abspath(RESULTS_FILE)
+    baseline_path = os.path.abspath(option("--baseline", BASELINE_FILE))
+    cwd = os.getcwd()
+    torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+
+    stages = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            paths = make_corpus(generate_dataset.REPORTS_DIR, reports, paragraphs)
+            stages["extract"], pages = stage_extract(paths)
+            stages["segment"] = stage_segment(pages)
+            tokenizer = make_tiny_tokenizer(p for report in pages.values() for p in report)
+            tokenizer.backend_tokenizer.save("tokenizer.json")
+            stages["generate"] = stage_generate(latency)
+            stages["format"] = stage_format()
+            stages["prepare"] = stage_prepare(os.path.abspath("tokenizer.json"))
+            stages["tokenize"], samples = stage_tokenize(tokenizer)
+            stages["train_step"] = stage_train(samples)
+        finally:
+            os.chdir(cwd)
+
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path, 'r') as f:
+            baseline = json.load(f)
+    regressed = compare(stages, baseline)
+    results = {"commit": git_commit(), "created_at": datetime.now(timezone.utc).isoformat(),
+               "config": {"reports": reports, "paragraphs_per_report": paragraphs, "llm_latency_s": latency,
+                          "train_steps": TRAIN_STEPS, "train_max_length": TRAIN_MAX_LENGTH,
+                          "cpu_count": os.cpu_count(), "torch_threads": torch.get_num_threads()},
+               "stages": stages, "regressed": regressed}
+    atomic_write_json(results_path, results, indent=2)
+    if "--save-baseline" in args:
+        atomic_write_json(baseline_path, results, indent=2)
+
+    print(f"{reports} reports x {paragraphs} paragraphs, FakeLLM {latency * 1000:.0f} ms per call")
+    print(f"{'stage':<11} {'items':>8} {'unit':<10} {'seconds':>8} {'per second':>11} {'vs baseline':>12}")
+    for name, stage in stages.items():
+        versus = f"{stage['ratio']:.2f}x" if "ratio" in stage else "-"
+        if stage.get("regressed"):
+            versus += " SLOWER"
+        print(f"{name:<11} {stage['items']:>8} {stage['unit']:<10} {stage['seconds']:>8.2f} "
+              f"{stage['throughput']:>11,.1f} {versus:>12}")
+    generate = stages["generate"]
+    print(f"generate: {generate['llm_calls']} LLM calls, {generate['llm_bound_seconds']:.2f}s of that is LLM latency "
+          f"at {generate_dataset.MAX_CONCURRENT_REQUESTS} concurrent; get_paragraphs "
+          f"{stages['segment']['get_paragraphs_mb_per_s']:.1f} MB/s; pre-tokenized cache re-open "
+          f"{stages['tokenize']['cached_seconds'] * 1000:.1f} ms")
+    print(f"Results written to {RESULTS_FILE}" + (f"; baseline saved to {baseline_path}" if "--save-baseline" in args
+                                                  else "" if baseline else "; no baseline to compare against"))
+    for name in regressed:
+        print(f"FAIL {name}: {stages[name]['ratio']:.2f}x of baseline throughput "
+              f"(allowed drop {REGRESSION_TOLERANCE[name]:.0%})")
+    sys.exit(1 if regressed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import os
+import json
+import time
+import random
+import tempfile
+from pretokenize import iter_texts, load_or_build
+from tiny_model import make_tiny_tokenizer
+
+# Startup cost of getting token ids for training: json load + format + tokenize on every run
+# (what train.py used to do through datasets/SFTTrainer) vs the pre-tokenized cache, cold and warm.
+# Cached ids and cache invalidation are checked in tests/test_pretokenize.py.
+NUM_SAMPLES = 20000
+NUM_SHARDS = 8
+WORDS = ("the reserve bank revised policy repo rate inflation target liquidity credit growth banks "
+         "payment systems deposits regulation monetary committee report year percent basis points").split()
+
+def write_shards(directory: str, rng: random.Random):
+    os.makedirs(directory)
+    for shard in range(NUM_SHARDS):
+        with open(os.path.join(directory, f"report_{shard}.jsonl"), 'w', encoding='utf-8') as f:
+            for _ in range(NUM_SAMPLES // NUM_SHARDS):
+                answer = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 400)))
+                f.write(json.dumps({"instruction": "Answer the question.", "input": f"Question: {rng.choice(WORDS)}?",
+                                    "output": answer}) + "\n")
+
+def tokenize_every_run(data_files, tokenizer, cache_dir: str):
+    from datasets import load_dataset
+    from chat_format import format_chatml
+    dataset = load_dataset("json", data_files=data_files, split="train", cache_dir=cache_dir)
+    def tokenize(batch):
+        texts = [format_chatml(*row) for row in zip(batch["instruction"], batch["input"], batch["output"])]
+        return tokenizer(texts, add_special_tokens=False)
+    return dataset.map(tokenize, batched=True, num_proc=2, remove_columns=dataset.column_names)
+
+def main():
+    rng = random.Random(3407)
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = os.path.join(tmp, "train")
+        write_shards(data_dir, rng)
+        data_files = sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir))
+        tokenizer = make_tiny_tokenizer(text for _, text in zip(range(2000), iter_texts(data_files)))
+        cache_dir = os.path.join(tmp, "pretokenized")
+
+        start = time.perf_counter()
+        baseline = tokenize_every_run(data_files, tokenizer, os.path.join(tmp, "hf_cache"))
+        every_run = time.perf_counter() - start
+
+        start = time.perf_counter()
+        load_or_build(data_files, tokenizer, cache_dir)
+        cold = time.perf_counter() - start
+
+        start = time.perf_counter()
+        samples, _ = load_or_build(data_files, tokenizer, cache_dir)
+        warm = time.perf_counter() - start
+
+        print(f"{len(baseline)} samples, {samples.meta['num_tokens']} tokens")
+        print(f"Tokenize every run (datasets map): {every_run:8.3f}s")
+        print(f"Pre-tokenized cache, cold build:   {cold:8.3f}s")
+        print(f"Pre-tokenized cache, warm map:     {warm:8.3f}s ({every_run / warm:.0f}x faster startup)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import os
+import json
+import tempfile
+from push_to_hf import HashCache, LocalHub, collect_files, print_report, push
+
+# push_to_hf.py against LocalHub, a directory laid out like the Hub with each upload part throttled
+# like one connection. Times a fake GGUF and LoRA folder pushed serially and in parallel, then a repeat
+# push, an edited config, an interrupted upload resumed and identical content under a new name. What
+# each of those sends is checked in tests/test_push_to_hf.py.
+GGUF_MB = 96
+ADAPTER_MB = 16
+CHUNK_SIZE = 4 * 2**20
+PART_BANDWIDTH = 32 * 2**20  # Bytes/s per connection
+WORKERS = 8
+REPO_ID = "bench/qwen2.5-7b-rbi"
+
+def write_filler(path: str, size: int, seed: int):
+    # Deterministic filler; every MB differs so no two parts are alike
+    block = bytes((seed + i) % 251 for i in range(1 << 20))
+    with open(path, 'wb') as f:
+        for i in range(size // len(block)):
+            f.write(block[:8] + i.to_bytes(8, "big") + block[16:])
+
+def make_artifacts(root: str):
+    gguf = os.path.join(root, "qwen2.5_7b_finetuned-Q4_K_M.gguf")
+    lora_dir = os.path.join(root, "lora_model")
+    os.makedirs(lora_dir)
+    write_filler(gguf, GGUF_MB * 2**20, 1)
+    write_filler(os.path.join(lora_dir, "adapter_model.safetensors"), ADAPTER_MB * 2**20, 2)
+    for name, body in (("adapter_config.json", {"r": 16, "lora_alpha": 16}), ("tokenizer_config.json", {"eos": 1})):
+        with open(os.path.join(lora_dir, name), 'w') as f:
+            json.dump(body, f)
+    return gguf, lora_dir
+
+def run(label: str, hub, files, hashes, workers: int = WORKERS) -> dict:
+    report = push(hub, files, hashes, chunk_size=CHUNK_SIZE, workers=workers)
+    print(f"\n--- {label}")
+    print_report(report)
+    return report
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        gguf, lora_dir = make_artifacts(os.path.join(tmp, "build"))
+        files = collect_files(gguf, lora_dir)
+
+        serial = run("first push, 1 connection", LocalHub(os.path.join(tmp, "serial_hub"), REPO_ID, PART_BANDWIDTH),
+                     files, HashCache(None), workers=1)
+        hub_dir = os.path.join(tmp, "hub")
+        hashes = HashCache(os.path.join(tmp, "hashes.json"))
+        first = run(f"first push, {WORKERS} connections", LocalHub(hub_dir, REPO_ID, PART_BANDWIDTH), files, hashes)
+
+        again = run("unchanged", LocalHub(hub_dir, REPO_ID, PART_BANDWIDTH), files, HashCache(hashes.filepath))
+
+        with open(os.path.join(lora_dir, "adapter_config.json"), 'w') as f:
+            json.dump({"r": 16, "lora_alpha": 32}, f)
+        edited = run("edited adapter_config.json", LocalHub(hub_dir, REPO_ID, PART_BANDWIDTH), files, hashes)
+
+        # New GGUF content; the connection drops after 10 parts, then the push is run again
+        write_filler(gguf, GGUF_MB * 2**20, 7)
+        try:
+            push(LocalHub(hub_dir, REPO_ID, PART_BANDWIDTH, fail_after_parts=10), files, hashes,
+                 chunk_size=CHUNK_SIZE, workers=WORKERS)
+        except ConnectionError:
+            pass
+        resumed = run("resumed after interruption", LocalHub(hub_dir, REPO_ID, PART_BANDWIDTH), files, hashes)
+
+        # Same bytes under a second name (e.g. a renamed quant): stored once, nothing sent
+        copy_path = os.path.join(os.path.dirname(gguf), "qwen2.5_7b_finetuned-Q4_K_M-copy.gguf")
+        with open(gguf, 'rb') as src, open(copy_path, 'wb') as dst:
+            dst.write(src.read())
+        renamed = run("same content, new name", LocalHub(hub_dir, REPO_ID, PART_BANDWIDTH),
+                      files + [(copy_path, os.path.basename(copy_path))], hashes)
+
+    print(f"\nparallel parts: {serial['seconds']:.1f}s -> {first['seconds']:.1f}s "
+          f"({serial['seconds'] / first['seconds']:.1f}x); unchanged {again['seconds']:.2f}s, "
+          f"edited config {edited['seconds']:.2f}s, resumed {resumed['seconds']:.1f}s, renamed {renamed['seconds']:.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import rag
+from embeddings import load_embedder
+from rag import RagIndex, build_index, evaluate, print_evaluation, write_index
+from synthetic_reports import make_corpus, make_report
+
+# 1. rag.build_index() on synthetic PDFs: a full build, an unchanged corpus and one republished report.
+# 2. Query latency and recall@k at BENCH_PASSAGES passages: queries are word samples of one
+#    passage plus noise words, so the source passage is the right answer. Also reports how much
+#    of the exact top 10 the IVF probe finds.
+# BENCH_EMBED_MODEL may point at a local sentence-transformers model. Passage keys, search, prompt
+# layout, incremental builds and the IVF probe are checked in tests/test_rag.py with a stub embedder.
+BENCH_EMBED_MODEL = os.environ.get("BENCH_EMBED_MODEL", rag.EMBED_MODEL)
+BENCH_PASSAGES = int(os.environ.get("BENCH_PASSAGES", 20000))
+BENCH_QUERIES = 300
+VOCAB_SIZE = 20000
+TOPICS = 200
+NPROBE_SWEEP = (8, 16, 32, 64)
+MAX_QUERY_P95_MS = 50  # Retrieval budget per question, excluding generation
+SYLLABLES = "ba be bi bo bu da de di do du ka ke ki ko ku la le li lo lu ma me mi mo mu na ne ni no nu " \
+            "ra re ri ro ru sa se si so su ta te ti to tu va ve vi vo vu za ze zi zo zu".split()
+
+def synthetic_passages(count: int, seed: int = 0):
+    # Zipf-distributed pseudo-words: a few very common terms and a long tail, like real text.
+    # Each passage belongs to one of TOPICS topics that favours its own slice of the vocabulary,
+    # which gives the embeddings the cluster structure real reports have.
+    rng = random.Random(seed)
+    vocab = list(dict.fromkeys("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+                               for _ in range(VOCAB_SIZE * 2)))[:VOCAB_SIZE]
+    weights = [1 / (rank + 1) ** 1.1 for rank in range(len(vocab))]
+    topic_words = [rng.sample(vocab[200:], 300) for _ in range(TOPICS)]
+    passages, topical = [], []
+    for _ in range(count):
+        topic = rng.choice(topic_words)
+        length = rng.randint(60, 120)
+        own = rng.choices(topic, k=length - length // 2)
+        words = rng.choices(vocab, weights, k=length // 2) + own
+        rng.shuffle(words)
+        passages.append(" ".join(words))
+        topical.append(own)
+    # Like a question about the passage: mostly its topic words, plus a few common ones
+    queries = []
+    for passage_id in rng.sample(range(count), BENCH_QUERIES):
+        words = rng.sample(topical[passage_id], min(10, len(topical[passage_id])))
+        queries.append((" ".join(words + rng.choices(vocab, weights, k=4)), ("synthetic", passage_id)))
+    return passages, queries
+
+def time_build(embed_model: str):
+    make_corpus("Reports", num_reports=3, paragraphs_per_report=60)
+    timings = []
+    start = time.perf_counter()
+    first = build_index("Reports", embed_model)
+    timings.append((f"full build, {first['passages']} passages", time.perf_counter() - start))
+    start = time.perf_counter()
+    build_index("Reports", embed_model)
+    timings.append(("unchanged corpus", time.perf_counter() - start))
+    time.sleep(0.01)
+    make_report(os.path.join("Reports", "synthetic_report_001.pdf"), 40, seed=99)
+    start = time.perf_counter()
+    changed = build_index("Reports", embed_model)
+    timings.append((f"one republished report ({changed['extracted']} of 3 re-extracted)", time.perf_counter() - start))
+    return timings
+
+def main():
+    embedder = load_embedder(BENCH_EMBED_MODEL)
+    if embedder is None:
+        print("Set BENCH_EMBED_MODEL to a local sentence-transformers model to run the dense benchmarks.")
+        sys.exit(1)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        build_timings = time_build(BENCH_EMBED_MODEL)
+
+        passages, queries = synthetic_passages(BENCH_PASSAGES)
+        start = time.perf_counter()
+        vectors = embedder.encode(passages)
+        embed_seconds = time.perf_counter() - start
+        # Force the IVF layout so its trade-off against a flat scan is measured at this size
+        rag.IVF_MIN_PASSAGES = 0
+        start = time.perf_counter()
+        info = write_index("bench_index", [("synthetic", list(enumerate(passages)), vectors)], BENCH_EMBED_MODEL)
+        index_seconds = time.perf_counter() - start
+        size = sum(os.path.getsize(os.path.join("bench_index", f)) for f in os.listdir("bench_index"))
+        index = RagIndex("bench_index", embedder)
+        results = evaluate(index, queries)
+        # Recall/latency trade-off of the IVF probe width
+        sweep = {nprobe: evaluate(index, queries, modes=("dense",), nprobe=nprobe)["dense"]
+                 for nprobe in NPROBE_SWEEP + (info["ivf_lists"],)}
+        index.close()
+
+    print()
+    for label, seconds in build_timings:
+        print(f"build_index(), {label}: {seconds * 1000:.0f} ms")
+    print(f"\n{BENCH_PASSAGES} passages embedded with {BENCH_EMBED_MODEL} in {embed_seconds:.1f}s "
+          f"({BENCH_PASSAGES / embed_seconds:.0f} passages/s on CPU); index written in {index_seconds:.1f}s, "
+          f"{info['ivf_lists']} IVF lists, {size / 2**20:.1f} MB on disk")
+    print_evaluation(results, len(queries))
+    exact = results["dense-exact"]
+    print(f"\n{'nprobe':>6} {'of top 10':>9} {'R@10':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for nprobe, r in sweep.items():
+        print(f"{nprobe:>6} {r['ann_recall_vs_exact']:>9.3f} {r['recall']['@10']:>6.3f} "
+              f"{r['latency_ms']['p50']:>8.2f} {r['latency_ms']['p95']:>8.2f}")
+    print(f"{'exact':>6} {1:>9.3f} {exact['recall']['@10']:>6.3f} {exact['latency_ms']['p50']:>8.2f} "
+          f"{exact['latency_ms']['p95']:>8.2f}")
+    print(f"Hybrid query p95 {results['hybrid']['latency_ms']['p95']:.1f} ms "
+          f"(retrieval budget {MAX_QUERY_P95_MS} ms per question)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import time
+import tempfile
+from pdf_extract import extract_pages
+from segment import segment_pages
+from synthetic_reports import make_report
+
+# Throughput of segment.py on synthetic PDFs of growing size; per-page cost should stay flat.
+# Correctness (golden pages, no split paragraphs, header/footer removal) is in tests/test_segment.py.
+REPORT_SIZES = [100, 200, 400, 800]  # Paragraphs per synthetic report
+
+def main():
+    print(f"{'paragraphs':>10} {'pages':>6} {'seconds':>8} {'pages/s':>8} {'us/page':>8}")
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in REPORT_SIZES:
+            pdf_path = os.path.join(tmp, f"report_{size}.pdf")
+            make_report(pdf_path, size, seed=size, title="Reserve Bank of India Report 2024")
+            pages = list(extract_pages(pdf_path, workers=1, cache_dir=None))
+            start = time.perf_counter()
+            count = sum(1 for _ in segment_pages(pages))
+            elapsed = time.perf_counter() - start
+            rows.append((size, len(pages), elapsed, count))
+            print(f"{size:>10} {len(pages):>6} {elapsed:>8.4f} {len(pages) / elapsed:>8.0f} "
+                  f"{1e6 * elapsed / len(pages):>8.0f}")
+    # Linear time: cost per page should not grow with report size
+    per_page = [elapsed / pages for _, pages, elapsed, _ in rows]
+    print(f"Per-page cost, largest vs smallest report: {per_page[-1] / per_page[0]:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import os
+import time
+import json
+import random
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from compare_models import FINETUNED_MODEL, make_session, percentile, query_ollama
+from embeddings import DEFAULT_EMBED_MODEL, load_embedder
+from ollama_stub import StubModel, start_stub
+from semantic_cache import SemanticCache, start_proxy
+
+# semantic_cache.py end to end: ollama_stub.py (300 ms to first token) behind the proxy. Times a
+# miss, an exact hit and a near-duplicate hit, then replays a skewed question mix through the
+# proxy and directly. What hits and what must miss (other options, upstream errors, TTL, LRU,
+# digest changes) is checked in tests/test_semantic_cache.py.
+# BENCH_EMBED_MODEL may point at a local sentence-transformers model; "none" times exact matching.
+BENCH_EMBED_MODEL = os.environ.get("BENCH_EMBED_MODEL", DEFAULT_EMBED_MODEL)
+STUB_TTFT = 0.3
+WORKLOAD_REQUESTS = 300
+WORKLOAD_CONCURRENCY = 8
+OPTIONS = {"temperature": 0.0, "num_predict": 128}
+
+QUESTIONS = [
+    "Can a PPI issuer store customer transaction data for future use?",
+    "What is the current repo rate set by the Monetary Policy Committee?",
+    "What are the KYC requirements for opening a small account?",
+    "How much deposit insurance cover does DICGC provide per depositor?",
+    "What is the priority sector lending target for domestic commercial banks?",
+    "Can NBFCs accept demand deposits from the public?",
+    "What are the rules for digital lending apps sharing borrower data?",
+    "What is the limit for UPI Lite transactions without a PIN?",
+    "How should banks report frauds to the Reserve Bank of India?",
+    "What is the minimum capital adequacy ratio for scheduled commercial banks?",
+]
+# Same question, reworded: should be answered from the cache
+PARAPHRASES = {
+    0: "can a ppi issuer store customer transaction data for future use",
+    1: "What is the current repo rate set by the MPC?",
+    3: "How much deposit insurance cover is provided by DICGC per depositor?",
+    9: "What is the minimum capital adequacy ratio for scheduled commercial banks in India?",
+}
+# Different questions that share most words with a cached one: misses in the replay
+NEAR_MISSES = {
+    0: "Can a payment aggregator store customer card data for future use?",
+    1: "What is the current reverse repo rate set by the Monetary Policy Committee?",
+    7: "What is the limit for UPI Lite wallet balance?",
+}
+
+def ask(url: str, prompt: str, options=OPTIONS, stream: bool = True, model: str = FINETUNED_MODEL):
+    # (X-Cache header, response text, seconds)
+    start = time.perf_counter()
+    response = requests.post(f"{url}/api/generate", json={"model": model, "prompt": prompt, "stream": stream,
+                                                          "options": options}, stream=stream, timeout=30)
+    if stream:
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+        text = "".join(chunk.get("response", "") for chunk in lines)
+        done = bool(lines) and lines[-1].get("done")
+    else:
+        body = response.json()
+        text, done = body.get("response", ""), body.get("done")
+    if response.status_code != 200 or not done:
+        text = None
+    return response.headers.get("X-Cache"), text, time.perf_counter() - start
+
+def metrics(url: str):
+    return requests.get(f"{url}/cache/metrics", timeout=10).json()
+
+def run_workload(api_url: str, prompts):
+    session = make_session(WORKLOAD_CONCURRENCY)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKLOAD_CONCURRENCY) as pool:
+        results = list(pool.map(lambda p: query_ollama(session, FINETUNED_MODEL, p, OPTIONS, api_url), prompts))
+    wall = time.perf_counter() - start
+    latencies = [r["latency_s"] for r in results if not r["error"]]
+    return {"wall": wall, "errors": sum(1 for r in results if r["error"]),
+            "p50": percentile(latencies, 50), "p95": percentile(latencies, 95)}
+
+def main():
+    embedder = load_embedder(BENCH_EMBED_MODEL)
+    answers = {q: f"Answer {i}: " + " ".join(["regulated entities must comply with the directions"] * 8)
+               for i, q in enumerate(QUESTIONS)}
+    model = StubModel(STUB_TTFT, 200.0, answers=answers, digest="v1")
+    stub = start_stub({FINETUNED_MODEL: model})
+    upstream = f"http://127.0.0.1:{stub.server_address[1]}"
+    cache = SemanticCache(filepath=None, embedder=embedder)
+    proxy = start_proxy(cache, upstream, tags_refresh=0)
+    url = f"http://127.0.0.1:{proxy.server_address[1]}"
+
+    single = {"miss": ask(url, QUESTIONS[0])[2], "exact": ask(url, QUESTIONS[0])[2]}
+    for question in QUESTIONS[1:]:
+        ask(url, question)
+    if embedder is not None:
+        single["near-duplicate"] = min(ask(url, p)[2] for p in PARAPHRASES.values())
+
+    # Skewed replay: a few questions (and their rewordings) make up most of the traffic
+    rng = random.Random(0)
+    pool = QUESTIONS + list(PARAPHRASES.values()) + list(NEAR_MISSES.values())
+    weights = [1 / (rank + 1) for rank in range(len(pool))]
+    rng.shuffle(weights)
+    prompts = rng.choices(pool, weights, k=WORKLOAD_REQUESTS)
+    before = metrics(url)
+    proxied = run_workload(f"{url}/api/generate", prompts)
+    direct = run_workload(f"{upstream}/api/generate", prompts)
+    after = metrics(url)
+    hits = (after["exact"] - before["exact"]) + (after["semantic"] - before["semantic"])
+    lookups = hits + after["miss"] - before["miss"]
+    proxy.shutdown()
+    stub.shutdown()
+
+    print("Single request (ms): " + ", ".join(f"{kind} {seconds * 1000:.1f}" for kind, seconds in single.items()))
+    print(f"\n{WORKLOAD_REQUESTS} requests over {len(set(prompts))} distinct prompts, concurrency {WORKLOAD_CONCURRENCY}, "
+          f"embedding model {BENCH_EMBED_MODEL if embedder else 'none'}")
+    print(f"{'':<16} {'wall s':>7} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for label, r in (("direct", direct), ("through cache", proxied)):
+        print(f"{label:<16} {r['wall']:>7.2f} {r['p50'] * 1000:>8.1f} {r['p95'] * 1000:>8.1f} {r['errors']:>7}")
+    print(f"hit rate {hits / lookups:.1%} ({after['exact'] - before['exact']} exact, "
+          f"{after['semantic'] - before['semantic']} semantic); latency p50 by kind (ms): " +
+          ", ".join(f"{k} {v['p50'] * 1000:.1f}" for k, v in after["latency_s"].items() if v["p50"] is not None))
+
+if __name__ == "__main__":
+    main()
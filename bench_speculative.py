@@ -0,0 +1,120 @@
+import time
+import random
+import torch
+from synthetic_reports import TOPICS, WORDS
+from tiny_model import make_tiny_tokenizer
+from verify_hf_model import generate_batch
+
+# Greedy speculative decoding (verify_hf_model.py --draft) vs plain generate() on CPU.
+# Target and draft are small Qwen2 models trained for a few seconds on the same text: a word-level
+# Markov chain over the synthetic report vocabulary, so most continuations are predictable the way
+# boilerplate answer text is. Reports acceptance and speedup per batch size and lookahead, with an
+# untrained draft as the worst case. That the output is token-for-token the target's greedy output is
+# checked in tests/test_verify_hf_model.py.
+# Rows of a batch advance in lockstep, so acceptance that differs between rows costs more at larger batches.
+TARGET_SIZE = (256, 6)  # hidden size, layers
+DRAFT_SIZE = (128, 1)
+TRAIN_STEPS = 120
+BATCH_SIZES = [1, 4, 8]
+LOOKAHEADS = [2, 4, 6]
+NEW_TOKENS = 64
+PROMPTS = 8
+
+def make_corpus(rng: random.Random, paragraphs: int = 2000):
+    vocab = WORDS + TOPICS
+    successors = {word: rng.sample(vocab, 3) for word in vocab}
+    # Some words have one clear successor, others two close ones the models can disagree on
+    weights = {word: [top, (1 - top) * 0.8, (1 - top) * 0.2] for word, top in
+               ((word, rng.uniform(0.45, 0.9)) for word in vocab)}
+
+    def sentence():
+        word = rng.choice(vocab)
+        words = [word]
+        for _ in range(rng.randint(8, 20)):
+            word = rng.choices(successors[word], weights[word])[0]
+            words.append(word)
+        return " ".join(words) + "."
+
+    return [" ".join(sentence() for _ in range(rng.randint(2, 5))) for _ in range(paragraphs)]
+
+def make_model(tokenizer, size, seed: int):
+    from transformers import Qwen2Config, Qwen2ForCausalLM
+    hidden, layers = size
+    torch.manual_seed(seed)
+    config = Qwen2Config(vocab_size=len(tokenizer), hidden_size=hidden, intermediate_size=4 * hidden,
+                         num_hidden_layers=layers, num_attention_heads=hidden // 64, num_key_value_heads=hidden // 128,
+                         tie_word_embeddings=False, pad_token_id=tokenizer.pad_token_id)
+    return Qwen2ForCausalLM(config)
+
+def train(model, tokenizer, texts, steps: int = TRAIN_STEPS):
+    optimizer = torch.optim.AdamW(model.parameters(), lr=2e-3)
+    rng = random.Random(1)
+    model.train()
+    for _ in range(steps):
+        batch = tokenizer(rng.sample(texts, 16), return_tensors="pt", padding=True, truncation=True, max_length=64)
+        labels = batch["input_ids"].masked_fill(batch["attention_mask"] == 0, -100)
+        positions = (batch["attention_mask"].cumsum(-1) - 1).clamp(min=0)
+        loss = model(**batch, position_ids=positions, labels=labels).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+    return model.eval(), loss.item()
+
+def run_batches(model, tokenizer, prompts, batch_size: int, draft=None, lookahead: int = 0):
+    totals = {"responses": [], "seconds": 0.0, "target_passes": 0, "drafted": 0, "accepted": 0, "row_accepted": 0}
+    for i in range(0, len(prompts), batch_size):
+        result = generate_batch(model, tokenizer, prompts[i:i + batch_size], draft, lookahead, NEW_TOKENS)
+        totals["responses"] += result["responses"]
+        for key in ("seconds", "target_passes", "drafted", "accepted", "row_accepted"):
+            totals[key] += result.get(key, 0)
+    return totals
+
+def hf_assisted(model, draft, tokenizer, prompt: str, lookahead: int):
+    # transformers' own assisted generation (batch size 1 only), for reference
+    inputs = tokenizer([prompt], return_tensors="pt")
+    start = time.perf_counter()
+    with torch.inference_mode():
+        model.generate(**inputs, assistant_model=draft, num_assistant_tokens=lookahead,
+                                num_assistant_tokens_schedule="constant", max_new_tokens=NEW_TOKENS,
+                                do_sample=False, pad_token_id=tokenizer.pad_token_id)
+    return time.perf_counter() - start
+
+def main():
+    rng = random.Random(0)
+    texts = make_corpus(rng)
+    tokenizer = make_tiny_tokenizer(texts)
+    start = time.perf_counter()
+    target, target_loss = train(make_model(tokenizer, TARGET_SIZE, 0), tokenizer, texts)
+    draft, draft_loss = train(make_model(tokenizer, DRAFT_SIZE, 1), tokenizer, texts)
+    untrained = make_model(tokenizer, DRAFT_SIZE, 2).eval()
+    print(f"trained target {TARGET_SIZE} (loss {target_loss:.2f}) and draft {DRAFT_SIZE} (loss {draft_loss:.2f}) "
+          f"in {time.perf_counter() - start:.0f}s")
+    prompts = [text[:rng.randint(40, 120)] for text in make_corpus(random.Random(1), PROMPTS)]
+    best, acceptance = {}, {}
+
+    print(f"\n{len(prompts)} prompts in batches of 1-{max(BATCH_SIZES)}, {NEW_TOKENS} new tokens each, greedy")
+    print(f"{'batch':>5} {'draft':>9} {'k':>2} {'plain s':>8} {'spec s':>7} {'speedup':>7} "
+          f"{'accept/row':>10} {'lockstep':>8} {'target passes':>13}")
+    generate_batch(target, tokenizer, prompts[:1], max_new_tokens=4)  # Warm-up
+    for batch_size in BATCH_SIZES:
+        plain = run_batches(target, tokenizer, prompts, batch_size)
+        runs = [("trained", draft, k) for k in LOOKAHEADS] + [("untrained", untrained, LOOKAHEADS[1])]
+        for label, model, lookahead in runs:
+            result = run_batches(target, tokenizer, prompts, batch_size, model, lookahead)
+            speedup = plain["seconds"] / result["seconds"]
+            if label == "trained":
+                best[batch_size] = max(best.get(batch_size, 0.0), speedup)
+                acceptance[batch_size] = max(acceptance.get(batch_size, 0.0), result["row_accepted"] / result["drafted"])
+            print(f"{batch_size:>5} {label:>9} {lookahead:>2} {plain['seconds']:>8.2f} {result['seconds']:>7.2f} "
+                  f"{speedup:>6.2f}x {result['row_accepted'] / result['drafted']:>10.0%} "
+                  f"{result['accepted'] / result['drafted']:>8.0%} {result['target_passes']:>13}")
+
+    seconds = hf_assisted(target, draft, tokenizer, prompts[0], LOOKAHEADS[1])
+    reference = generate_batch(target, tokenizer, prompts[:1], max_new_tokens=NEW_TOKENS)
+    print(f"transformers assisted generation (batch 1, k={LOOKAHEADS[1]}): {seconds:.2f}s "
+          f"vs {reference['seconds']:.2f}s plain")
+    print(f"best trained draft at batch 1: {acceptance[1]:.0%} accepted, {best[1]:.2f}x "
+          f"(batch {BATCH_SIZES[-1]}: {acceptance[BATCH_SIZES[-1]]:.0%}, {best[BATCH_SIZES[-1]]:.2f}x)")
+
+if __name__ == "__main__":
+    main()
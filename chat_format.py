@@ -0,0 +1,17 @@
+# ChatML layout shared by training, dataset preparation and inference helpers.
+# Keep in sync with the TEMPLATE written to the Modelfile by run_ollama.sh.
+
+SYSTEM_PROMPT = "You are a helpful financial assistant trained on RBI reports."
+
+def format_chatml(instruction: str, input: str, output: str = None) -> str:
+    # Without an output the text ends at the assistant turn, ready for generation
+    text = f"<|im_start|>system\n{SYSTEM_PROMPT}<|im_end|>\n" \
+           f"<|im_start|>user\n{instruction}\n{input}<|im_end|>\n" \
+           f"<|im_start|>assistant\n"
+    if output is None:
+        return text
+    return text + f"{output}<|im_end|>"
+
+def format_chat_prompt(prompt: str, system: str = SYSTEM_PROMPT) -> str:
+    # A single user turn, as the Modelfile TEMPLATE renders an /api/generate request
+    return f"<|im_start|>system\n{system}<|im_end|>\n<|im_start|>user\n{prompt}<|im_end|>\n<|im_start|>assistant\n"
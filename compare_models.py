@@ -1,45 +1,202 @@
-import requests
+import os
+import sys
 import json
+import time
+import statistics
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from chat_format import SYSTEM_PROMPT
+from scoring import exact_match, load_eval_samples, rouge_l, validation_files
 
 # Configuration
 FINETUNED_MODEL = "qwen2.5-7b-rbi"
 BASE_MODEL = "qwen2.5:7b-instruct"
-API_URL = "http://localhost:11434/api/generate"
-
-def query_ollama(model, prompt):
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.7,
-            "top_p": 0.9
-        }
-    }
+API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+OPTIONS = {"temperature": 0.7, "top_p": 0.9}  # Interactive mode
+BATCH_OPTIONS = {"temperature": 0.0, "num_predict": 256}  # Batch mode: greedy, so scores are repeatable
+FINETUNE_DIR = "finetune_data"
+BATCH_SAMPLES = 100  # Held-out questions used when no --prompts file is given
+CONCURRENCY = 4  # Requests in flight across both models; set OLLAMA_NUM_PARALLEL on the server to match
+REQUEST_TIMEOUT = 300
+REPORT_FILE = "comparison_report.json"
+
+def make_session(pool_size: int) -> requests.Session:
+    # One keep-alive connection per concurrent request instead of a new connection per call
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def query_ollama(session: requests.Session, model: str, prompt: str, options: Dict = OPTIONS,
+                 api_url: str = API_URL, raw: bool = False, system: Optional[str] = None) -> Dict:
+    # Streams one completion; returns the answer with time to first token, total latency and
+    # decode rate (client-side, plus Ollama's own eval rate when it reports one).
+    # raw=True sends an already formatted ChatML prompt past the Modelfile template. Without
+    # system, each model uses its own default system prompt (the Modelfile's for the fine-tune).
+    payload = {"model": model, "prompt": prompt, "stream": True, "options": options}
+    if raw:
+        payload["raw"] = True
+    elif system:
+        payload["system"] = system
+    start = time.perf_counter()
+    ttft = None
+    parts, final = [], {}
     try:
-        response = requests.post(API_URL, json=payload)
-        response.raise_for_status()
-        return response.json().get("response", "")
+        with session.post(api_url, json=payload, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(chunk["error"])
+                if chunk.get("response"):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(chunk["response"])
+                if chunk.get("done"):
+                    final = chunk
     except Exception as e:
-        return f"Error: {e}"
+        return {"response": "", "error": str(e), "latency_s": time.perf_counter() - start}
+    latency = time.perf_counter() - start
+    tokens = final.get("eval_count") or len(parts)
+    decode_time = latency - ttft if ttft is not None else 0.0
+    result = {"response": "".join(parts), "error": None, "ttft_s": ttft, "latency_s": latency, "tokens": tokens,
+              "tokens_per_s": (tokens - 1) / decode_time if tokens > 1 and decode_time > 0 else None}
+    if final.get("eval_duration"):
+        result["server_tokens_per_s"] = tokens / (final["eval_duration"] / 1e9)
+    return result
 
-def main():
+def percentile(values: List[float], q: float) -> Optional[float]:
+    # Linear interpolation between closest ranks
+    if not values:
+        return None
+    values = sorted(values)
+    position = (len(values) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+def load_prompts(path: Optional[str], limit: int) -> List[Dict]:
+    # Alpaca-format records (instruction/input/output), e.g. the held-out finetune_data shards
+    if path:
+        return load_eval_samples([path], limit)
+    return load_eval_samples(validation_files(FINETUNE_DIR), limit)
+
+def user_prompt(sample: Dict) -> str:
+    # The user turn of the training template (chat_format.format_chatml)
+    return f"{sample['instruction']}\n{sample['input']}"
+
+def summarize(rows: List[Dict], model: str) -> Dict:
+    results = [row["answers"][model] for row in rows]
+    ok = [r for r in results if not r["error"]]
+    summary = {"requests": len(results), "errors": len(results) - len(ok)}
+    for key in ("ttft_s", "latency_s"):
+        values = [r[key] for r in ok if r.get(key) is not None]
+        summary[key] = {f"p{q}": percentile(values, q) for q in (50, 90, 99)}
+    rates = [r["tokens_per_s"] for r in ok if r.get("tokens_per_s")]
+    summary["tokens_per_s_median"] = statistics.median(rates) if rates else None
+    summary["rouge_l"] = statistics.fmean(r["rouge_l"] for r in results) if results else 0.0
+    summary["exact_match"] = statistics.fmean(r["exact_match"] for r in results) if results else 0.0
+    return summary
+
+def run_batch(samples: List[Dict], models: List[str], concurrency: int = CONCURRENCY, api_url: str = API_URL,
+              system: Optional[str] = None) -> Dict:
+    # Every (prompt, model) pair goes through one bounded pool, so both models are queried
+    # concurrently; requests alternate between models to keep both loaded and busy
+    session = make_session(concurrency)
+    rows = [{"question": s["input"], "reference": s["output"], "answers": {}} for s in samples]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(query_ollama, session, model, user_prompt(sample), BATCH_OPTIONS, api_url,
+                               system=system): (i, model)
+                   for i, sample in enumerate(samples) for model in models}
+        for done, future in enumerate(as_completed(futures), 1):
+            i, model = futures[future]
+            result = future.result()
+            result["rouge_l"] = rouge_l(result["response"], rows[i]["reference"])
+            result["exact_match"] = exact_match(result["response"], rows[i]["reference"])
+            rows[i]["answers"][model] = result
+            if done % 20 == 0 or done == len(futures):
+                print(f"{done}/{len(futures)} requests done")
+    wall = time.perf_counter() - start
+    session.close()
+
+    summary = {model: summarize(rows, model) for model in models}
+    if len(models) == 2:
+        a, b = models
+        summary["wins"] = {
+            a: sum(1 for row in rows if row["answers"][a]["rouge_l"] > row["answers"][b]["rouge_l"]),
+            b: sum(1 for row in rows if row["answers"][b]["rouge_l"] > row["answers"][a]["rouge_l"]),
+        }
+    return {"models": models, "api_url": api_url, "concurrency": concurrency, "options": BATCH_OPTIONS, "system": system,
+            "samples": len(samples), "wall_seconds": wall, "requests_per_s": len(samples) * len(models) / wall,
+            "summary": summary, "rows": rows}
+
+def print_report(report: Dict):
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else "-"
+    print(f"\n{report['samples']} prompts x {len(report['models'])} models in {report['wall_seconds']:.1f}s "
+          f"({report['requests_per_s']:.2f} requests/s, concurrency {report['concurrency']})")
+    print(f"{'model':<24} {'ROUGE-L':>8} {'EM':>6} {'err':>4} {'TTFT p50/p90/p99 ms':>22} "
+          f"{'latency p50/p90/p99 ms':>24} {'tok/s':>7}")
+    for model in report["models"]:
+        s = report["summary"][model]
+        ttft = "/".join(ms(s["ttft_s"][p]) for p in ("p50", "p90", "p99"))
+        latency = "/".join(ms(s["latency_s"][p]) for p in ("p50", "p90", "p99"))
+        rate = f"{s['tokens_per_s_median']:.1f}" if s["tokens_per_s_median"] else "-"
+        print(f"{model:<24} {s['rouge_l']:>8.3f} {s['exact_match']:>6.1%} {s['errors']:>4} {ttft:>22} {latency:>24} {rate:>7}")
+    if "wins" in report["summary"]:
+        print("Higher ROUGE-L per prompt: " + ", ".join(f"{m} {n}" for m, n in report["summary"]["wins"].items()))
+
+def interactive():
     print(f"=== Model Comparison: {FINETUNED_MODEL} vs {BASE_MODEL} ===\n")
-    
+    session = make_session(2)
+
     while True:
         prompt = input("\nEnter your prompt (or 'q' to quit): ")
         if prompt.lower() == 'q':
             break
-            
-        print(f"\n--- Querying {BASE_MODEL} (Base) ---")
-        base_response = query_ollama(BASE_MODEL, prompt)
-        print(base_response)
-        
-        print(f"\n--- Querying {FINETUNED_MODEL} (Fine-tuned) ---")
-        finetuned_response = query_ollama(FINETUNED_MODEL, prompt)
-        print(finetuned_response)
-        
+
+        for label, model in (("Base", BASE_MODEL), ("Fine-tuned", FINETUNED_MODEL)):
+            print(f"\n--- Querying {model} ({label}) ---")
+            result = query_ollama(session, model, prompt)
+            if result["error"]:
+                print(f"Error: {result['error']}")
+            else:
+                print(result["response"])
+                print(f"[{result['ttft_s'] or 0:.2f}s to first token, {result['latency_s']:.2f}s total]")
+
         print("\n" + "="*50)
 
+def main():
+    # python compare_models.py                      interactive, one prompt at a time
+    # python compare_models.py --batch [--prompts samples.jsonl] [--limit N] [--concurrency N]
+    #                              [--url http://host:11434/api/generate] [--report comparison_report.json]
+    #                              [--system-prompt]
+    # --system-prompt sends the training system prompt to both models instead of their own defaults
+    args = sys.argv[1:]
+    if "--batch" not in args:
+        interactive()
+        return
+
+    def option(flag, default):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    samples = load_prompts(option("--prompts", None), int(option("--limit", BATCH_SAMPLES)))
+    if not samples:
+        print("No prompts found. Run prepare_finetune_dataset.py or pass --prompts.")
+        sys.exit(1)
+    report = run_batch(samples, [BASE_MODEL, FINETUNED_MODEL], int(option("--concurrency", CONCURRENCY)),
+                       option("--url", API_URL), SYSTEM_PROMPT if "--system-prompt" in args else None)
+    report_path = option("--report", REPORT_FILE)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"Report written to {report_path}")
+
 if __name__ == "__main__":
     main()
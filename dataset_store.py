@@ -0,0 +1,311 @@
+import os
+import json
+from typing import Dict, Iterator, Optional, Tuple
+
+# Configuration
+DATASET_FILE = "dataset.jsonl"
+TRACKER_FILE = "tracker.json"
+LEGACY_DATASET_FILE = "dataset.json"
+FSYNC_EVERY = 50  # Appended records between fsyncs; checkpoints always fsync
+TRACKER_VERSION = 3
+COMPACT_DEAD_FRACTION = 0.25  # Share of the log held by superseded generations that triggers a rewrite
+
+def fsync_dir(path: str):
+    # Persist a rename; not supported on every platform, so best effort
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def atomic_write_json(path: str, data, indent=None):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+
+def iter_dataset(path: str = DATASET_FILE) -> Iterator[Dict]:
+    # Streams entries one line at a time; a torn final line from a crash is skipped
+    if not os.path.exists(path):
+        return
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping corrupt line in {path}: {line[:80]}...")
+
+class DatasetWriter:
+    # Append-only JSONL log. Records after the last committed offset were never acknowledged
+    # by a tracker checkpoint, so they are truncated on open and regenerated on resume.
+    def __init__(self, filepath: str, committed_offset=None, fsync_every: int = FSYNC_EVERY):
+        self.filepath = filepath
+        self.fsync_every = fsync_every
+        self.unsynced = 0
+        self.file = open(filepath, 'ab')
+        if committed_offset is not None and self.file.tell() > committed_offset:
+            print(f"Discarding {self.file.tell() - committed_offset} uncommitted bytes from {filepath}")
+            self.file.truncate(committed_offset)
+            self.file.seek(committed_offset)
+
+    def append(self, entry: Dict):
+        self.file.write((json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8'))
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self) -> int:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        return self.file.tell()
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+class Tracker:
+    # Compact side index: per-file progress plus the dataset offset/count it was checkpointed at.
+    # Its size depends on the number of reports, not on the number of dataset entries.
+    #
+    # Each report's entries are one contiguous byte range of the log per generation. "active"
+    # is the last completed generation, the one readers see; a changed report is regenerated
+    # into a new range at the tail and replaces "active" in the single tracker write that
+    # completes it, so readers never see a mix of old and new entries.
+    def __init__(self, filepath: str = TRACKER_FILE, dataset_file: str = DATASET_FILE):
+        self.filepath = filepath
+        self.dataset_file = dataset_file
+        self.data = self._load()
+
+    def _recover_compaction(self):
+        compact_path = f"{self.filepath}.compact"
+        if os.path.exists(compact_path):
+            print(f"Finishing interrupted compaction of {self.dataset_file}...")
+            if os.path.exists(f"{self.dataset_file}.tmp"):
+                os.replace(f"{self.dataset_file}.tmp", self.dataset_file)
+                fsync_dir(self.dataset_file)
+            os.replace(compact_path, self.filepath)
+            fsync_dir(self.filepath)
+
+    def _load(self):
+        self._recover_compaction()
+        if os.path.exists(self.filepath):
+            with open(self.filepath, 'r') as f:
+                data = json.load(f)
+            if data.get("version") == TRACKER_VERSION:
+                return data
+            if data.get("version") != 2:
+                # Legacy tracker.json: a flat {filename: status} dict
+                data = {"version": 2, "dataset_offset": None, "dataset_count": 0, "files": data}
+            return self._upgrade(data)
+        return {"version": TRACKER_VERSION, "dataset_offset": 0, "dataset_count": 0, "files": {}}
+
+    def _upgrade(self, data):
+        # Earlier trackers kept no content hashes or ranges. Content hashes are adopted on the
+        # next run (the reports are assumed unchanged); ranges come from one scan of the log.
+        # A partial report's paragraph_index may count '\n\n'-split paragraphs, which do not
+        # line up with segment.py's, so it is left at 0 and regenerated from the start.
+        ranges = scan_file_ranges(self.dataset_file, data["dataset_offset"])
+        files = {}
+        for filename, old in data["files"].items():
+            status = new_file_status()
+            status["completed"] = old["completed"]
+            if old["completed"]:
+                status["paragraph_index"] = old["paragraph_index"]
+            elif old["paragraph_index"]:
+                print(f"{filename} was partially processed by an earlier version; it will restart from paragraph 0.")
+            start, end, count = ranges.get(filename, (None, None, 0))
+            status.update(start_offset=start, end_offset=end, entries=count)
+            if old["completed"]:
+                status["active"] = active_range(status)
+            files[filename] = status
+        count = data["dataset_count"] if data["dataset_offset"] is not None else sum(r[2] for r in ranges.values())
+        return {"version": TRACKER_VERSION, "dataset_offset": data["dataset_offset"],
+                "dataset_count": count, "files": files}
+
+    def save(self):
+        atomic_write_json(self.filepath, self.data, indent=2)
+
+    @property
+    def dataset_offset(self):
+        return self.data["dataset_offset"]
+
+    @property
+    def dataset_count(self) -> int:
+        return self.data["dataset_count"]
+
+    @property
+    def live_count(self) -> int:
+        return sum(s["active"]["entries"] for s in self.data["files"].values() if s["active"])
+
+    def get_file_status(self, filename):
+        return self.data["files"].get(filename) or new_file_status()
+
+    def begin_generation(self, writer: DatasetWriter, filename, content: Dict):
+        # Starts (re)generating a report from paragraph 0 at the tail of the log; the active
+        # generation, if any, stays visible until this one completes
+        status = self.get_file_status(filename)
+        offset = writer.sync()
+        status.update(content, generation=status["generation"] + 1, paragraph_index=0, completed=False,
+                      start_offset=offset, end_offset=offset, entries=0)
+        self.data["files"][filename] = status
+        self.data["dataset_offset"] = offset
+        self.save()
+        return status
+
+    def checkpoint(self, writer: DatasetWriter, dataset_count: int, filename, paragraph_index, completed=False,
+                   entries: int = None):
+        # Data first, then the tracker that points at it: a crash in between only loses
+        # the un-checkpointed tail, which resume regenerates.
+        offset = writer.sync()
+        status = self.get_file_status(filename)
+        status.update(paragraph_index=paragraph_index, completed=completed, end_offset=offset)
+        if entries is not None:
+            status["entries"] = entries
+        if completed:
+            status["active"] = active_range(status)
+        self.data["dataset_offset"] = offset
+        self.data["dataset_count"] = dataset_count
+        self.data["files"][filename] = status
+        self.save()
+
+def new_file_status() -> Dict:
+    return {"sha256": None, "size": None, "mtime_ns": None, "generation": 0, "paragraph_index": 0,
+            "completed": False, "start_offset": None, "end_offset": None, "entries": 0, "active": None}
+
+def active_range(status: Dict) -> Dict:
+    return {key: status[key] for key in ("generation", "sha256", "start_offset", "end_offset", "entries")}
+
+def scan_file_ranges(path: str, committed_offset=None) -> Dict[str, Tuple[Optional[int], Optional[int], int]]:
+    # {filename: (start, end, count)} for logs written before ranges were tracked. A file whose
+    # entries are not contiguous gets no range and is read by a full scan instead.
+    ranges, last_file, broken = {}, None, set()
+    if not os.path.exists(path):
+        return ranges
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            start, offset = offset, offset + len(line)
+            if committed_offset is not None and offset > committed_offset:
+                break
+            try:
+                filename = json.loads(line)["file"]
+            except (json.JSONDecodeError, KeyError):
+                continue
+            if filename in ranges and filename != last_file:
+                broken.add(filename)
+            first, _, count = ranges.get(filename, (start, None, 0))
+            ranges[filename] = (first, offset, count + 1)
+            last_file = filename
+    for filename in broken:
+        ranges[filename] = (None, None, ranges[filename][2])
+    return ranges
+
+def iter_file_entries(active: Dict, filename: str, path: str = DATASET_FILE) -> Iterator[Dict]:
+    # Entries of one report's active generation: a seek and a read of its byte range
+    if active["start_offset"] is None:
+        yield from (e for e in iter_dataset(path) if e.get("file") == filename)
+        return
+    with open(path, 'rb') as f:
+        f.seek(active["start_offset"])
+        remaining = active["end_offset"] - active["start_offset"]
+        for line in f:
+            if remaining <= 0:
+                break
+            remaining -= len(line)
+            yield json.loads(line)
+
+def iter_active_dataset(tracker: Tracker, path: str = DATASET_FILE) -> Iterator[Dict]:
+    # All live entries, report by report in log order; superseded generations are skipped
+    actives = [(filename, s["active"]) for filename, s in tracker.data["files"].items() if s["active"]]
+    actives.sort(key=lambda item: (item[1]["start_offset"] is None, item[1]["start_offset"] or 0))
+    for filename, active in actives:
+        yield from iter_file_entries(active, filename, path)
+
+def compact_dataset(tracker: Tracker, path: str = DATASET_FILE, min_dead_fraction: float = COMPACT_DEAD_FRACTION):
+    # Rewrites the log without superseded generations once they make up min_dead_fraction of it.
+    # Live ranges (active and in-progress generations) are copied in order and re-pointed.
+    statuses = tracker.data["files"].values()
+    ranges = []
+    for status in statuses:
+        for holder in (status["active"], status):
+            if holder and holder["start_offset"] is not None and holder["end_offset"] is not None:
+                ranges.append((holder["start_offset"], holder["end_offset"]))
+    if any(s["active"] and s["active"]["start_offset"] is None for s in statuses) or not tracker.dataset_offset:
+        return  # Legacy ranges unknown
+    live = set(ranges)
+    live_bytes = sum(end - start for start, end in live)
+    if 1 - live_bytes / tracker.dataset_offset < min_dead_fraction:
+        return
+
+    print(f"Compacting {path}: {tracker.dataset_offset - live_bytes} of {tracker.dataset_offset} bytes superseded...")
+    moved = {}
+    tmp_path = f"{path}.tmp"
+    with open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+        for start, end in sorted(live):
+            src.seek(start)
+            moved[(start, end)] = dst.tell()
+            dst.write(src.read(end - start))
+        dst.flush()
+        os.fsync(dst.fileno())
+        offset = dst.tell()
+    for status in statuses:
+        for holder in (status["active"], status):
+            if holder and (holder["start_offset"], holder["end_offset"]) in moved:
+                new_start = moved[(holder["start_offset"], holder["end_offset"])]
+                holder["end_offset"] = new_start + holder["end_offset"] - holder["start_offset"]
+                holder["start_offset"] = new_start
+    tracker.data["dataset_offset"] = offset
+    tracker.data["dataset_count"] = tracker.live_count + sum(
+        s["entries"] for s in statuses if not s["completed"] and s["start_offset"] is not None)
+    # The new tracker is written next to the old one before either file is swapped in, so a
+    # crash at any point is rolled forward by Tracker._recover_compaction()
+    compact_path = f"{tracker.filepath}.compact"
+    atomic_write_json(compact_path, tracker.data, indent=2)
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+    os.replace(compact_path, tracker.filepath)
+    fsync_dir(tracker.filepath)
+
+def migrate_legacy(dataset_file: str = DATASET_FILE, tracker_file: str = TRACKER_FILE,
+                   legacy_dataset_file: str = LEGACY_DATASET_FILE):
+    # One-time conversion of dataset.json (a single JSON array) and the flat tracker.json.
+    # The legacy files are left in place; the JSONL log takes over once it exists.
+    if os.path.exists(dataset_file) or not os.path.exists(legacy_dataset_file):
+        return
+
+    print(f"Migrating {legacy_dataset_file} to {dataset_file}...")
+    with open(legacy_dataset_file, 'r') as f:
+        try:
+            legacy = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: {legacy_dataset_file} is corrupt. Starting with an empty dataset.")
+            legacy = []
+
+    tmp_path = f"{dataset_file}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)  # Left by a migration that crashed; DatasetWriter would append to it
+    writer = DatasetWriter(tmp_path)
+    for entry in legacy:
+        writer.append(entry)
+    offset = writer.sync()
+    writer.close()
+    os.replace(tmp_path, dataset_file)
+    fsync_dir(dataset_file)
+
+    tracker = Tracker(tracker_file, dataset_file)
+    tracker.data["dataset_offset"] = offset
+    tracker.data["dataset_count"] = len(legacy)
+    tracker.save()
+    print(f"Migrated {len(legacy)} entries.")
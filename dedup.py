@@ -0,0 +1,124 @@
+import os
+import re
+import zlib
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+
+# Configuration
+DEDUP_INDEX_FILE = os.path.join(".cache", "dedup_index.npz")
+DEDUP_THRESHOLD = 0.8  # Estimated Jaccard similarity above which two texts are near-duplicates
+NUM_PERM = 128
+NUM_BANDS = 16  # 16 bands x 8 rows: candidate pairs start appearing around ~0.7 similarity
+SHINGLE_SIZE = 5  # Words per shingle
+SEED = 1
+
+MERSENNE_PRIME = (1 << 31) - 1
+WORD_RE = re.compile(r"\w+")
+
+_rng = np.random.RandomState(SEED)
+PERM_A = _rng.randint(1, MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+PERM_B = _rng.randint(0, MERSENNE_PRIME, size=NUM_PERM).astype(np.uint64)
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) & MERSENNE_PRIME for s in shingles),
+                       dtype=np.uint64, count=len(shingles))
+
+def minhash(text: str) -> np.ndarray:
+    # (a*x + b) mod p for all permutations at once; x < 2^31 and a < 2^31 so uint64 never overflows
+    hashes = shingle_hashes(text)
+    permuted = (np.outer(hashes, PERM_A) + PERM_B) % MERSENNE_PRIME
+    return permuted.min(axis=0).astype(np.uint32)
+
+class NearDuplicateIndex:
+    # MinHash signatures bucketed by LSH bands. A query only compares against the few entries
+    # that share a band with it, so lookups stay roughly constant as the index grows.
+    def __init__(self, filepath: Optional[str] = DEDUP_INDEX_FILE, threshold: float = DEDUP_THRESHOLD,
+                 num_bands: int = NUM_BANDS):
+        self.filepath = filepath
+        self.threshold = threshold
+        self.num_bands = num_bands
+        self.rows = NUM_PERM // num_bands
+        self.keys: List[str] = []
+        self.positions = {}
+        self.signatures: List[np.ndarray] = []
+        self.buckets = {}
+        self.skipped = 0
+        if filepath and os.path.exists(filepath):
+            self._load()
+
+    def _load(self):
+        data = np.load(self.filepath)
+        for key, signature in zip(data["keys"].tolist(), data["signatures"]):
+            self._insert(key, signature)
+
+    def save(self):
+        if not self.filepath:
+            return
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        tmp_path = f"{self.filepath}.tmp.npz"
+        signatures = np.stack(self.signatures) if self.signatures else np.zeros((0, NUM_PERM), dtype=np.uint32)
+        np.savez(tmp_path, keys=np.array(self.keys, dtype=np.str_), signatures=signatures)
+        os.replace(tmp_path, self.filepath)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _bands(self, signature: np.ndarray):
+        for band in range(self.num_bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def _insert(self, key: str, signature: np.ndarray):
+        position = len(self.keys)
+        self.positions[key] = position
+        self.keys.append(key)
+        self.signatures.append(signature)
+        for band_key in self._bands(signature):
+            self.buckets.setdefault(band_key, []).append(position)
+
+    def query(self, signature: np.ndarray, exclude_key: Optional[str] = None) -> Optional[str]:
+        seen = set()
+        for band_key in self._bands(signature):
+            for position in self.buckets.get(band_key, ()):
+                if position in seen:
+                    continue
+                seen.add(position)
+                if self.keys[position] == exclude_key:
+                    continue
+                if np.mean(self.signatures[position] == signature) >= self.threshold:
+                    return self.keys[position]
+        return None
+
+    def remove_prefix(self, prefix: str) -> int:
+        # Drops every key starting with prefix (e.g. all paragraphs of a report being regenerated)
+        keep = [i for i, key in enumerate(self.keys) if not key.startswith(prefix)]
+        removed = len(self.keys) - len(keep)
+        if removed:
+            keys, signatures = self.keys, self.signatures
+            self.keys, self.signatures, self.positions, self.buckets = [], [], {}, {}
+            for i in keep:
+                self._insert(keys[i], signatures[i])
+        return removed
+
+    def check_and_add(self, key: str, text: str) -> Optional[str]:
+        # Returns the key of an existing near-duplicate, or None after indexing the text
+        signature = minhash(text)
+        duplicate_of = self.query(signature, exclude_key=key)
+        if duplicate_of is not None:
+            self.skipped += 1
+            return duplicate_of
+        if key not in self.positions:
+            self._insert(key, signature)
+        return None
+
+def skip_near_duplicates(items: Iterable[Tuple[int, List[str], str]], filename: str,
+                         index: NearDuplicateIndex) -> Iterator[Tuple[int, List[str], str]]:
+    # Pipeline stage placed before the LLM: drops (index, context, target) items whose target
+    # paragraph is a near-duplicate of one already seen in this or any earlier report.
+    for item in items:
+        if index.check_and_add(f"{filename}#{item[0]}", item[2]) is None:
+            yield item
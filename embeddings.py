@@ -0,0 +1,30 @@
+from typing import List, Optional
+import numpy as np
+
+# Sentence embeddings on CPU, shared by rag.py and semantic_cache.py
+
+# Configuration
+# Small sentence-transformers model (~22M parameters, 384 dims); a local directory works too
+DEFAULT_EMBED_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = 64
+
+class Embedder:
+    # Vectors are L2-normalised, so a dot product is the cosine similarity
+    def __init__(self, model_name: str = DEFAULT_EMBED_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+
+def load_embedder(model_name: str = DEFAULT_EMBED_MODEL) -> Optional[Embedder]:
+    # None for "none", or when sentence-transformers or the model is not available
+    if model_name == "none":
+        return None
+    try:
+        return Embedder(model_name)
+    except Exception as e:
+        print(f"Embedding model {model_name} unavailable ({e}).")
+        return None
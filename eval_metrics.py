@@ -0,0 +1,52 @@
+import torch
+from typing import Dict, List
+from transformers import TrainerCallback
+from chat_format import format_chatml
+from scoring import GEN_EVAL_SAMPLES, exact_match, load_eval_samples, rouge_l, validation_files
+
+# Configuration
+GEN_MAX_NEW_TOKENS = 256
+GEN_BATCH_SIZE = 8
+
+class GenerationEvalCallback(TrainerCallback):
+    # Greedy-decodes answers to a fixed held-out subset after each evaluation and logs
+    # eval_rouge_l / eval_exact_match next to eval_loss. The metrics are also added to the
+    # evaluation results, so either can be used as metric_for_best_model.
+    def __init__(self, tokenizer, samples: List[Dict], trainer=None):
+        self.tokenizer = tokenizer
+        self.samples = samples
+        self.trainer = trainer  # Set after the trainer is built; used to log through its reporters
+
+    @torch.no_grad()
+    def generate(self, model, prompts: List[str]) -> List[str]:
+        answers = []
+        padding_side = self.tokenizer.padding_side
+        self.tokenizer.padding_side = "left"
+        was_training = model.training
+        model.eval()
+        try:
+            for start in range(0, len(prompts), GEN_BATCH_SIZE):
+                batch = self.tokenizer(prompts[start:start + GEN_BATCH_SIZE], return_tensors="pt",
+                                       padding=True, add_special_tokens=False).to(model.device)
+                output = model.generate(**batch, max_new_tokens=GEN_MAX_NEW_TOKENS, do_sample=False,
+                                        pad_token_id=self.tokenizer.pad_token_id, use_cache=True)
+                answers += self.tokenizer.batch_decode(output[:, batch["input_ids"].shape[1]:], skip_special_tokens=True)
+        finally:
+            self.tokenizer.padding_side = padding_side
+            model.train(was_training)
+        return answers
+
+    def on_evaluate(self, args, state, control, model=None, metrics=None, **kwargs):
+        if not self.samples or model is None:
+            return
+        prompts = [format_chatml(s["instruction"], s["input"]) for s in self.samples]
+        predictions = self.generate(model, prompts)
+        references = [s["output"] for s in self.samples]
+        scores = {
+            "eval_rouge_l": sum(map(rouge_l, predictions, references)) / len(references),
+            "eval_exact_match": sum(map(exact_match, predictions, references)) / len(references),
+        }
+        if metrics is not None:
+            metrics.update(scores)
+        if self.trainer is not None:
+            self.trainer.log(scores)
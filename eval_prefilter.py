@@ -0,0 +1,72 @@
+import os
+from typing import Dict, Iterator, List, Set, Tuple
+import numpy as np
+from dataset_store import DATASET_FILE, TRACKER_FILE, Tracker, iter_active_dataset
+from generate_dataset import (REPORTS_DIR, MODEL_NAME, PROMPT_VERSION, clean_items, filter_paragraphs,
+                              window_paragraphs)
+from llm_cache import LLM_CACHE_FILE, LLMCache, cache_key
+from pdf_extract import extract_pages
+from prefilter import PREFILTER_THRESHOLD, PageLineCounter, junk_scores
+from segment import segment_pages
+
+# Precision/recall of the local pre-filter against the labels the LLM already produced.
+# A paragraph is "valid" if it has an entry in the dataset. It is "junk" if the LLM response
+# cache holds an invalid verdict for it or, without a cache, if it simply has no entry.
+THRESHOLDS = [0.3, 0.4, 0.5, 0.6, 0.7, 0.8]
+
+def iter_labelled_reports() -> Iterator[Tuple[PageLineCounter, List[str], np.ndarray]]:
+    # Yields (line counter, raw paragraph texts, labels) per completed report; 1 = junk
+    tracker = Tracker(TRACKER_FILE)
+    valid: Dict[str, Set[int]] = {}
+    for entry in iter_active_dataset(tracker, DATASET_FILE):
+        valid.setdefault(entry["file"], set()).add(entry["paragraph_index"])
+    cache = LLMCache(read_only=True) if os.path.exists(LLM_CACHE_FILE) else None
+
+    for filename, status in sorted(tracker.data["files"].items()):
+        filepath = os.path.join(REPORTS_DIR, filename)
+        if not status["active"] or not os.path.exists(filepath):
+            continue
+        texts, labels = [], []
+        line_counter = PageLineCounter()
+        # Headers/footers are learned from the whole report first, as in a finished run
+        pages = list(line_counter.observe(extract_pages(filepath)))
+        items = list(window_paragraphs(filter_paragraphs(segment_pages(pages))))
+        for (i, _, raw), (_, context, target) in zip(items, clean_items(items)):
+            if i in valid.get(filename, ()):
+                label = 0
+            elif cache is None:
+                label = 1
+            else:
+                verdict = cache.get(cache_key(MODEL_NAME, PROMPT_VERSION, context, target))
+                if verdict is None:
+                    continue  # Never judged by the LLM (skipped as duplicate, or the call failed)
+                label = 0 if verdict.get("valid") else 1
+            texts.append(raw)
+            labels.append(label)
+        yield line_counter, texts, np.array(labels)
+
+def main():
+    scores, labels = [], []
+    for line_counter, texts, file_labels in iter_labelled_reports():
+        if texts:
+            scores.append(junk_scores(texts, line_counter))
+            labels.append(file_labels)
+    if not scores:
+        print("No labelled paragraphs found. Run generate_dataset.py first.")
+        return
+    scores = np.concatenate(scores)
+    labels = np.concatenate(labels)
+    print(f"{len(labels)} labelled paragraphs, {labels.sum()} junk ({100 * labels.mean():.1f}%).")
+
+    print(f"{'threshold':>9} {'precision':>9} {'recall':>7} {'skipped':>8} {'valid lost':>10}")
+    for threshold in sorted(set(THRESHOLDS + [PREFILTER_THRESHOLD])):
+        predicted = scores >= threshold
+        true_positive = int(np.sum(predicted & (labels == 1)))
+        precision = true_positive / predicted.sum() if predicted.sum() else 1.0
+        recall = true_positive / labels.sum() if labels.sum() else 1.0
+        lost = int(np.sum(predicted & (labels == 0)))
+        marker = " *" if threshold == PREFILTER_THRESHOLD else ""
+        print(f"{threshold:>9.2f} {precision:>9.3f} {recall:>7.3f} {int(predicted.sum()):>8} {lost:>10}{marker}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+# Local stand-in for the Gemini call used by generate_dataset.py.
+# Behaves like an `llm_fn(prompt) -> str`: returns JSON text or raises.
+
+TARGET_RE = re.compile(r"Target Paragraph \(Current\):\s*(.*?)\s*Output JSON ONLY", re.S)
+BATCH_TARGETS_RE = re.compile(r"Target Paragraphs \(JSON\):\s*(.*?)\s*Output a JSON array ONLY", re.S)
+
+
+def _fraction(*parts) -> float:
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+class FakeLLM:
+    def __init__(self, latency=0.05, per_token_latency=0.0, error_rate=0.0, invalid_rate=0.1,
+                 drop_rate=0.0, seed=0):
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+        self.error_rate = error_rate
+        self.invalid_rate = invalid_rate
+        self.drop_rate = drop_rate  # Fraction of items silently left out of batched responses
+        self.seed = seed
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+
+    def __call__(self, prompt: str) -> str:
+        tokens = len(prompt) // 4 + 1
+        key = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self.lock:
+            attempt = self.attempts.get(key, 0)
+            self.attempts[key] = attempt + 1
+            self.calls += 1
+            self.prompt_tokens += tokens
+
+        time.sleep(self.latency + self.per_token_latency * tokens)
+
+        # Failures are a deterministic function of (prompt, attempt) so runs are reproducible
+        # regardless of how worker threads interleave.
+        if _fraction(self.seed, key, attempt) < self.error_rate:
+            with self.lock:
+                self.errors += 1
+            raise RuntimeError("Injected LLM error")
+
+        batch = BATCH_TARGETS_RE.search(prompt)
+        if batch:
+            items = []
+            for target in json.loads(batch.group(1)):
+                if _fraction(self.seed, key, attempt, "drop", target["paragraph_index"]) < self.drop_rate:
+                    continue
+                items.append(dict(self.make_item(target["text"]), paragraph_index=target["paragraph_index"]))
+            return json.dumps(items)
+
+        match = TARGET_RE.search(prompt)
+        target = match.group(1) if match else prompt[-500:]
+        return json.dumps(self.make_item(target))
+
+    def make_item(self, target: str) -> dict:
+        valid = _fraction(self.seed, "valid", target) >= self.invalid_rate
+        topic = " ".join(target.split()[:6])
+        return {
+            "valid": valid,
+            "question": f"What does the report say about {topic}?",
+            "answer": target
+        }
@@ -1,21 +1,57 @@
 import os
-import shutil
+import sys
 import json
+import time
+import hashlib
+import threading
 import subprocess
-from unsloth import FastLanguageModel
-from transformers import AutoTokenizer
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+from dataset_store import atomic_write_json
 
 # Configuration
 model_path = "lora_model"
 merged_model_dir = "merged_model"
-llama_cpp_dir = "llama.cpp"
-output_gguf = "qwen2.5_7b_finetuned.gguf"
-quantized_gguf = "qwen2.5_7b_finetuned-Q4_K_M.gguf"
+llama_cpp_dir = os.environ.get("LLAMA_CPP_DIR", "llama.cpp")
+output_prefix = "qwen2.5_7b_finetuned"  # <prefix>.gguf is the f16 source, <prefix>-<quant>.gguf the targets
+QUANT_TARGETS = os.environ.get("EXPORT_QUANTS", "Q4_K_M,Q5_K_M,Q8_0").split(",")
+# Types convert_hf_to_gguf.py writes straight from the merged safetensors, with no f16 copy.
+# K-quants need llama-quantize, which reads one f16 GGUF (memory-mapped, shared by all targets).
+DIRECT_TYPES = {"Q8_0": "q8_0", "F16": "f16", "BF16": "bf16"}
+MAX_EXPORT_WORKERS = 2  # Conversions/quantizations at once; each gets cpu_count // workers threads
+KEEP_F16 = False  # Delete the f16 GGUF once every K-quant has been written from it
+EXPORT_MANIFEST = "export_manifest.json"
+SOURCE_MARKER = ".export_source.json"  # Fingerprint of the LoRA adapter a merged_model was built from
+LOG_DIR = os.path.join(".cache", "export")
+
+def tree_fingerprint(path: str) -> str:
+    # (name, size, mtime) of every file: cheap enough to run on multi-GB weights at every export
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            if name == SOURCE_MARKER:
+                continue
+            stat = os.stat(os.path.join(root, name))
+            rel = os.path.relpath(os.path.join(root, name), path)
+            digest.update(f"{rel}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode('utf-8'))
+    return digest.hexdigest()
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+def merge_lora(force: bool = False):
+    # Skipped when merged_model was already built from the current adapter
+    source = tree_fingerprint(model_path)
+    marker = os.path.join(merged_model_dir, SOURCE_MARKER)
+    if not force and os.path.exists(marker):
+        with open(marker, 'r') as f:
+            if json.load(f).get("source") == source:
+                print(f"{merged_model_dir} is up to date with {model_path}, skipping merge.")
+                return
+    # Imported here so converting an existing merged model does not need unsloth or a GPU
+    from unsloth import FastLanguageModel
 
-def main():
-    print("=== Starting Robust Export Fix ===")
-    
-    # 1. Load and Merge Model
     print(f"Loading model from {model_path}...")
     model, tokenizer = FastLanguageModel.from_pretrained(
         model_name = model_path,
@@ -23,30 +59,34 @@ def main():
         dtype = None,
         load_in_4bit = True,
     )
-    
+
     print(f"Saving merged model to {merged_model_dir}...")
     model.save_pretrained_merged(merged_model_dir, tokenizer, save_method = "merged_16bit")
-    
-    # 2. FIX TOKENIZER FILES
+    fix_tokenizer_files(merged_model_dir, tokenizer)
+    atomic_write_json(marker, {"source": source})
+
+def fix_tokenizer_files(model_dir: str, tokenizer=None):
     # Unsloth/HF might save tokenizer.model which confuses llama.cpp into thinking it's SentencePiece.
     # Qwen 2.5/3 uses BPE (tokenizer.json).
-    
     print("=== Fixing Tokenizer Files ===")
-    
+
     # Delete tokenizer.model if it exists
-    tokenizer_model_path = os.path.join(merged_model_dir, "tokenizer.model")
+    tokenizer_model_path = os.path.join(model_dir, "tokenizer.model")
     if os.path.exists(tokenizer_model_path):
         print(f"Deleting {tokenizer_model_path} to force BPE mode...")
         os.remove(tokenizer_model_path)
-        
+
     # Ensure tokenizer.json exists
-    tokenizer_json_path = os.path.join(merged_model_dir, "tokenizer.json")
+    tokenizer_json_path = os.path.join(model_dir, "tokenizer.json")
     if not os.path.exists(tokenizer_json_path):
         print("WARNING: tokenizer.json not found! Saving explicitly...")
-        tokenizer.save_pretrained(merged_model_dir)
+        if tokenizer is None:
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        tokenizer.save_pretrained(model_dir)
 
     # Verify tokenizer_config.json
-    config_path = os.path.join(merged_model_dir, "tokenizer_config.json")
+    config_path = os.path.join(model_dir, "tokenizer_config.json")
     if os.path.exists(config_path):
         with open(config_path, 'r') as f:
             config = json.load(f)
@@ -58,45 +98,213 @@ def main():
             with open(config_path, 'w') as f:
                 json.dump(config, f, indent=2)
 
-    # 3. Run Conversion
-    print("=== Running GGUF Conversion ===")
-    
+def find_tools():
     convert_script = os.path.join(llama_cpp_dir, "convert_hf_to_gguf.py")
     if not os.path.exists(convert_script):
         raise FileNotFoundError(f"Could not find {convert_script}. Is llama.cpp cloned?")
-
-    convert_cmd = [
-        "python3",
-        convert_script,
-        merged_model_dir,
-        "--outfile", output_gguf,
-        "--outtype", "f16"
-    ]
-    
-    print(f"Running: {' '.join(convert_cmd)}")
-    subprocess.run(convert_cmd, check=True)
-    
-    # 4. Quantize
-    print("=== Quantizing to Q4_K_M ===")
     quantize_bin = os.path.join(llama_cpp_dir, "build", "bin", "llama-quantize")
     if not os.path.exists(quantize_bin):
          # Try default location if build/bin doesn't exist (older cmake or make)
          quantize_bin = os.path.join(llama_cpp_dir, "llama-quantize")
-    
-    if not os.path.exists(quantize_bin):
+    return convert_script, quantize_bin
+
+def target_path(quant: str, output_dir: str) -> str:
+    return os.path.join(output_dir, f"{output_prefix}-{quant}.gguf")
+
+def run_measured(name: str, cmd: List[str], poll_interval: float = 0.1) -> Dict:
+    # Runs cmd with its output in LOG_DIR/<name>.log. CPU time comes from the child's rusage
+    # (os.wait4). Its ru_maxrss would include the RSS of this (possibly torch-sized) process
+    # at fork, so peak RAM is read from /proc/<pid>/status (VmHWM) while the child runs.
+    os.makedirs(LOG_DIR, exist_ok=True)
+    log_path = os.path.join(LOG_DIR, f"{name}.log")
+    print(f"[{name}] running: {' '.join(cmd)}")
+    start = time.monotonic()
+    peak_kb = 0
+    with open(log_path, 'w') as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        while True:
+            pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+            if pid:
+                break
+            try:
+                with open(f"/proc/{proc.pid}/status", 'r') as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            peak_kb = max(peak_kb, int(line.split()[1]))
+            except (FileNotFoundError, ProcessLookupError):
+                pass
+            time.sleep(poll_interval)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    result = {"seconds": time.monotonic() - start, "cpu_seconds": usage.ru_utime + usage.ru_stime,
+              "peak_rss_mb": (peak_kb or usage.ru_maxrss) / 1024, "returncode": proc.returncode, "log": log_path}
+    if proc.returncode != 0:
+        with open(log_path, 'r', errors='replace') as f:
+            print("".join(f.readlines()[-20:]))
+        raise RuntimeError(f"[{name}] failed with exit code {proc.returncode}; see {log_path}")
+    return result
+
+class DiskMonitor:
+    # Samples the combined size of the export's output files to find the peak disk use
+    def __init__(self, paths: List[str], interval: float = 0.2):
+        self.paths = paths
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def sample(self):
+        total = sum(os.path.getsize(p) for p in self.paths if os.path.exists(p))
+        self.peak = max(self.peak, total)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.sample()
+
+def export(source_dir: str, quants: List[str], output_dir: str = ".", force: bool = False,
+           workers: int = MAX_EXPORT_WORKERS) -> Dict:
+    # Converts source_dir (merged HF safetensors) to every quant in quants. Without K-quants no
+    # f16 GGUF is written at all; otherwise every quantization starts as soon as the f16 GGUF
+    # exists and they run side by side. Targets already built from the same source are skipped.
+    convert_script, quantize_bin = find_tools()
+    source = tree_fingerprint(source_dir)
+    manifest_path = os.path.join(output_dir, EXPORT_MANIFEST)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+    todo = []
+    for quant in quants:
+        recorded = manifest.get(quant, {})
+        if not force and recorded.get("source") == source and os.path.exists(target_path(quant, output_dir)):
+            print(f"[{quant}] up to date, skipped")
+        else:
+            todo.append(quant)
+    k_quants = [q for q in todo if q not in DIRECT_TYPES]
+    # Once the f16 GGUF is needed anyway, llama-quantize derives Q8_0 from it faster than a
+    # second Python conversion pass over the safetensors
+    from_f16 = [q for q in todo if q not in DIRECT_TYPES or (k_quants and q == "Q8_0")]
+    direct = [q for q in todo if q not in from_f16]
+    if from_f16 and not os.path.exists(quantize_bin):
         raise FileNotFoundError(f"Could not find llama-quantize binary at {quantize_bin}")
 
-    quantize_cmd = [
-        quantize_bin,
-        output_gguf,
-        quantized_gguf,
-        "Q4_K_M"
-    ]
-    
-    print(f"Running: {' '.join(quantize_cmd)}")
-    subprocess.run(quantize_cmd, check=True)
-    
-    print(f"=== SUCCESS: Saved {quantized_gguf} ===")
+    f16_path = os.path.join(output_dir, f"{output_prefix}.gguf")
+    workers = max(1, min(workers, os.cpu_count() or 1))
+    threads = str(max(1, (os.cpu_count() or 1) // workers))
+    results: Dict[str, Dict] = {}
+
+    def convert(quant: str, path: str) -> Dict:
+        tmp_path = f"{path}.tmp"
+        result = run_measured(quant, [sys.executable, convert_script, source_dir, "--outfile", tmp_path,
+                                      "--outtype", DIRECT_TYPES.get(quant, "f16")])
+        os.replace(tmp_path, path)
+        return result
+
+    def quantize(quant: str) -> Dict:
+        path = target_path(quant, output_dir)
+        tmp_path = f"{path}.tmp"
+        result = run_measured(quant, [quantize_bin, f16_path, tmp_path, quant, threads])
+        os.replace(tmp_path, path)
+        return result
+
+    outputs = [target_path(q, output_dir) for q in todo] + [f16_path]
+    start = time.monotonic()
+    with DiskMonitor(outputs + [f"{p}.tmp" for p in outputs]) as disk, ThreadPoolExecutor(max_workers=workers) as pool:
+        running = {}
+        if from_f16:
+            if not force and os.path.exists(f16_path) and manifest.get("f16-source", {}).get("source") == source:
+                print("[f16-source] up to date, reused")
+                running.update((pool.submit(quantize, q), q) for q in from_f16)
+            else:
+                running[pool.submit(convert, "f16-source", f16_path)] = "f16-source"
+        running.update((pool.submit(convert, q, target_path(q, output_dir)), q) for q in direct)
+        while running:
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                quant = running.pop(future)
+                results[quant] = future.result()
+                path = f16_path if quant == "f16-source" else target_path(quant, output_dir)
+                results[quant]["size_mb"] = os.path.getsize(path) / 2**20
+                manifest[quant] = {"source": source, **results[quant]}
+                atomic_write_json(manifest_path, manifest, indent=2)
+                print(f"[{quant}] done in {results[quant]['seconds']:.1f}s")
+                if quant == "f16-source":
+                    running.update((pool.submit(quantize, q), q) for q in from_f16)
+
+    if from_f16 and not KEEP_F16 and os.path.exists(f16_path):
+        os.remove(f16_path)
+        manifest.pop("f16-source", None)
+        atomic_write_json(manifest_path, manifest, indent=2)
+    wall = time.monotonic() - start
+
+    if results:
+        print(f"{'target':<10} {'seconds':>8} {'cpu s':>8} {'peak RAM MB':>12} {'size MB':>10}")
+        for quant, r in results.items():
+            print(f"{quant:<10} {r['seconds']:>8.1f} {r['cpu_seconds']:>8.1f} {r['peak_rss_mb']:>12.0f} {r['size_mb']:>10.1f}")
+        serial = sum(r["seconds"] for r in results.values())
+        print(f"Wall time {wall:.1f}s ({serial:.1f}s if run one after another). Peak disk for GGUF files "
+              f"{disk.peak / 2**20:.1f} MB, on top of the {dir_size(source_dir) / 2**20:.1f} MB source model.")
+    return {"wall_seconds": wall, "peak_disk_bytes": disk.peak, "targets": results}
+
+def lora_target_path(adapter_dir: str, output_dir: str = ".") -> str:
+    return os.path.join(output_dir, f"{output_prefix}-lora-{os.path.basename(os.path.normpath(adapter_dir))}.gguf")
+
+def export_lora_adapter(adapter_dir: str = model_path, base_dir: Optional[str] = None, output_dir: str = ".",
+                        outtype: str = "f16") -> Dict:
+    # Converts the PEFT adapter alone (tens of MB) to a GGUF LoRA, applied at load time on top of the
+    # unmerged base: `ADAPTER <file>` in a Modelfile (FROM the base model) or `llama-server --lora`.
+    # base_dir only needs the base's config.json; without it the config is fetched from the Hub.
+    script = os.path.join(llama_cpp_dir, "convert_lora_to_gguf.py")
+    if not os.path.exists(script):
+        raise FileNotFoundError(f"Could not find {script}. Is llama.cpp cloned?")
+    output_path = lora_target_path(adapter_dir, output_dir)
+    cmd = [sys.executable, script, adapter_dir, "--outfile", output_path, "--outtype", outtype]
+    if base_dir:
+        cmd += ["--base", base_dir]
+    result = run_measured(f"lora-{os.path.basename(os.path.normpath(adapter_dir))}", cmd)
+    result.update(path=output_path, size_bytes=os.path.getsize(output_path))
+    print(f"{output_path}: {result['size_bytes'] / 2**20:.1f} MB in {result['seconds']:.1f}s")
+    return result
+
+def main():
+    # python fix_export.py [--merged DIR] [--quants Q4_K_M,Q8_0] [--force]
+    # python fix_export.py --lora-adapter [DIR] [--base DIR]     GGUF LoRA only, no merge
+    # --merged converts an existing HF model directory instead of merging lora_model first
+    args = sys.argv[1:]
+    if "--lora-adapter" in args:
+        position = args.index("--lora-adapter") + 1
+        adapter_dir = args[position] if position < len(args) and not args[position].startswith("--") else model_path
+        base_dir = args[args.index("--base") + 1] if "--base" in args else None
+        result = export_lora_adapter(adapter_dir, base_dir)
+        print(f"Serve it with a Modelfile of `FROM qwen2.5:7b-instruct` and `ADAPTER ./{os.path.basename(result['path'])}`.")
+        return
+    quants = QUANT_TARGETS
+    source_dir = None
+    if "--quants" in args:
+        quants = args[args.index("--quants") + 1].split(",")
+    if "--merged" in args:
+        source_dir = args[args.index("--merged") + 1]
+    force = "--force" in args
+
+    print("=== Starting Robust Export Fix ===")
+    if source_dir is None:
+        merge_lora(force)
+        source_dir = merged_model_dir
+    else:
+        fix_tokenizer_files(source_dir)
+
+    print("=== Running GGUF Conversion ===")
+    export(source_dir, quants, force=force)
+
+    print(f"=== SUCCESS: Saved {', '.join(target_path(q, '.') for q in quants)} ===")
 
 if __name__ == "__main__":
     main()
@@ -1,21 +1,49 @@
 import os
+import sys
 import json
 import re
 import time
-from pypdf import PdfReader
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-from typing import List, Dict, Optional
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Tuple
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold
+from dataset_store import DATASET_FILE, TRACKER_FILE, DatasetWriter, Tracker, compact_dataset, migrate_legacy
+from pdf_extract import extract_pages, file_sha256
+from pipeline import Pipeline
+from segment import segment_pages
+from llm_cache import LLMCache, cache_key
+from dedup import NearDuplicateIndex, skip_near_duplicates
+from prefilter import PageLineCounter, PreFilter
 
 # Configuration
 REPORTS_DIR = "Reports"
-TRACKER_FILE = "tracker.json"
-DATASET_FILE = "dataset.json"
 # User needs to set GEMINI_API_KEY in environment variables
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 MODEL_NAME = "gemini-2.0-flash" # Cheaper and fast
 CONTEXT_WINDOW_SIZE = 3
+CHECKPOINT_EVERY = 5  # Paragraphs between tracker checkpoints
+PROMPT_VERSION = "1"  # Bump whenever build_prompt/build_batch_prompt change so cached responses are not reused
+# LLM response cache: "readwrite" (default), "replay" (offline, cache only) or "off"
+LLM_CACHE_MODE = os.environ.get("LLM_CACHE_MODE", "readwrite")
+SKIP_NEAR_DUPLICATES = True  # Skip paragraphs that near-duplicate one seen in any report (see dedup.py)
+USE_PREFILTER = True  # Drop obvious junk (TOCs, indexes, disclaimers) locally before the LLM (see prefilter.py)
+
+# Concurrency and rate limiting for the LLM stage
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_MINUTE = 1000
+TOKENS_PER_MINUTE = 1_000_000
+RESPONSE_TOKEN_ESTIMATE = 256  # Output tokens also count against the TPM quota
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Batched prompting: number of consecutive target paragraphs per LLM call (1 = one call per paragraph)
+BATCH_SIZE = 8
+BATCH_REQUEUE_ATTEMPTS = 2  # Batch retries for missing/invalid items before falling back to single calls
 
 if not GEMINI_API_KEY:
     print("WARNING: GEMINI_API_KEY environment variable not set. Please set it before running.")
@@ -24,43 +52,113 @@ if not GEMINI_API_KEY:
 if GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
 
-class Tracker:
-    def __init__(self, filepath):
-        self.filepath = filepath
-        self.data = self._load()
+class RateLimiter:
+    # Token buckets for requests/minute and tokens/minute, shared by all worker threads
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.request_allowance = float(requests_per_minute)
+        self.token_allowance = float(tokens_per_minute)
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
 
-    def _load(self):
-        if os.path.exists(self.filepath):
-            with open(self.filepath, 'r') as f:
-                return json.load(f)
-        return {}
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.request_allowance = min(self.requests_per_minute,
+                                     self.request_allowance + elapsed * self.requests_per_minute / 60)
+        self.token_allowance = min(self.tokens_per_minute,
+                                   self.token_allowance + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int):
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.request_allowance >= 1 and self.token_allowance >= tokens:
+                    self.request_allowance -= 1
+                    self.token_allowance -= tokens
+                    return
+                wait = max((1 - self.request_allowance) * 60 / self.requests_per_minute,
+                           (tokens - self.token_allowance) * 60 / self.tokens_per_minute)
+            time.sleep(wait)
+
+class LLMStats:
+    # Aggregates cost of the LLM stage and what per-paragraph prompting would have cost
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.call_seconds = 0.0
+        self.paragraphs = 0
+        self.single_prompt_tokens = 0
 
-    def save(self):
-        with open(self.filepath, 'w') as f:
-            json.dump(self.data, f, indent=2)
+    def record_call(self, prompt_tokens: int, seconds: float):
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.call_seconds += seconds
 
-    def get_file_status(self, filename):
-        return self.data.get(filename, {"paragraph_index": 0, "completed": False})
+    def record_paragraphs(self, count: int, single_prompt_tokens: int):
+        with self.lock:
+            self.paragraphs += count
+            self.single_prompt_tokens += single_prompt_tokens
 
-    def update_file_status(self, filename, paragraph_index, completed=False):
-        self.data[filename] = {"paragraph_index": paragraph_index, "completed": completed}
-        self.save()
+    def report(self):
+        if not self.paragraphs:
+            return
+        saved = self.single_prompt_tokens - self.prompt_tokens
+        pct = 100 * saved / self.single_prompt_tokens if self.single_prompt_tokens else 0
+        avg_latency = self.call_seconds / self.calls if self.calls else 0
+        print(f"LLM stage: {self.paragraphs} paragraphs in {self.calls} calls "
+              f"(per-paragraph mode: {self.paragraphs} calls).")
+        print(f"Prompt tokens: {self.prompt_tokens} vs ~{self.single_prompt_tokens} per-paragraph "
+              f"({saved} saved, {pct:.1f}%). Avg call latency {avg_latency:.2f}s, "
+              f"{self.call_seconds / self.paragraphs:.2f}s of call time per paragraph.")
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic (~4 characters per token), good enough for quota accounting
+    return len(text) // 4 + 1
+
+def backoff_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
 
 def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-def get_paragraphs(text: str) -> List[str]:
-    # Split by double newlines which usually indicate paragraph breaks in extracted text
-    paras = [p.strip() for p in text.split('\n\n') if p.strip()]
+def keep_paragraph(para: str) -> bool:
     # Filter very short paragraphs
-    return [p for p in paras if len(p.split()) > 10]
+    return len(para.split()) > 10
 
-def call_llm(context_paras: List[str], target_para: str) -> Optional[Dict]:
-    if not GEMINI_API_KEY:
-        return None
+def get_paragraphs(text: str) -> List[str]:
+    # Single block of text; reports go through segment_pages page by page
+    return [p for p in segment_pages([text]) if keep_paragraph(p)]
+
+# Streaming stages for pipeline.Pipeline: each takes an iterator and yields downstream items
+
+def filter_paragraphs(paras: Iterable[str]) -> Iterator[str]:
+    for para in paras:
+        if keep_paragraph(para):
+            yield para
+
+def window_paragraphs(paras: Iterable[str], start_index: int = 0) -> Iterator[Tuple[int, List[str], str]]:
+    # (index, previous 2 paragraphs, paragraph); indices before start_index only feed the context
+    context = deque(maxlen=2)
+    for i, para in enumerate(paras):
+        if i >= start_index:
+            yield i, list(context), para
+        context.append(para)
+
+def clean_items(items: Iterable[Tuple[int, List[str], str]]) -> Iterator[Tuple[int, List[str], str]]:
+    # Whitespace is normalised only right before prompting; earlier stages need the raw line layout
+    for i, context, para in items:
+        yield i, [clean_text(c) for c in context], clean_text(para)
 
-    prompt = f"""
+def build_prompt(context_paras: List[str], target_para: str) -> str:
+    return f"""
     You are an expert at creating datasets for Supervised Fine-Tuning (SFT) from financial reports.
     
     Task:
@@ -89,87 +187,304 @@ def call_llm(context_paras: List[str], target_para: str) -> Optional[Dict]:
         "answer": "The enhanced answer"
     }}
     """
+
+def build_batch_prompt(context_paras: List[str], targets: List[Tuple[int, str]]) -> str:
+    target_json = json.dumps([{"paragraph_index": i, "text": t} for i, t in targets], indent=2)
+    return f"""
+    You are an expert at creating datasets for Supervised Fine-Tuning (SFT) from financial reports.
     
-    try:
-        model = genai.GenerativeModel(MODEL_NAME)
-        response = model.generate_content(
-            prompt,
-            generation_config={"response_mime_type": "application/json"}
-        )
-        
-        result_text = response.text
+    Task:
+    For EACH entry in 'Target Paragraphs' (consecutive paragraphs of the same report):
+    1. Determine if it contains valuable knowledge suitable for a Q&A dataset. Mark it invalid if it is:
+       - A table of contents, index, or list of figures.
+       - A legal disclaimer or copyright notice.
+       - A header, footer, or page number artifact.
+       - Too fragmented or lacks semantic meaning.
+    2. If valid:
+       - Generate a specific Question that the paragraph answers.
+       - The Answer should be the paragraph text.
+       - However, if the paragraph relies on the 'Context Paragraphs' or on earlier Target Paragraphs to be fully understood (e.g., it starts with "It also..."), ENHANCE the Answer by incorporating necessary details from them.
+       - The Answer must be self-contained.
+    
+    Context Paragraphs (Previous):
+    {json.dumps(context_paras)}
+    
+    Target Paragraphs (JSON):
+    {target_json}
+    
+    Output a JSON array ONLY, with exactly one object per target paragraph, in this format:
+    [
+        {{
+            "paragraph_index": <paragraph_index of the target>,
+            "valid": true/false,
+            "question": "The generated question",
+            "answer": "The enhanced answer"
+        }}
+    ]
+    """
+
+def gemini_generate(prompt: str) -> str:
+    model = genai.GenerativeModel(MODEL_NAME)
+    response = model.generate_content(
+        prompt,
+        generation_config={"response_mime_type": "application/json"}
+    )
+    return response.text
+
+def request_with_retries(llm_fn: Callable[[str], str], prompt: str,
+                         limiter: Optional[RateLimiter] = None,
+                         stats: Optional[LLMStats] = None) -> Optional[str]:
+    prompt_tokens = estimate_tokens(prompt)
+    for attempt in range(MAX_RETRIES):
+        if limiter:
+            limiter.acquire(prompt_tokens + RESPONSE_TOKEN_ESTIMATE)
+        start = time.monotonic()
         try:
-            result = json.loads(result_text)
-            if isinstance(result, list):
-                if len(result) > 0 and isinstance(result[0], dict):
-                    return result[0]
-                else:
-                    return None
-            return result
-        except json.JSONDecodeError as e:
-            print(f"JSON Decode Error: {e} | Text: {result_text[:100]}...")
+            result_text = llm_fn(prompt)
+            if stats:
+                stats.record_call(prompt_tokens, time.monotonic() - start)
+            return result_text
+        except Exception as e:
+            if stats:
+                stats.record_call(prompt_tokens, time.monotonic() - start)
+            if attempt == MAX_RETRIES - 1:
+                print(f"Error calling LLM (giving up after {MAX_RETRIES} attempts): {e}")
+                return None
+            delay = backoff_delay(attempt)
+            print(f"Error calling LLM: {e}. Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+    return None
+
+def call_llm(context_paras: List[str], target_para: str,
+             llm_fn: Optional[Callable[[str], str]] = None,
+             limiter: Optional[RateLimiter] = None,
+             stats: Optional[LLMStats] = None) -> Optional[Dict]:
+    if llm_fn is None:
+        if not GEMINI_API_KEY:
             return None
-            
-    except Exception as e:
-        print(f"Error calling Gemini: {e}")
-        time.sleep(1) 
+        llm_fn = gemini_generate
+
+    prompt = build_prompt(context_paras, target_para)
+    result_text = request_with_retries(llm_fn, prompt, limiter, stats)
+    if result_text is None:
         return None
 
-def main():
-    if not GEMINI_API_KEY:
+    try:
+        result = json.loads(result_text)
+        if isinstance(result, list):
+            if len(result) > 0 and isinstance(result[0], dict):
+                return result[0]
+            else:
+                return None
+        return result
+    except json.JSONDecodeError as e:
+        print(f"JSON Decode Error: {e} | Text: {result_text[:100]}...")
+        return None
+
+def validate_item(item) -> bool:
+    if not isinstance(item, dict) or not isinstance(item.get("valid"), bool):
+        return False
+    if not item["valid"]:
+        return True
+    return all(isinstance(item.get(k), str) and item[k].strip() for k in ("question", "answer"))
+
+def parse_batch_response(result_text: str, indices: List[int]) -> Dict[int, Dict]:
+    # Returns only the items that validate and map to a requested paragraph_index.
+    # Anything missing, duplicated or malformed is left out so the caller can re-queue it.
+    try:
+        result = json.loads(result_text)
+    except json.JSONDecodeError as e:
+        print(f"JSON Decode Error: {e} | Text: {result_text[:100]}...")
+        return {}
+    if isinstance(result, dict):
+        result = result.get("items", [result])
+    if not isinstance(result, list):
+        return {}
+
+    # Models occasionally drop the index field; fall back to positional alignment only when
+    # the response has exactly one un-indexed object per target.
+    if len(result) == len(indices) and all(isinstance(r, dict) and "paragraph_index" not in r for r in result):
+        result = [dict(r, paragraph_index=i) for r, i in zip(result, indices)]
+
+    wanted = set(indices)
+    parsed = {}
+    for item in result:
+        if not isinstance(item, dict):
+            continue
+        index = item.get("paragraph_index")
+        if isinstance(index, str) and index.isdigit():
+            index = int(index)
+        if index not in wanted or index in parsed or not validate_item(item):
+            continue
+        parsed[index] = item
+    return parsed
+
+def call_llm_batch(context_paras: List[str], targets: List[Tuple[int, str]],
+                   llm_fn: Optional[Callable[[str], str]] = None,
+                   limiter: Optional[RateLimiter] = None,
+                   stats: Optional[LLMStats] = None) -> Dict[int, Dict]:
+    if llm_fn is None:
+        if not GEMINI_API_KEY:
+            return {}
+        llm_fn = gemini_generate
+
+    prompt = build_batch_prompt(context_paras, targets)
+    result_text = request_with_retries(llm_fn, prompt, limiter, stats)
+    if result_text is None:
+        return {}
+    return parse_batch_response(result_text, [i for i, _ in targets])
+
+def process_window(window: List[Tuple[int, List[str], str]],
+                   llm_fn: Optional[Callable[[str], str]] = None,
+                   limiter: Optional[RateLimiter] = None,
+                   stats: Optional[LLMStats] = None,
+                   cache: Optional[LLMCache] = None) -> List[Tuple[int, Optional[Dict]]]:
+    # window holds consecutive (index, context, target) items; only failed indices are re-sent
+    results = {}
+    remaining = window
+    if cache:
+        keys = {i: cache_key(MODEL_NAME, PROMPT_VERSION, c, t) for i, c, t in window}
+        for index, _, _ in window:
+            cached = cache.get(keys[index])
+            if cached is not None:
+                results[index] = cached
+        remaining = [item for item in window if item[0] not in results]
+        if cache.read_only:
+            return [(index, results.get(index)) for index, _, _ in window]
+
+    if stats:
+        stats.record_paragraphs(len(remaining), sum(estimate_tokens(build_prompt(c, t)) for _, c, t in remaining))
+
+    for _ in range(BATCH_REQUEUE_ATTEMPTS):
+        if len(remaining) <= 1:
+            break
+        results.update(call_llm_batch(remaining[0][1], [(i, t) for i, _, t in remaining],
+                                      llm_fn, limiter, stats))
+        remaining = [item for item in remaining if item[0] not in results]
+
+    for index, context, target in remaining:
+        results[index] = call_llm(context, target, llm_fn, limiter, stats)
+
+    if cache:
+        for index, _, _ in window:
+            if results.get(index) is not None and validate_item(results[index]):
+                cache.put(keys[index], results[index])
+    return [(index, results.get(index)) for index, _, _ in window]
+
+def generate_ordered(items: Iterable[Tuple[int, List[str], str]],
+                     llm_fn: Optional[Callable[[str], str]] = None,
+                     limiter: Optional[RateLimiter] = None,
+                     stats: Optional[LLMStats] = None,
+                     cache: Optional[LLMCache] = None,
+                     batch_size: int = BATCH_SIZE,
+                     max_workers: int = MAX_CONCURRENT_REQUESTS) -> Iterator[Tuple[int, Optional[Dict]]]:
+    # Groups (index, context, target) items into windows of batch_size, runs them on a bounded
+    # thread pool and yields (index, result) strictly in input order so checkpoints stay contiguous.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        window = []
+        for item in items:
+            window.append(item)
+            if len(window) < batch_size:
+                continue
+            pending.append(executor.submit(process_window, window, llm_fn, limiter, stats, cache))
+            window = []
+            # Keep a little more than max_workers queued so workers never idle on a slow head window
+            if len(pending) >= 2 * max_workers:
+                yield from pending.popleft().result()
+        if window:
+            pending.append(executor.submit(process_window, window, llm_fn, limiter, stats, cache))
+        while pending:
+            yield from pending.popleft().result()
+
+def report_content(status: Dict, filepath: str) -> Dict:
+    # Content hash of a report, re-read only when its size or mtime changed since it was recorded
+    stat = os.stat(filepath)
+    if status["sha256"] and status["size"] == stat.st_size and status["mtime_ns"] == stat.st_mtime_ns:
+        return {"sha256": status["sha256"], "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    return {"sha256": file_sha256(filepath), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def main(llm_fn: Optional[Callable[[str], str]] = None):
+    # llm_fn lets the pipeline run against a local stand-in (see fake_llm.FakeLLM)
+    replay = LLM_CACHE_MODE == "replay"
+    if llm_fn is None and not GEMINI_API_KEY and not replay:
         print("Error: GEMINI_API_KEY not found. Exiting.")
-        return
+        return False
+    cache = LLMCache(read_only=replay) if LLM_CACHE_MODE != "off" else None
 
+    migrate_legacy()
     tracker = Tracker(TRACKER_FILE)
-    
-    dataset = []
-    if os.path.exists(DATASET_FILE):
-        with open(DATASET_FILE, 'r') as f:
-            try:
-                dataset = json.load(f)
-            except json.JSONDecodeError:
-                dataset = []
+    compact_dataset(tracker)
+    writer = DatasetWriter(DATASET_FILE, committed_offset=tracker.dataset_offset)
+    dataset_count = tracker.dataset_count
+    limiter = RateLimiter(REQUESTS_PER_MINUTE, TOKENS_PER_MINUTE)
+    stats = LLMStats()
+    dedup_index = NearDuplicateIndex() if SKIP_NEAR_DUPLICATES else None
+    prefilter = PreFilter()
 
     files = sorted([f for f in os.listdir(REPORTS_DIR) if f.endswith('.pdf')])
+    failed = False
     
     print(f"Found {len(files)} reports.")
+    missing = sorted(set(tracker.data["files"]) - set(files))
+    if missing:
+        print(f"{len(missing)} tracked reports are no longer in {REPORTS_DIR}/; their entries are kept.")
     
     for filename in files:
+        filepath = os.path.join(REPORTS_DIR, filename)
         status = tracker.get_file_status(filename)
+        content = report_content(status, filepath)
+        if status["sha256"] is None and (status["completed"] or status["paragraph_index"]):
+            # Tracked before content hashes were recorded: adopt the file as it is now
+            status.update(content)
+            if status["active"]:
+                status["active"]["sha256"] = content["sha256"]
+            tracker.save()
+        elif status["sha256"] != content["sha256"]:
+            if status["active"] or status["paragraph_index"]:
+                print(f"{filename} changed on disk; regenerating its entries.")
+            status = tracker.begin_generation(writer, filename, content)
+            if dedup_index is not None:
+                dedup_index.remove_prefix(f"{filename}#")
+        elif (status["size"], status["mtime_ns"]) != (content["size"], content["mtime_ns"]):
+            status.update(content)  # Touched but identical
+            tracker.save()
+
         if status['completed']:
             print(f"Skipping {filename} (Completed)")
             continue
+        if status["end_offset"] != tracker.dataset_offset:
+            # Another report was appended after this partial run, so its range cannot be extended
+            print(f"Restarting {filename}: its partial entries are no longer at the end of {DATASET_FILE}.")
+            status = tracker.begin_generation(writer, filename, content)
+            if dedup_index is not None:
+                dedup_index.remove_prefix(f"{filename}#")
             
         print(f"Processing {filename}...")
-        filepath = os.path.join(REPORTS_DIR, filename)
         
         try:
-            reader = PdfReader(filepath)
-            full_text = ""
-            print("Extracting text from all pages...")
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    full_text += text + "\n\n"
-            
-            all_paras = get_paragraphs(full_text)
-            total_paras = len(all_paras)
             start_index = status['paragraph_index']
+            file_entries = status['entries']
+            print(f"Resuming from paragraph index {start_index}.")
+
+            # Running headers/footers are learned per report
+            line_counter = PageLineCounter()
+            pipeline = (Pipeline()
+                        .source("extract", extract_pages(filepath, content_hash=content["sha256"]))
+                        .stage("segment", lambda pages: segment_pages(line_counter.observe(pages)))
+                        .stage("filter", filter_paragraphs)
+                        .stage("window", lambda paras: window_paragraphs(paras, start_index)))
+            if USE_PREFILTER:
+                prefilter.line_counter = line_counter
+                pipeline.stage("prefilter", prefilter.filter_items)
+            if dedup_index is not None:
+                pipeline.stage("dedup", lambda items: skip_near_duplicates(items, filename, dedup_index))
+            pipeline.stage("generate", lambda items: generate_ordered(
+                clean_items(items), llm_fn=llm_fn, limiter=limiter, stats=stats, cache=cache))
             
-            print(f"Total paragraphs: {total_paras}. Resuming from index {start_index}.")
-            
-            # Sliding window buffer needs to be reconstructed or just start empty/with what we have?
-            # Ideally we should look at previous paragraphs from the full list for context
-            
-            for i in range(start_index, total_paras):
-                target_para = all_paras[i]
-                
-                # Get context from previous 2 paragraphs in the full list
-                context_start = max(0, i - 2)
-                context = all_paras[context_start:i]
-                
-                result = call_llm(context, target_para)
-                
+            paragraph_count = start_index
+            last_checkpoint = start_index
+            for i, result in pipeline.run():
                 if result and result.get('valid'):
                     entry = {
                         "file": filename,
@@ -177,24 +492,50 @@ def main():
                         "question": result['question'],
                         "answer": result['answer']
                     }
-                    dataset.append(entry)
+                    writer.append(entry)
+                    dataset_count += 1
+                    file_entries += 1
+                paragraph_count = i + 1
                 
-                # Save progress periodically (e.g., every 5 paragraphs)
-                if i % 5 == 0:
-                    tracker.update_file_status(filename, i + 1)
-                    with open(DATASET_FILE, 'w') as f:
-                        json.dump(dataset, f, indent=2)
-                    print(f"Processed {filename} Para {i + 1}/{total_paras}. Dataset size: {len(dataset)}")
+                # Checkpoint progress periodically (e.g., every 5 paragraphs); skipped duplicates
+                # leave gaps in the indices, so count from the last checkpoint
+                if paragraph_count - last_checkpoint >= CHECKPOINT_EVERY:
+                    tracker.checkpoint(writer, dataset_count, filename, paragraph_count, entries=file_entries)
+                    last_checkpoint = paragraph_count
+                    print(f"Processed {filename} Para {paragraph_count}. Dataset size: {dataset_count}")
             
-            tracker.update_file_status(filename, total_paras, completed=True)
-            # Final save
-            with open(DATASET_FILE, 'w') as f:
-                json.dump(dataset, f, indent=2)
+            # Atomically replaces any earlier generation of this report
+            tracker.checkpoint(writer, dataset_count, filename, paragraph_count, completed=True, entries=file_entries)
+            if dedup_index is not None:
+                dedup_index.save()
+            pipeline.report()
             print(f"Finished {filename}")
             
         except Exception as e:
             print(f"Error processing {filename}: {e}")
+            failed = True
             break
 
+    writer.close()
+    print(f"Dataset: {tracker.live_count} live entries ({dataset_count} records in {DATASET_FILE}).")
+    stats.report()
+    # Each skipped paragraph would have cost its share of a (possibly batched) call
+    calls_per_paragraph = stats.calls / stats.paragraphs if stats.paragraphs else 1 / BATCH_SIZE
+    seconds_per_paragraph = stats.call_seconds / stats.paragraphs if stats.paragraphs else 0
+    if USE_PREFILTER:
+        print(f"Pre-filter skipped {prefilter.skipped}/{prefilter.seen} paragraphs "
+              f"(~{prefilter.skipped * calls_per_paragraph:.0f} LLM calls and "
+              f"~{prefilter.skipped * seconds_per_paragraph:.0f}s of call time avoided).")
+    if dedup_index is not None:
+        dedup_index.save()
+        print(f"Near-duplicate filter skipped {dedup_index.skipped} paragraphs "
+              f"(~{dedup_index.skipped * calls_per_paragraph:.0f} LLM calls saved). "
+              f"Index size: {len(dedup_index)}.")
+    if cache:
+        cache.report()
+        cache.close()
+    return not failed
+
 if __name__ == "__main__":
-    main()
+    # Non-zero on failure, so orchestrate.py does not record the stage as up to date
+    sys.exit(0 if main() else 1)
@@ -0,0 +1,99 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+# Configuration
+LLM_CACHE_FILE = os.path.join(".cache", "llm_responses.sqlite")
+LLM_CACHE_MAX_BYTES = 512 * 1024 * 1024
+EVICT_TO_FRACTION = 0.9  # After eviction the cache is trimmed to this fraction of the limit
+
+def cache_key(model_name: str, prompt_version: str, context_paras: List[str], target_para: str) -> str:
+    payload = json.dumps([model_name, prompt_version, context_paras, target_para], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class LLMCache:
+    # Persistent content-addressed store of parsed LLM responses with size-based LRU eviction.
+    # In read-only (replay) mode misses are reported but nothing is ever written, which lets a
+    # dataset be regenerated offline and deterministically from a previous run.
+    def __init__(self, filepath: str = LLM_CACHE_FILE, max_bytes: int = LLM_CACHE_MAX_BYTES,
+                 read_only: bool = False):
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if read_only:
+            if not os.path.exists(filepath):
+                raise FileNotFoundError(f"Replay mode needs an existing LLM cache at {filepath}")
+            self.conn = sqlite3.connect(f"file:{filepath}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+            self.conn = sqlite3.connect(filepath, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:
+                self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+            return json.loads(row[0])
+
+    def put(self, key: str, value: Dict):
+        if self.read_only:
+            return
+        encoded = json.dumps(value, ensure_ascii=False)
+        size = len(encoded.encode('utf-8'))
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute("INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                              (key, encoded, size, time.time()))
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        target = self.max_bytes * EVICT_TO_FRACTION
+        rows = self.conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC")
+        victims = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            victims.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def report(self):
+        lookups = self.hits + self.misses
+        rate = 100 * self.hits / lookups if lookups else 0
+        mode = "replay" if self.read_only else "read/write"
+        print(f"LLM cache ({mode}): {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+              f"{self.evictions} evicted, {self.total_bytes / 1e6:.1f} MB stored.")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
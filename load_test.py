@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import shlex
+import random
+import threading
+import subprocess
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from compare_models import FINETUNED_MODEL, make_session, percentile, query_ollama
+from scoring import load_eval_samples, validation_files
+
+# Configuration
+API_URL = os.environ.get("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+MODEL = FINETUNED_MODEL
+MODE = "closed"  # "closed": CONCURRENCY users back to back; "open": Poisson arrivals at RATE requests/s
+CONCURRENCY = 4
+RATE = 2.0
+DURATION = 60.0  # Seconds of load per run
+WINDOW = 10.0  # Seconds per row of the over-time table
+MAX_IN_FLIGHT = 256  # Open loop: requests beyond this are counted as errors instead of sent
+# Prompt-length mix: class -> (share of requests, words of report context before the question)
+PROMPT_MIX = {"short": (0.6, 0), "medium": (0.3, 400), "long": (0.1, 1500)}
+LOAD_OPTIONS = {"temperature": 0.0, "num_predict": 128}
+# Latency SLO used to pick the best sweep point
+SLO_P95_LATENCY_S = 10.0
+SLO_P95_TTFT_S = 2.0
+SLO_MAX_ERROR_RATE = 0.01
+SERVER_START_TIMEOUT = 60
+REPORT_FILE = "load_test_report.json"
+FILLER = ("the reserve bank reviewed the framework for regulated entities and issued guidelines during the "
+          "year to strengthen supervision capital adequacy credit growth and liquidity management").split()
+
+def load_questions(limit: int = 200) -> List[str]:
+    samples = load_eval_samples(validation_files("finetune_data"), limit)
+    return [f"{s['instruction']}\n{s['input']}" for s in samples] or [
+        "Answer the question based on the provided context from the financial report.\n"
+        "Question: What was the policy repo rate at the end of the year?"]
+
+class PromptMix:
+    def __init__(self, mix: Dict[str, tuple], questions: List[str], seed: int = 3407):
+        self.names = list(mix)
+        self.weights = [mix[name][0] for name in self.names]
+        self.words = {name: mix[name][1] for name in self.names}
+        self.questions = questions
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self) -> tuple:
+        # (class name, prompt): the question, preceded by filler context of the class's length
+        with self.lock:
+            name = self.rng.choices(self.names, self.weights)[0]
+            question = self.rng.choice(self.questions)
+            offset = self.rng.randrange(len(FILLER))
+        words = self.words[name]
+        context = " ".join(FILLER[(offset + i) % len(FILLER)] for i in range(words))
+        return name, f"Context: {context}\n\n{question}" if words else question
+
+def send(session, url: str, model: str, options: Dict, mix: PromptMix, scheduled: float, t0: float) -> Dict:
+    # Latency and TTFT count from the scheduled arrival, so queueing in the client is included
+    prompt_class, prompt = mix.sample()
+    queued = time.perf_counter() - scheduled
+    result = query_ollama(session, model, prompt, options, url)
+    result.pop("response", None)
+    result.update(prompt_class=prompt_class, start=scheduled - t0, end=time.perf_counter() - t0,
+                  queue_s=queued, latency_s=result["latency_s"] + queued)
+    if result.get("ttft_s") is not None:
+        result["ttft_s"] += queued
+    return result
+
+def run_closed(url: str, model: str, options: Dict, mix: PromptMix, concurrency: int, duration: float) -> List[Dict]:
+    results: List[Dict] = []
+    session = make_session(concurrency)
+    t0 = time.perf_counter()
+    deadline = t0 + duration
+
+    def user():
+        while time.perf_counter() < deadline:
+            results.append(send(session, url, model, options, mix, time.perf_counter(), t0))
+
+    threads = [threading.Thread(target=user) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    session.close()
+    return results
+
+def run_open(url: str, model: str, options: Dict, mix: PromptMix, rate: float, duration: float,
+             seed: int = 3407) -> List[Dict]:
+    # Arrivals follow a Poisson process regardless of how fast the server answers
+    rng = random.Random(seed)
+    results: List[Dict] = []
+    session = make_session(min(MAX_IN_FLIGHT, 64))
+    in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+    t0 = time.perf_counter()
+    next_arrival = t0
+
+    def task(scheduled):
+        try:
+            results.append(send(session, url, model, options, mix, scheduled, t0))
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=MAX_IN_FLIGHT) as pool:
+        while True:
+            next_arrival += rng.expovariate(rate)
+            if next_arrival - t0 >= duration:
+                break
+            time.sleep(max(0.0, next_arrival - time.perf_counter()))
+            if in_flight.acquire(blocking=False):
+                pool.submit(task, next_arrival)
+            else:
+                results.append({"error": "client overloaded", "start": next_arrival - t0,
+                                "end": next_arrival - t0, "latency_s": 0.0, "prompt_class": None})
+    session.close()
+    return results
+
+def summarize(results: List[Dict], duration: float) -> Dict:
+    ok = [r for r in results if not r["error"]]
+    summary = {"requests": len(results), "errors": len(results) - len(ok),
+               "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+               "throughput_rps": len(ok) / duration, "tokens_per_s": sum(r.get("tokens", 0) for r in ok) / duration}
+    for key in ("latency_s", "ttft_s"):
+        values = [r[key] for r in ok if r.get(key) is not None]
+        summary[key] = {f"p{q}": percentile(values, q) for q in (50, 95, 99)}
+    summary["by_prompt_class"] = {
+        name: {"requests": len(group), "latency_p95_s": percentile([r["latency_s"] for r in group], 95)}
+        for name in sorted({r["prompt_class"] for r in ok})
+        for group in [[r for r in ok if r["prompt_class"] == name]]
+    }
+    summary["meets_slo"] = bool(ok) and summary["latency_s"]["p95"] <= SLO_P95_LATENCY_S and \
+        summary["ttft_s"]["p95"] is not None and summary["ttft_s"]["p95"] <= SLO_P95_TTFT_S and \
+        summary["error_rate"] <= SLO_MAX_ERROR_RATE
+    return summary
+
+def windows(results: List[Dict], duration: float, window: float = WINDOW) -> List[Dict]:
+    # Requests bucketed by completion time
+    rows = []
+    for start in range(int((duration + window - 1e-9) // window)):
+        group = [r for r in results if start * window <= r["end"] < (start + 1) * window]
+        ok = [r for r in group if not r["error"]]
+        rows.append({"t": start * window, "requests": len(group), "errors": len(group) - len(ok),
+                     "throughput_rps": len(ok) / min(window, duration - start * window),
+                     "latency_p50_s": percentile([r["latency_s"] for r in ok], 50),
+                     "latency_p95_s": percentile([r["latency_s"] for r in ok], 95),
+                     "ttft_p95_s": percentile([r["ttft_s"] for r in ok if r.get("ttft_s") is not None], 95)})
+    return rows
+
+def run_load(url: str, options: Dict, mode: str = MODE, concurrency: int = CONCURRENCY, rate: float = RATE,
+             duration: float = DURATION, mix: Dict = PROMPT_MIX, model: str = MODEL) -> Dict:
+    prompts = PromptMix(mix, load_questions())
+    start = time.perf_counter()
+    if mode == "open":
+        results = run_open(url, model, options, prompts, rate, duration)
+    else:
+        results = run_closed(url, model, options, prompts, concurrency, duration)
+    # Closed-loop users finish their last request after the deadline
+    elapsed = max(duration, time.perf_counter() - start)
+    return {"mode": mode, "concurrency": concurrency if mode == "closed" else None,
+            "rate": rate if mode == "open" else None, "duration_s": elapsed, "options": options,
+            "summary": summarize(results, elapsed), "windows": windows(results, elapsed)}
+
+def print_run(label: str, run: Dict, over_time: bool = True):
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else "-"
+    s = run["summary"]
+    print(f"\n=== {label}: {s['requests']} requests in {run['duration_s']:.1f}s, {s['throughput_rps']:.2f} req/s, "
+          f"{s['tokens_per_s']:.1f} tokens/s, {s['error_rate']:.1%} errors, SLO {'met' if s['meets_slo'] else 'MISSED'}")
+    print(f"latency p50/p95/p99 {'/'.join(ms(s['latency_s'][p]) for p in ('p50', 'p95', 'p99'))} ms, "
+          f"TTFT p50/p95/p99 {'/'.join(ms(s['ttft_s'][p]) for p in ('p50', 'p95', 'p99'))} ms; p95 by prompt: "
+          + ", ".join(f"{name} {ms(c['latency_p95_s'])} ms" for name, c in s["by_prompt_class"].items()))
+    if over_time:
+        print(f"{'t (s)':>6} {'req':>5} {'err':>4} {'req/s':>6} {'p50 ms':>7} {'p95 ms':>7} {'TTFT p95':>9}")
+        for w in run["windows"]:
+            print(f"{w['t']:>6.0f} {w['requests']:>5} {w['errors']:>4} {w['throughput_rps']:>6.2f} "
+                  f"{ms(w['latency_p50_s']):>7} {ms(w['latency_p95_s']):>7} {ms(w['ttft_p95_s']):>9}")
+
+def wait_for_server(url: str, proc: subprocess.Popen, timeout: float = SERVER_START_TIMEOUT):
+    tags_url = url.rsplit("/api/", 1)[0] + "/api/tags"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode} during startup")
+        try:
+            if requests.get(tags_url, timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Server did not answer {tags_url} within {timeout}s")
+
+def sweep(url: str, num_ctx: List[Optional[int]], num_parallel: List[Optional[int]], server_cmd: Optional[str],
+          **load_args) -> List[Dict]:
+    # num_ctx is the Modelfile PARAMETER, sent per request as options.num_ctx (Ollama reloads the
+    # model when it changes). Parallelism is a server setting, so each value needs a fresh server:
+    # server_cmd (e.g. "ollama serve") is started with OLLAMA_NUM_PARALLEL and OLLAMA_HOST set.
+    runs = []
+    host = url.split("://", 1)[1].split("/", 1)[0]
+    for parallel in num_parallel:
+        proc = None
+        if parallel is not None:
+            env = dict(os.environ, OLLAMA_NUM_PARALLEL=str(parallel), OLLAMA_HOST=host)
+            proc = subprocess.Popen(shlex.split(server_cmd), env=env, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL)
+        try:
+            if proc is not None:
+                wait_for_server(url, proc)
+            for ctx in num_ctx:
+                options = dict(LOAD_OPTIONS, **({"num_ctx": ctx} if ctx else {}))
+                run = run_load(url, options, **load_args)
+                run["num_parallel"], run["num_ctx"] = parallel, ctx
+                print_run(f"num_ctx={ctx or 'default'} num_parallel={parallel or 'server default'}", run,
+                          over_time=len(num_ctx) * len(num_parallel) == 1)
+                runs.append(run)
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+    return runs
+
+def print_sweep(runs: List[Dict]):
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else "-"
+    print(f"\n{'num_ctx':>8} {'parallel':>8} {'req/s':>6} {'tok/s':>7} {'p95 ms':>7} {'TTFT p95':>9} {'errors':>7} {'SLO':>4}")
+    for run in runs:
+        s = run["summary"]
+        print(f"{str(run['num_ctx'] or '-'):>8} {str(run['num_parallel'] or '-'):>8} {s['throughput_rps']:>6.2f} "
+              f"{s['tokens_per_s']:>7.1f} {ms(s['latency_s']['p95']):>7} {ms(s['ttft_s']['p95']):>9} "
+              f"{s['error_rate']:>7.1%} {'yes' if s['meets_slo'] else 'no':>4}")
+    passing = [r for r in runs if r["summary"]["meets_slo"]]
+    if not passing:
+        print("No configuration met the SLO.")
+        return
+    best = max(passing, key=lambda r: r["summary"]["throughput_rps"])
+    print(f"Highest throughput within the SLO: {best['summary']['throughput_rps']:.2f} req/s with"
+          + (f" PARAMETER num_ctx {best['num_ctx']} in the Modelfile" if best["num_ctx"] else "")
+          + (f" and OLLAMA_NUM_PARALLEL={best['num_parallel']}" if best["num_parallel"] else ""))
+
+def main():
+    # python load_test.py [--mode closed|open] [--concurrency N] [--rate R] [--duration S]
+    #                     [--mix short=0.6,medium=0.3,long=0.1] [--url URL] [--report FILE]
+    #                     [--num-ctx 2048,8192] [--num-parallel 1,2,4 --server-cmd "ollama serve"]
+    # Lists after --num-ctx / --num-parallel run one load test per combination. --server-cmd is
+    # started once per parallelism value (with OLLAMA_HOST taken from --url), e.g.
+    # --server-cmd "python ollama_stub.py" for a dry run against the mock.
+    args = sys.argv[1:]
+
+    def option(flag, default):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    url = option("--url", API_URL)
+    mix = dict(PROMPT_MIX)
+    if "--mix" in args:
+        shares = dict(item.split("=") for item in option("--mix", "").split(","))
+        mix = {name: (float(shares.get(name, 0)), words) for name, (_, words) in PROMPT_MIX.items()}
+    load_args = dict(mode=option("--mode", MODE), concurrency=int(option("--concurrency", CONCURRENCY)),
+                     rate=float(option("--rate", RATE)), duration=float(option("--duration", DURATION)), mix=mix)
+    num_ctx = [int(v) for v in option("--num-ctx", "").split(",") if v] or [None]
+    num_parallel = [int(v) for v in option("--num-parallel", "").split(",") if v] or [None]
+    server_cmd = option("--server-cmd", None)
+    if num_parallel != [None] and not server_cmd:
+        print("--num-parallel needs --server-cmd (parallelism is fixed when the server starts).")
+        sys.exit(1)
+
+    runs = sweep(url, num_ctx, num_parallel, server_cmd, **load_args)
+    if len(runs) > 1:
+        print_sweep(runs)
+    report = {"url": url, "model": MODEL, "runs": runs, "slo": {
+        "p95_latency_s": SLO_P95_LATENCY_S, "p95_ttft_s": SLO_P95_TTFT_S, "max_error_rate": SLO_MAX_ERROR_RATE}}
+    report_path = option("--report", REPORT_FILE)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {report_path}")
+
+if __name__ == "__main__":
+    main()
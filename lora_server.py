@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+import torch
+from chat_format import SYSTEM_PROMPT, format_chat_prompt
+
+# Serves several LoRA fine-tunes from one copy of the base model instead of one merged (and
+# separately quantized) model per variant. Adapters are loaded on first use and kept in an LRU
+# of MAX_LOADED_ADAPTERS; concurrent requests are micro-batched, and a batch may mix adapters
+# (each row goes through its own LoRA in the same forward pass). The HTTP API is the Ollama
+# /api/generate subset compare_models.py and load_test.py use; the model name picks the adapter.
+
+# Configuration
+BASE_MODEL = os.environ.get("LORA_BASE_MODEL", "Qwen/Qwen2.5-7B-Instruct")  # model_name in train.py
+BASE_NAME = "base"  # Model name that answers without any adapter
+ADAPTERS_DIR = "adapters"  # <name>/adapter_config.json + weights, as written by model.save_pretrained()
+DEFAULT_ADAPTERS = {"qwen2.5-7b-rbi": "lora_model"}  # train.py's adapter, under its Ollama name
+MAX_LOADED_ADAPTERS = 4
+MAX_BATCH_SIZE = 8
+BATCH_WINDOW_S = 0.005  # How long the first request of a batch waits for others
+BATCH_MODE = "mixed"  # "mixed": one forward pass across adapters; "swap": one pass per adapter
+MAX_NEW_TOKENS = 256
+DEFAULT_OPTIONS = {"temperature": 0.7, "top_p": 0.9}  # PARAMETERs of the Modelfile in run_ollama.sh
+SERVER_PORT = 11437
+
+def discover_adapters(adapters_dir: str = ADAPTERS_DIR) -> Dict[str, str]:
+    adapters = {name: path for name, path in DEFAULT_ADAPTERS.items()
+                if os.path.exists(os.path.join(path, "adapter_config.json"))}
+    if os.path.isdir(adapters_dir):
+        for name in sorted(os.listdir(adapters_dir)):
+            path = os.path.join(adapters_dir, name)
+            if os.path.exists(os.path.join(path, "adapter_config.json")):
+                adapters[name] = path
+    return adapters
+
+class GenerationRequest:
+    def __init__(self, adapter: Optional[str], prompt: str, max_new_tokens: int = MAX_NEW_TOKENS,
+                 temperature: float = 0.0, top_p: float = 1.0):
+        self.adapter = adapter  # None = base model
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.future = Future()
+
+    def sampling(self):
+        # Requests can share a batch only with the same sampling settings
+        return (self.temperature, self.top_p) if self.temperature > 0 else (0.0, 1.0)
+
+class LoraEngine:
+    # One base model wrapped by PEFT; adapters are loaded into it by name and deleted again
+    # when the LRU is full. Not thread-safe: the Batcher is its only caller.
+    def __init__(self, base_model, tokenizer, adapters: Dict[str, str], max_loaded: int = MAX_LOADED_ADAPTERS,
+                 mode: str = BATCH_MODE):
+        self.base = base_model.eval()
+        self.model = None  # PeftModel, created with the first adapter
+        self.tokenizer = tokenizer
+        self.tokenizer.padding_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.adapters = adapters
+        self.max_loaded = max_loaded
+        self.mode = mode
+        self.loaded = OrderedDict()  # Adapter names, least recently used first
+        self.stats = {"loads": 0, "evictions": 0, "load_seconds": 0.0, "batches": 0, "requests": 0}
+
+    def _ensure_loaded(self, names):
+        from peft import PeftModel
+        for name in names:
+            if name in self.loaded:
+                self.loaded.move_to_end(name)
+                continue
+            start = time.perf_counter()
+            if self.model is None:
+                self.model = PeftModel.from_pretrained(self.base, self.adapters[name], adapter_name=name).eval()
+            else:
+                self.model.load_adapter(self.adapters[name], adapter_name=name)
+            self.loaded[name] = True
+            self.stats["loads"] += 1
+            self.stats["load_seconds"] += time.perf_counter() - start
+            # Evict after loading: PEFT cannot drop the only adapter it has
+            while len(self.loaded) > self.max_loaded:
+                victim = next(n for n in self.loaded if n not in names)
+                self.model.delete_adapter(victim)
+                del self.loaded[victim]
+                self.stats["evictions"] += 1
+
+    def _generate(self, requests: List[GenerationRequest], adapter_names=None) -> List[Dict]:
+        inputs = self.tokenizer([r.prompt for r in requests], return_tensors="pt", padding=True).to(self.base.device)
+        temperature, top_p = requests[0].sampling()
+        kwargs = dict(max_new_tokens=max(r.max_new_tokens for r in requests), pad_token_id=self.tokenizer.pad_token_id,
+                      do_sample=temperature > 0)
+        if temperature > 0:
+            kwargs.update(temperature=temperature, top_p=top_p)
+        with torch.inference_mode():
+            if self.model is None:
+                output = self.base.generate(**inputs, **kwargs)
+            elif adapter_names is None:
+                with self.model.disable_adapter():
+                    output = self.model.generate(**inputs, **kwargs)
+            elif self.mode == "mixed":
+                output = self.model.generate(**inputs, adapter_names=adapter_names, **kwargs)
+            else:
+                self.model.set_adapter(adapter_names[0])
+                output = self.model.generate(**inputs, **kwargs)
+        results = []
+        prompt_lengths = inputs["attention_mask"].sum(dim=1).tolist()
+        for request, length, row in zip(requests, prompt_lengths, output[:, inputs["input_ids"].shape[1]:].tolist()):
+            row = row[:request.max_new_tokens]
+            if self.tokenizer.eos_token_id in row:
+                row = row[:row.index(self.tokenizer.eos_token_id)]
+            results.append({"response": self.tokenizer.decode(row, skip_special_tokens=True), "tokens": row,
+                            "prompt_eval_count": int(length), "eval_count": len(row)})
+        return results
+
+    def generate(self, requests: List[GenerationRequest]) -> List[Dict]:
+        # One batch with shared sampling settings; adapters may differ between rows
+        names = list(dict.fromkeys(r.adapter for r in requests if r.adapter))
+        self._ensure_loaded(names)
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(requests)
+        if self.mode == "mixed" and names:
+            return self._generate(requests, [r.adapter or "__base__" for r in requests])
+        # Hot-swap: one pass per adapter (and one for base-model rows)
+        results = [None] * len(requests)
+        for name in [None] + names:
+            group = [i for i, r in enumerate(requests) if r.adapter == name]
+            if group:
+                outputs = self._generate([requests[i] for i in group], [name] * len(group) if name else None)
+                for i, output in zip(group, outputs):
+                    results[i] = output
+        return results
+
+class Batcher:
+    # Collects requests for up to BATCH_WINDOW_S (or MAX_BATCH_SIZE) and runs them as one
+    # engine batch; requests that do not fit (other sampling, too many adapters) wait for the next
+    def __init__(self, engine: LoraEngine, max_batch: int = MAX_BATCH_SIZE, window: float = BATCH_WINDOW_S):
+        self.engine = engine
+        self.max_batch = max_batch
+        self.window = window
+        self.queue = queue.Queue()
+        self.pending = deque()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, request: GenerationRequest) -> Future:
+        self.queue.put(request)
+        return request.future
+
+    def _fits(self, batch: List[GenerationRequest], request: GenerationRequest) -> bool:
+        adapters = {r.adapter for r in batch if r.adapter} | ({request.adapter} if request.adapter else set())
+        return request.sampling() == batch[0].sampling() and len(adapters) <= self.engine.max_loaded
+
+    def _run(self):
+        while True:
+            first = self.pending.popleft() if self.pending else self.queue.get()
+            batch, skipped = [first], []
+            while self.pending and len(batch) < self.max_batch:
+                request = self.pending.popleft()
+                (batch if self._fits(batch, request) else skipped).append(request)
+            deadline = time.perf_counter() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    request = self.queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                (batch if self._fits(batch, request) else skipped).append(request)
+            self.pending.extendleft(reversed(skipped))
+            try:
+                for request, result in zip(batch, self.engine.generate(batch)):
+                    request.future.set_result(result)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+
+class LoraHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict, content_type: str = "application/json"):
+        data = (json.dumps(body) + ("\n" if content_type != "application/json" else "")).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        engine = self.server.batcher.engine
+        if self.path == "/api/tags":
+            models = [{"name": BASE_NAME, "loaded": True}] + [
+                {"name": name, "loaded": name in engine.loaded} for name in engine.adapters]
+            self._send_json(200, {"models": models})
+        elif self.path == "/lora/stats":
+            self._send_json(200, dict(engine.stats, loaded=list(engine.loaded)))
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+        engine = self.server.batcher.engine
+        model = request.get("model")
+        if model != BASE_NAME and model not in engine.adapters:
+            self._send_json(404, {"error": f"model '{model}' not found"})
+            return
+        options = dict(DEFAULT_OPTIONS, **(request.get("options") or {}))
+        prompt = request.get("prompt", "")
+        if not request.get("raw"):
+            prompt = format_chat_prompt(prompt, request.get("system") or SYSTEM_PROMPT)
+        start = time.perf_counter()
+        future = self.server.batcher.submit(GenerationRequest(
+            None if model == BASE_NAME else model, prompt, int(options.get("num_predict") or MAX_NEW_TOKENS),
+            float(options.get("temperature", 0.0)), float(options.get("top_p", 1.0))))
+        try:
+            result = future.result()
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+            return
+        # Whole answer at once; streaming clients get it as one chunk followed by the summary
+        final = {"model": model, "created_at": datetime.now(timezone.utc).isoformat(), "done": True,
+                 "done_reason": "stop", "total_duration": int((time.perf_counter() - start) * 1e9),
+                 "prompt_eval_count": result["prompt_eval_count"], "eval_count": result["eval_count"]}
+        if not request.get("stream", True):
+            self._send_json(200, dict(final, response=result["response"]))
+            return
+        lines = [json.dumps({"model": model, "response": result["response"], "done": False}), json.dumps(final)]
+        data = ("\n".join(lines) + "\n").encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+def start_server(engine: LoraEngine, port: int = SERVER_PORT) -> ThreadingHTTPServer:
+    # Serves in a background thread; port 0 picks a free port (server.server_address[1])
+    server = ThreadingHTTPServer(("127.0.0.1", port), LoraHandler)
+    server.daemon_threads = True
+    server.batcher = Batcher(engine)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def load_base(model_name: str = BASE_MODEL):
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    dtype = torch.bfloat16 if torch.cuda.is_available() else torch.float32
+    model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=dtype,
+                                                 device_map="auto" if torch.cuda.is_available() else None)
+    return model, tokenizer
+
+def main():
+    # python lora_server.py [--base Qwen/Qwen2.5-7B-Instruct] [--adapters adapters] [--port 11437]
+    #                       [--mode mixed|swap] [--max-loaded 4]
+    args = sys.argv[1:]
+
+    def option(flag, default):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    adapters = discover_adapters(option("--adapters", ADAPTERS_DIR))
+    if not adapters:
+        print(f"No adapters found in {ADAPTERS_DIR}/ or {', '.join(DEFAULT_ADAPTERS.values())}; serving the base model only.")
+    base_name = option("--base", BASE_MODEL)
+    print(f"Loading base model {base_name}...")
+    model, tokenizer = load_base(base_name)
+    engine = LoraEngine(model, tokenizer, adapters, int(option("--max-loaded", MAX_LOADED_ADAPTERS)),
+                        option("--mode", BATCH_MODE))
+    server = start_server(engine, int(option("--port", SERVER_PORT)))
+    print(f"LoRA server on http://127.0.0.1:{server.server_address[1]}/api/generate: models "
+          f"{', '.join([BASE_NAME] + list(adapters))}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import time
+import random
+import socket
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# Local stand-in for the Ollama HTTP API (/api/generate, streaming and not, plus /api/tags) so
+# compare_models.py and load_test.py can be exercised without a GPU or model weights. Each model
+# has a fixed time to first token, prompt-processing and token rates and an error rate; answers
+# come from a prompt -> answer table or a default. Like Ollama, at most OLLAMA_NUM_PARALLEL
+# requests are processed at once and the rest queue, and prompts are cut to options.num_ctx.
+DEFAULT_PORT = 11435
+DEFAULT_PARALLEL = 4
+
+class StubModel:
+    def __init__(self, ttft: float = 0.05, tokens_per_s: float = 200.0, answers: Optional[Dict[str, str]] = None,
+                 default_answer: str = "I do not have information about that.", prefill_tokens_per_s: float = 0.0,
+                 error_rate: float = 0.0, digest: str = "stub-1"):
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s
+        self.answers = answers or {}
+        self.default_answer = default_answer
+        self.prefill_tokens_per_s = prefill_tokens_per_s  # 0 = prompt length does not matter
+        self.error_rate = error_rate
+        self.digest = digest  # Reported by /api/tags; change it to simulate re-creating the model
+        self.received = deque(maxlen=1000)  # Latest request bodies, for tests
+
+    def answer(self, prompt: str) -> str:
+        return self.answers.get(prompt, self.default_answer)
+
+def split_tokens(text: str):
+    # Word-sized chunks that concatenate back to the text, like streamed Ollama tokens
+    tokens, current = [], ""
+    for char in text:
+        if char == " " and current.strip():
+            tokens.append(current)
+            current = ""
+        current += char
+    if current:
+        tokens.append(current)
+    return tokens
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so pooled client connections are reused
+    models: Dict[str, StubModel] = {}
+    slots = threading.BoundedSemaphore(DEFAULT_PARALLEL)
+    connections = 0  # TCP connections accepted, to check that clients reuse them
+
+    def setup(self):
+        super().setup()
+        # Like Ollama's Go server; otherwise Nagle + delayed ACKs add ~40 ms to each streamed chunk
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        type(self).connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json(200, {"models": [{"name": name, "model": name, "digest": model.digest}
+                                             for name, model in self.models.items()]})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != "/api/generate":
+            self._send_json(404, {"error": "not found"})
+            return
+        model = self.models.get(request.get("model"))
+        if model is None:
+            self._send_json(404, {"error": f"model '{request.get('model')}' not found"})
+            return
+        model.received.append(request)
+
+        if model.error_rate and random.random() < model.error_rate:
+            self._send_json(500, {"error": "injected failure"})
+            return
+        with self.slots:
+            self._generate(request, model)
+
+    def _generate(self, request: Dict, model: StubModel):
+        start = time.perf_counter()
+        options = request.get("options") or {}
+        tokens = split_tokens(model.answer(request.get("prompt", "")))[:options.get("num_predict") or None]
+        # One word ~ one token; Ollama keeps only the last num_ctx tokens of a long prompt
+        prompt_tokens = len(request.get("prompt", "").split())
+        if options.get("num_ctx"):
+            prompt_tokens = min(prompt_tokens, options["num_ctx"])
+        prefill = prompt_tokens / model.prefill_tokens_per_s if model.prefill_tokens_per_s else 0.0
+        time.sleep(model.ttft + prefill)
+        final = {"model": request["model"], "done": True, "done_reason": "stop",
+                 "prompt_eval_count": prompt_tokens, "eval_count": len(tokens)}
+        if not request.get("stream", True):
+            time.sleep(len(tokens) / model.tokens_per_s)
+            final.update(response="".join(tokens), total_duration=int((time.perf_counter() - start) * 1e9),
+                         eval_duration=int(len(tokens) / model.tokens_per_s * 1e9))
+            self._send_json(200, final)
+            return
+
+        # NDJSON over chunked transfer encoding, one line per token and a final summary line
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        first = time.perf_counter()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(1 / model.tokens_per_s)
+            self._write_chunk({"model": request["model"], "response": token, "done": False})
+        final.update(response="", total_duration=int((time.perf_counter() - start) * 1e9),
+                     eval_duration=int((time.perf_counter() - first) * 1e9))
+        self._write_chunk(final)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, body: Dict):
+        data = (json.dumps(body) + "\n").encode('utf-8')
+        self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+def start_stub(models: Dict[str, StubModel], port: int = 0, parallel: int = 64) -> ThreadingHTTPServer:
+    # Serves in a background thread; port 0 picks a free port (server.server_address[1]).
+    # The default parallelism is high enough not to queue test traffic.
+    handler = type("BoundStubHandler", (StubHandler,), {"models": models,
+                                                        "slots": threading.BoundedSemaphore(parallel)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    # python ollama_stub.py [port]: serves the two model names compare_models.py expects.
+    # Reads OLLAMA_HOST / OLLAMA_NUM_PARALLEL like `ollama serve`, so load_test.py can start it
+    # in its place; STUB_TTFT, STUB_TOKENS_PER_S, STUB_PREFILL_TOKENS_PER_S and STUB_ERROR_RATE
+    # inject latency and failures.
+    from compare_models import BASE_MODEL, FINETUNED_MODEL
+    port = int(os.environ.get("OLLAMA_HOST", f"127.0.0.1:{DEFAULT_PORT}").rsplit(":", 1)[1])
+    if len(sys.argv) > 1:
+        port = int(sys.argv[1])
+    parallel = int(os.environ.get("OLLAMA_NUM_PARALLEL") or DEFAULT_PARALLEL)
+    settings = dict(ttft=float(os.environ.get("STUB_TTFT", 0.1)),
+                    tokens_per_s=float(os.environ.get("STUB_TOKENS_PER_S", 60)),
+                    prefill_tokens_per_s=float(os.environ.get("STUB_PREFILL_TOKENS_PER_S", 0)),
+                    error_rate=float(os.environ.get("STUB_ERROR_RATE", 0)))
+    base_settings = dict(settings, ttft=settings["ttft"] * 1.5, tokens_per_s=settings["tokens_per_s"] * 2 / 3)
+    server = start_stub({BASE_MODEL: StubModel(**base_settings), FINETUNED_MODEL: StubModel(**settings)},
+                        port, parallel)
+    print(f"Ollama stub listening on http://127.0.0.1:{server.server_address[1]}/api/generate "
+          f"({parallel} parallel)", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Set
+from dataset_store import atomic_write_json
+
+# Configuration
+MANIFEST_FILE = "run_manifest.json"
+LOG_DIR = os.path.join(".cache", "orchestrate")
+MAX_PARALLEL_STAGES = 3
+KEEP_RUNS = 20  # Past runs kept in the manifest
+
+PYTHON = sys.executable
+GGUF_Q4 = "qwen2.5_7b_finetuned-Q4_K_M.gguf"
+
+class StageSpec:
+    # A stage is up to date when the fingerprint of its inputs, environment and command
+    # matches the one recorded after its last successful run and all its outputs exist.
+    # Stages sharing a resource (e.g. the GPU) never run at the same time.
+    def __init__(self, name: str, command: List[str], inputs: List[str], outputs: List[str] = (),
+                 deps: List[str] = (), env: List[str] = (), resource: Optional[str] = None):
+        self.name = name
+        self.command = command
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.env = list(env)
+        self.resource = resource
+
+STAGES = [
+    StageSpec("extract", [PYTHON, "pdf_extract.py"], ["Reports", "pdf_extract.py"]),
+    StageSpec("generate", [PYTHON, "generate_dataset.py"],
+              ["Reports", "generate_dataset.py", "segment.py", "prefilter.py", "dedup.py", "pipeline.py",
+               "llm_cache.py", "dataset_store.py", "pdf_extract.py"],
+              outputs=["dataset.jsonl", "tracker.json"], deps=["extract"], env=["LLM_CACHE_MODE"]),
+    StageSpec("rag", [PYTHON, "rag.py", "--build"],
+              ["Reports", "rag.py", "segment.py", "prefilter.py", "pdf_extract.py", "generate_dataset.py"],
+              outputs=[os.path.join(".cache", "rag", "manifest.json")], deps=["extract"], env=["RAG_EMBED_MODEL"]),
+    StageSpec("prepare", [PYTHON, "prepare_finetune_dataset.py"],
+              ["dataset.jsonl", "tracker.json", "prepare_finetune_dataset.py", "chat_format.py", "token_counts.py",
+               "dedup.py", "dataset_store.py"],
+              outputs=[os.path.join("finetune_data", "manifest.json")], deps=["generate"], env=["TOKENIZER_PATH"]),
+    StageSpec("train", [PYTHON, "train.py"],
+              ["finetune_data", "train.py", "packing.py", "pretokenize.py", "eval_metrics.py", "scoring.py",
+               "train_profiler.py", "chat_format.py"],
+              outputs=["lora_model"], deps=["prepare"], resource="gpu"),
+    StageSpec("export", [PYTHON, "fix_export.py"], ["lora_model", "fix_export.py", "dataset_store.py"],
+              outputs=[GGUF_Q4], deps=["train"], env=["EXPORT_QUANTS", "LLAMA_CPP_DIR"], resource="gpu"),
+    StageSpec("ollama", ["bash", "run_ollama.sh", "--create-only"], [GGUF_Q4, "run_ollama.sh"], deps=["export"]),
+    StageSpec("push", [PYTHON, "push_to_hf.py"], [GGUF_Q4, "lora_model", "push_to_hf.py", "dataset_store.py"],
+              deps=["export"], env=["HF_USERNAME", "PUSH_LOCAL_HUB"]),
+]
+
+class Manifest:
+    # run_manifest.json: last successful fingerprint per stage, per-run timings, and a
+    # (size, mtime) -> sha256 memo so unchanged large files (PDFs, weights) are not re-hashed
+    def __init__(self, filepath: str = MANIFEST_FILE):
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.data = {"stages": {}, "file_hashes": {}, "runs": []}
+        if os.path.exists(filepath):
+            with open(filepath, 'r') as f:
+                self.data.update(json.load(f))
+
+    def file_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        with self.lock:
+            memo = self.data["file_hashes"].get(path)
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        with self.lock:
+            self.data["file_hashes"][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def save(self):
+        with self.lock:
+            atomic_write_json(self.filepath, self.data, indent=2)
+
+def iter_files(path: str):
+    if os.path.isfile(path):
+        yield path
+        return
+    for root, dirs, files in os.walk(path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith(".") and not name.endswith(".tmp"):
+                yield os.path.join(root, name)
+
+def fingerprint(spec: StageSpec, manifest: Manifest) -> str:
+    digest = hashlib.sha256("\0".join(spec.command).encode('utf-8'))
+    for key in spec.env:
+        digest.update(f"\0{key}={os.environ.get(key, '')}".encode('utf-8'))
+    for path in spec.inputs:
+        if not os.path.exists(path):
+            digest.update(f"\0{path}:missing".encode('utf-8'))
+            continue
+        for file_path in iter_files(path):
+            digest.update(f"\0{file_path}:{manifest.file_hash(file_path)}".encode('utf-8'))
+    return digest.hexdigest()
+
+def missing_outputs(spec: StageSpec) -> List[str]:
+    # Outputs that do not exist or are empty (a zero-byte file, a directory without files)
+    return [path for path in spec.outputs
+            if not os.path.exists(path) or not any(os.path.getsize(f) for f in iter_files(path))]
+
+def select_stages(targets: List[str], only: bool = False) -> List[StageSpec]:
+    # The targets and everything upstream of them (or just the targets with only=True),
+    # in declaration (topological) order
+    by_name = {s.name: s for s in STAGES}
+    unknown = [t for t in targets if t not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown stage(s): {', '.join(unknown)}. Stages: {', '.join(by_name)}")
+    if only:
+        return [s for s in STAGES if s.name in targets]
+    needed: Set[str] = set()
+    pending = list(targets or by_name)
+    while pending:
+        name = pending.pop()
+        if name not in needed:
+            needed.add(name)
+            pending += by_name[name].deps
+    return [s for s in STAGES if s.name in needed]
+
+def run_stage(spec: StageSpec) -> int:
+    os.makedirs(LOG_DIR, exist_ok=True)
+    with open(os.path.join(LOG_DIR, f"{spec.name}.log"), 'w') as log:
+        return subprocess.run(spec.command, stdout=log, stderr=subprocess.STDOUT).returncode
+
+def tail(path: str, lines: int = 20) -> str:
+    with open(path, 'r', errors='replace') as f:
+        return "".join(f.readlines()[-lines:])
+
+def run(targets: List[str], force: Set[str], dry_run: bool = False, only: bool = False) -> bool:
+    manifest = Manifest()
+    stages = select_stages(targets, only)
+    status: Dict[str, str] = {}  # name -> "ran" | "skipped" | "failed" | "blocked"
+    run_record = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "targets": targets, "stages": {}}
+    run_start = time.monotonic()
+    busy: Set[str] = set()  # Resources held by running stages
+    running = {}  # future -> spec
+    started: Dict[str, float] = {}
+    selected = {s.name for s in stages}
+
+    def record(spec: StageSpec, state: str, **fields):
+        status[spec.name] = state
+        run_record["stages"][spec.name] = dict(status=state, **fields)
+
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_STAGES) as pool:
+        while len(status) < len(stages):
+            progressed = False
+            for spec in stages:
+                if spec.name in status or spec.name in started:
+                    continue
+                dep_states = [status.get(d) for d in spec.deps if d in selected]
+                if any(d in ("failed", "blocked") for d in dep_states):
+                    record(spec, "blocked")
+                    print(f"[{spec.name}] blocked by a failed dependency")
+                    progressed = True
+                    continue
+                if any(d is None for d in dep_states) or len(running) >= MAX_PARALLEL_STAGES:
+                    continue
+                if spec.resource and spec.resource in busy:
+                    continue
+                if dry_run and any(run_record["stages"][d].get("would_run") for d in spec.deps if d in selected):
+                    record(spec, "skipped", would_run=True)
+                    print(f"[{spec.name}] would run after upstream stages: {' '.join(spec.command)}")
+                    progressed = True
+                    continue
+                # Fingerprinted only once upstream stages are done, since they write our inputs
+                fp = fingerprint(spec, manifest)
+                last = manifest.data["stages"].get(spec.name, {})
+                fresh = last.get("fingerprint") == fp and not missing_outputs(spec)
+                if fresh and spec.name not in force:
+                    record(spec, "skipped", fingerprint=fp)
+                    print(f"[{spec.name}] up to date, skipped")
+                    progressed = True
+                    continue
+                if dry_run:
+                    record(spec, "skipped", fingerprint=fp, would_run=True)
+                    print(f"[{spec.name}] would run: {' '.join(spec.command)}")
+                    progressed = True
+                    continue
+                print(f"[{spec.name}] running: {' '.join(spec.command)}")
+                if spec.resource:
+                    busy.add(spec.resource)
+                started[spec.name] = time.monotonic()
+                running[pool.submit(run_stage, spec)] = spec
+            if not running:
+                if not progressed:
+                    raise RuntimeError("Stage graph cannot make progress (dependency cycle?)")
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                spec = running.pop(future)
+                busy.discard(spec.resource)
+                seconds = time.monotonic() - started[spec.name]
+                timing = dict(seconds=round(seconds, 3), started_after=round(started[spec.name] - run_start, 3))
+                missing = missing_outputs(spec) if future.result() == 0 else []
+                if future.result() == 0 and not missing:
+                    # Re-fingerprint: a stage may legitimately rewrite its own inputs (e.g. the tracker)
+                    fp = fingerprint(spec, manifest)
+                    record(spec, "ran", fingerprint=fp, **timing)
+                    with manifest.lock:
+                        manifest.data["stages"][spec.name] = {"fingerprint": fp, "seconds": timing["seconds"],
+                                                              "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+                    print(f"[{spec.name}] done in {seconds:.1f}s")
+                else:
+                    record(spec, "failed", returncode=future.result(), missing_outputs=missing, **timing)
+                    log_path = os.path.join(LOG_DIR, f"{spec.name}.log")
+                    reason = f"exit {future.result()}" if future.result() else f"missing or empty: {', '.join(missing)}"
+                    print(f"[{spec.name}] FAILED ({reason}) after {seconds:.1f}s; last lines of {log_path}:")
+                    print(tail(log_path))
+                manifest.save()
+
+    run_record["seconds"] = round(time.monotonic() - run_start, 3)
+    if not dry_run:
+        with manifest.lock:
+            manifest.data["runs"] = (manifest.data["runs"] + [run_record])[-KEEP_RUNS:]
+        manifest.save()
+    counts = {state: sum(1 for s in status.values() if s == state) for state in ("ran", "skipped", "failed", "blocked")}
+    print(f"Finished in {run_record['seconds']:.1f}s: " + ", ".join(f"{n} {state}" for state, n in counts.items()))
+    return counts["failed"] == 0 and counts["blocked"] == 0
+
+def main():
+    # python orchestrate.py [stage ...] [--only] [--force stage[,stage]] [--force-all] [--dry-run]
+    # --only runs just the named stages, e.g. "--only extract export" converts the current
+    # lora_model while new reports are extracted
+    args = sys.argv[1:]
+    force: Set[str] = set()
+    dry_run = "--dry-run" in args
+    if "--force" in args:
+        i = args.index("--force")
+        force = set(args[i + 1].split(","))
+        del args[i:i + 2]
+    if "--force-all" in args:
+        force = {s.name for s in STAGES}
+    targets = [a for a in args if not a.startswith("--")]
+    sys.exit(0 if run(targets, force, dry_run, only="--only" in args) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+from typing import Dict, List, Sequence
+import torch
+
+# Configuration
+# "mask": 4D block-diagonal causal mask, works with eager/sdpa attention on any backend.
+# "position_ids": no mask; sample boundaries come from the position resets (flash-attention varlen).
+PACKING_ATTENTION = "mask"
+IGNORE_INDEX = -100
+
+def pack_ffd(lengths: Sequence[int], max_length: int) -> List[List[int]]:
+    # First-fit decreasing: longest samples first, each into the first bin with room.
+    # A max segment tree over remaining capacities finds that bin in O(log n).
+    size = 1
+    while size < max(len(lengths), 1):
+        size *= 2
+    tree = [0] * (2 * size)  # Unopened bins have capacity 0 until first used
+    bins: List[List[int]] = []
+
+    def update(pos: int, value: int):
+        pos += size
+        tree[pos] = value
+        while pos > 1:
+            pos //= 2
+            tree[pos] = max(tree[2 * pos], tree[2 * pos + 1])
+
+    for i in sorted(range(len(lengths)), key=lambda i: -lengths[i]):
+        length = min(lengths[i], max_length)
+        if tree[1] >= length:
+            pos = 1
+            while pos < size:
+                pos = 2 * pos if tree[2 * pos] >= length else 2 * pos + 1
+            b = pos - size
+        else:
+            b = len(bins)
+            bins.append([])
+            tree[size + b] = max_length
+        bins[b].append(i)
+        update(b, tree[size + b] - length)
+    return bins
+
+def pack_row(samples: Sequence[Sequence[int]], bin_indices: Sequence[int], max_length: int) -> Dict[str, List[int]]:
+    # Concatenates one bin's samples; position ids restart at 0 per sample and the first token of
+    # every sample is excluded from the loss, since it would be predicted from the previous sample
+    input_ids, position_ids, labels = [], [], []
+    for i in bin_indices:
+        ids = samples[i][:max_length]
+        ids = ids.tolist() if hasattr(ids, "tolist") else list(ids)
+        input_ids += ids
+        position_ids += range(len(ids))
+        labels += [IGNORE_INDEX] + ids[1:]
+    return {"input_ids": input_ids, "position_ids": position_ids, "labels": labels}
+
+def pack_samples(samples: Sequence[Sequence[int]], max_length: int) -> List[Dict[str, List[int]]]:
+    return [pack_row(samples, b, max_length) for b in pack_ffd([len(s) for s in samples], max_length)]
+
+class PackedDataset:
+    # Map-style dataset that builds rows on access, so samples may be a memory-mapped
+    # PretokenizedDataset. With pack=False every row holds a single sample.
+    def __init__(self, samples, max_length: int, pack: bool = True):
+        self.samples = samples
+        self.max_length = max_length
+        lengths = getattr(samples, "lengths", None)
+        if lengths is None:
+            lengths = [len(s) for s in samples]
+        self.bins = pack_ffd(lengths, max_length) if pack else [[i] for i in range(len(samples))]
+
+    def __len__(self) -> int:
+        return len(self.bins)
+
+    def __getitem__(self, index: int) -> Dict[str, List[int]]:
+        return pack_row(self.samples, self.bins[index], self.max_length)
+
+def packing_efficiency(packed: Sequence[Dict], max_length: int) -> float:
+    return sum(len(p["input_ids"]) for p in packed) / (len(packed) * max_length) if len(packed) else 1.0
+
+def block_causal_mask(position_ids: torch.Tensor, lengths: torch.Tensor, dtype=torch.float32) -> torch.Tensor:
+    # (batch, 1, seq, seq) additive mask: token q may attend to k only within its own sample and k <= q.
+    # Padding rows attend to themselves so softmax never sees an all-masked row.
+    batch, seq = position_ids.shape
+    positions = torch.arange(seq)
+    sample_ids = torch.cumsum(position_ids == 0, dim=1)
+    sample_ids = sample_ids.masked_fill(positions[None, :] >= lengths[:, None], -1)
+    same = sample_ids[:, :, None] == sample_ids[:, None, :]
+    causal = positions[:, None] >= positions[None, :]
+    allowed = (same & causal & (sample_ids[:, :, None] >= 0)) | torch.eye(seq, dtype=torch.bool)
+    mask = torch.zeros(batch, 1, seq, seq, dtype=dtype)
+    return mask.masked_fill(~allowed[:, None], torch.finfo(dtype).min)
+
+class PackedCollator:
+    def __init__(self, pad_token_id: int, attention: str = PACKING_ATTENTION, dtype=torch.float32):
+        if attention not in ("mask", "position_ids"):
+            raise ValueError(f"Unknown packing attention mode: {attention}")
+        self.pad_token_id = pad_token_id
+        self.attention = attention
+        self.dtype = dtype
+
+    def __call__(self, features: List[Dict]) -> Dict[str, torch.Tensor]:
+        seq = max(len(f["input_ids"]) for f in features)
+        input_ids, position_ids, labels = [], [], []
+        for f in features:
+            pad = seq - len(f["input_ids"])
+            input_ids.append(list(f["input_ids"]) + [self.pad_token_id] * pad)
+            # Padding forms its own trailing "sample" so it never joins the last real one
+            position_ids.append(list(f["position_ids"]) + list(range(pad)))
+            labels.append(list(f["labels"]) + [IGNORE_INDEX] * pad)
+        batch = {
+            "input_ids": torch.tensor(input_ids),
+            "position_ids": torch.tensor(position_ids),
+            "labels": torch.tensor(labels),
+        }
+        if self.attention == "mask":
+            lengths = torch.tensor([len(f["input_ids"]) for f in features])
+            batch["attention_mask"] = block_causal_mask(batch["position_ids"], lengths, self.dtype)
+        return batch
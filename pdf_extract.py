@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Optional
+from pypdf import PdfReader
+
+# Configuration
+PAGE_CACHE_DIR = os.path.join(".cache", "pages")
+EXTRACT_WORKERS = os.cpu_count() or 1
+PAGES_PER_TASK = 8  # Pages handed to a worker at a time; each worker parses the PDF once
+TASKS_IN_FLIGHT = 2  # Per worker; bounds the extracted pages held ahead of a slow consumer
+HASH_CHUNK_SIZE = 1024 * 1024
+
+_reader = None
+_reader_path = None
+
+def file_sha256(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_path(content_hash: str, cache_dir: str = PAGE_CACHE_DIR) -> str:
+    return os.path.join(cache_dir, f"{content_hash}.jsonl")
+
+def _extract_range(filepath: str, start: int, end: int) -> List[str]:
+    # Runs in a worker process; the parsed reader is kept per process across tasks
+    global _reader, _reader_path
+    if _reader_path != filepath:
+        _reader = PdfReader(filepath)
+        _reader_path = filepath
+    return [_reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def _extract_pages_uncached(filepath: str, workers: int) -> Iterator[str]:
+    num_pages = len(PdfReader(filepath).pages)
+    ranges = [(start, min(start + PAGES_PER_TASK, num_pages)) for start in range(0, num_pages, PAGES_PER_TASK)]
+    if workers <= 1 or len(ranges) <= 1:
+        for start, end in ranges:
+            yield from _extract_range(filepath, start, end)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # A bounded window of ranges in flight, consumed in page order: the next range is only
+        # submitted once the oldest has been yielded, so memory does not grow with report size
+        pending = iter(ranges)
+        futures = deque(executor.submit(_extract_range, filepath, start, end)
+                        for start, end in islice(pending, TASKS_IN_FLIGHT * workers))
+        while futures:
+            pages = futures.popleft().result()
+            yield from pages
+            for start, end in islice(pending, 1):
+                futures.append(executor.submit(_extract_range, filepath, start, end))
+
+def extract_pages(filepath: str, workers: int = EXTRACT_WORKERS, cache_dir: Optional[str] = PAGE_CACHE_DIR,
+                  content_hash: Optional[str] = None) -> Iterator[str]:
+    # Yields page text in page order. Extracted pages are cached on disk under the file's
+    # content hash, so re-runs and resumes of an unchanged report never touch pypdf.
+    if cache_dir is None:
+        yield from _extract_pages_uncached(filepath, workers)
+        return
+
+    content_hash = content_hash or file_sha256(filepath)
+    cached = cache_path(content_hash, cache_dir)
+    if os.path.exists(cached):
+        with open(cached, 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+        return
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{cached}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for text in _extract_pages_uncached(filepath, workers):
+                f.write(json.dumps(text, ensure_ascii=False) + "\n")
+                yield text
+    except BaseException:
+        # Abandoned or failed extraction: never leave a partial file behind
+        os.remove(tmp_path)
+        raise
+    # Only a fully extracted report is published to the cache
+    os.replace(tmp_path, cached)
+
+def main():
+    # Warm the page cache for every report, e.g. ahead of generate_dataset.py
+    reports_dir = sys.argv[1] if len(sys.argv) > 1 else "Reports"
+    files = sorted(f for f in os.listdir(reports_dir) if f.endswith('.pdf'))
+    for filename in files:
+        pages = sum(1 for _ in extract_pages(os.path.join(reports_dir, filename)))
+        print(f"{filename}: {pages} pages cached")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
+
+# Configuration
+QUEUE_SIZE = 64  # Max items buffered between two stages
+POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+class _StageError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+class Stage:
+    def __init__(self, name: str, fn: Callable[[Iterator], Iterable], queue_size: int):
+        self.name = name
+        self.fn = fn
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.items = 0
+        self.started = None
+        self.finished = None
+        self.depth_total = 0
+        self.depth_samples = 0
+        self.depth_max = 0
+
+    def sample_depth(self):
+        depth = self.queue.qsize()
+        self.depth_total += depth
+        self.depth_samples += 1
+        self.depth_max = max(self.depth_max, depth)
+
+    def throughput(self) -> float:
+        if self.started is None:
+            return 0.0
+        elapsed = (self.finished or time.monotonic()) - self.started
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+class Pipeline:
+    # Chains generator stages, each on its own thread, with a bounded queue after every stage.
+    # A slow stage applies back-pressure upstream, so memory stays bounded by the queue sizes
+    # and downstream work (e.g. LLM calls) starts while upstream stages are still producing.
+    def __init__(self, queue_size: int = QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.stages: List[Stage] = []
+        self.stop = threading.Event()
+
+    def source(self, name: str, iterable: Iterable) -> "Pipeline":
+        return self.stage(name, lambda _: iterable)
+
+    def stage(self, name: str, fn: Callable[[Iterator], Iterable]) -> "Pipeline":
+        self.stages.append(Stage(name, fn, self.queue_size))
+        return self
+
+    def _put(self, stage: Stage, item) -> bool:
+        while not self.stop.is_set():
+            try:
+                stage.queue.put(item, timeout=POLL_INTERVAL)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _drain(self, stage: Optional[Stage]) -> Iterator:
+        if stage is None:
+            return
+        while True:
+            stage.sample_depth()
+            try:
+                item = stage.queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if self.stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                return
+            if isinstance(item, _StageError):
+                raise item.error
+            yield item
+
+    def _run_stage(self, stage: Stage, upstream: Optional[Stage]):
+        stage.started = time.monotonic()
+        try:
+            for item in stage.fn(self._drain(upstream)):
+                if not self._put(stage, item):
+                    return
+                stage.items += 1
+        except BaseException as e:
+            self._put(stage, _StageError(e))
+        finally:
+            stage.finished = time.monotonic()
+            self._put(stage, _DONE)
+
+    def run(self) -> Iterator:
+        # Yields the last stage's output on the calling thread
+        upstream = None
+        threads = []
+        for stage in self.stages:
+            thread = threading.Thread(target=self._run_stage, args=(stage, upstream),
+                                      name=f"pipeline-{stage.name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+            upstream = stage
+        try:
+            yield from self._drain(upstream)
+        finally:
+            self.stop.set()
+            for thread in threads:
+                thread.join()
+
+    def report(self):
+        print(f"{'stage':<10} {'items':>7} {'items/s':>9} {'avg queue':>9} {'max queue':>9}")
+        for stage in self.stages:
+            avg_depth = stage.depth_total / stage.depth_samples if stage.depth_samples else 0
+            print(f"{stage.name:<10} {stage.items:>7} {stage.throughput():>9.1f} "
+                  f"{avg_depth:>9.1f} {stage.depth_max:>9}")
@@ -0,0 +1,98 @@
+import re
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from segment import HEADER_SAMPLE_PAGES
+
+# Configuration
+PREFILTER_THRESHOLD = 0.5  # Junk probability above which a paragraph never reaches the LLM
+PREFILTER_BATCH = 32  # Paragraphs scored per vectorized batch
+REPEATED_LINE_MIN_PAGES = 3  # A line seen on this many pages is treated as a running header/footer
+SHORT_LINE_WORDS = 4
+
+BOILERPLATE_TERMS = re.compile(
+    r"\b(contents|index|list of (tables|charts|figures|boxes)|disclaimer|copyright|all rights reserved|"
+    r"annual report \d{4}|page \d+)\b", re.I)
+DOT_LEADER_RE = re.compile(r"(\.\s?){4,}|…|_{4,}")
+PUNCT_RE = re.compile(r"[^\w\s]")
+DIGIT_RE = re.compile(r"\d")
+
+FEATURES = ["digit_ratio", "punct_ratio", "dot_leader_ratio", "repeated_line_ratio",
+            "short_line_ratio", "non_alpha_word_ratio", "boilerplate_terms"]
+# Hand-tuned logistic weights (same order as FEATURES); calibrate with eval_prefilter.py
+WEIGHTS = np.array([9.0, 8.0, 6.0, 5.0, 3.0, 6.0, 1.5])
+BIAS = -4.0
+
+class PageLineCounter:
+    # Counts on how many pages each (digit-normalised) line occurs. Only the first
+    # HEADER_SAMPLE_PAGES pages are counted: the Segmenter buffers that many before yielding
+    # a paragraph, so the counts are final before anything is scored, however far extraction
+    # has run ahead, and every run, resume and rag.py build sees the same ones.
+    def __init__(self, sample_pages: int = HEADER_SAMPLE_PAGES):
+        self.sample_pages = sample_pages
+        self.pages_seen = 0
+        self.counts = Counter()
+
+    @staticmethod
+    def normalize(line: str) -> str:
+        return re.sub(r"\d+", "#", line.strip().lower())
+
+    def observe(self, pages: Iterable[str]) -> Iterator[str]:
+        # Pass-through pipeline stage
+        for text in pages:
+            if self.pages_seen < self.sample_pages:
+                self.pages_seen += 1
+                self.counts.update({self.normalize(line) for line in text.splitlines() if line.strip()})
+            yield text
+
+    def is_repeated(self, line: str) -> bool:
+        return self.counts[self.normalize(line)] >= REPEATED_LINE_MIN_PAGES
+
+def paragraph_features(text: str, line_counter: Optional[PageLineCounter] = None) -> List[float]:
+    chars = len(text) - text.count(" ") - text.count("\n") or 1
+    lines = [line for line in text.splitlines() if line.strip()] or [text]
+    words = text.split() or [""]
+    return [
+        len(DIGIT_RE.findall(text)) / chars,
+        len(PUNCT_RE.findall(text)) / chars,
+        sum(1 for line in lines if DOT_LEADER_RE.search(line)) / len(lines),
+        sum(1 for line in lines if line_counter and line_counter.is_repeated(line)) / len(lines),
+        sum(1 for line in lines if len(line.split()) < SHORT_LINE_WORDS) / len(lines),
+        sum(1 for word in words if not word.strip(".,;:()'\"").isalpha()) / len(words),
+        min(len(BOILERPLATE_TERMS.findall(text)), 3),
+    ]
+
+def feature_matrix(texts: List[str], line_counter: Optional[PageLineCounter] = None) -> np.ndarray:
+    return np.array([paragraph_features(t, line_counter) for t in texts], dtype=np.float64).reshape(-1, len(FEATURES))
+
+def junk_scores(texts: List[str], line_counter: Optional[PageLineCounter] = None) -> np.ndarray:
+    return 1 / (1 + np.exp(-(feature_matrix(texts, line_counter) @ WEIGHTS + BIAS)))
+
+class PreFilter:
+    # Cheap local classifier run before the LLM stage for the artefacts the prompt asks
+    # Gemini to reject: tables of contents, indexes, disclaimers, header/footer debris.
+    def __init__(self, threshold: float = PREFILTER_THRESHOLD, line_counter: Optional[PageLineCounter] = None):
+        self.threshold = threshold
+        self.line_counter = line_counter or PageLineCounter()
+        self.seen = 0
+        self.skipped = 0
+
+    def _score_batch(self, batch: List[Tuple[int, List[str], str]]) -> Iterator[Tuple[int, List[str], str]]:
+        scores = junk_scores([target for _, _, target in batch], self.line_counter)
+        self.seen += len(batch)
+        for item, score in zip(batch, scores):
+            if score >= self.threshold:
+                self.skipped += 1
+            else:
+                yield item
+
+    def filter_items(self, items: Iterable[Tuple[int, List[str], str]]) -> Iterator[Tuple[int, List[str], str]]:
+        # Pipeline stage over (index, context, target) items; indices of dropped items are left as gaps
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= PREFILTER_BATCH:
+                yield from self._score_batch(batch)
+                batch = []
+        if batch:
+            yield from self._score_batch(batch)
@@ -1,39 +1,334 @@
+import os
+import re
+import sys
+import glob
 import json
 import random
-from sklearn.model_selection import train_test_split
+import shutil
+import hashlib
+from typing import Dict, Iterator, List, Optional, Tuple
+from chat_format import format_chatml
+from dataset_store import DATASET_FILE, TRACKER_FILE, Tracker, atomic_write_json, iter_file_entries, migrate_legacy
+from dedup import NearDuplicateIndex
+from token_counts import TokenCounter
 
-INPUT_FILE = "dataset.json"
-OUTPUT_FILE = "finetune_dataset.json"
+INPUT_FILE = DATASET_FILE
+OUTPUT_DIR = "finetune_data"
+DEDUPLICATE_PAIRS = True
+MAX_SEQ_LENGTH = 2048  # Must match max_seq_length in train.py
+OVER_BUDGET = "split"  # "split" long answers into several samples, or "drop" them
+BUCKET_BOUNDARIES = [128, 256, 512, 1024, 2048]
+VAL_FRACTION = 0.1
+TRAIN_BATCH_SIZE = 2  # per_device_train_batch_size in train.py, used for the padding report
+CHUNK_SIZE = 1024  # Entries tokenized per batch
+MANIFEST_FILE = os.path.join(OUTPUT_DIR, "manifest.json")
+SOURCES_DIR = os.path.join(OUTPUT_DIR, "sources")  # Per-report sample lengths and stats
+PAIR_INDEX_FILE = os.path.join(OUTPUT_DIR, "pair_index.npz")
+INSTRUCTION = "Answer the question based on the provided context from the financial report."
+
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.?!])\s+")
 
 def convert_to_alpaca(entry):
     return {
-        "instruction": "Answer the question based on the provided context from the financial report.",
+        "instruction": INSTRUCTION,
         "input": f"Question: {entry['question']}",
         "output": entry['answer']
     }
 
+def sample_text(sample: Dict) -> str:
+    return format_chatml(sample["instruction"], sample["input"], sample["output"])
+
+def split_of(sample: Dict) -> str:
+    # Hash of the question, so a pair keeps its split as the dataset grows
+    digest = hashlib.sha256(sample["input"].encode('utf-8')).digest()
+    return "validation" if int.from_bytes(digest[:4], "big") / 2**32 < VAL_FRACTION else "train"
+
+def bucket_of(num_tokens: int) -> int:
+    for boundary in BUCKET_BOUNDARIES:
+        if num_tokens <= boundary:
+            return boundary
+    return BUCKET_BOUNDARIES[-1]
+
+def shard_name(source: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", source) + ".jsonl"
+
+def split_over_budget(sample: Dict, counter: TokenCounter) -> List[Tuple[Dict, int]]:
+    # Breaks the answer at sentence boundaries into parts that each fit MAX_SEQ_LENGTH
+    overhead = counter.count([sample_text(dict(sample, output=""))])[0]
+    budget = MAX_SEQ_LENGTH - overhead
+    sentences = SENTENCE_SPLIT_RE.split(sample["output"])
+    parts, current, used = [], [], 0
+    for sentence, tokens in zip(sentences, counter.count(sentences)):
+        if tokens > budget:
+            continue  # A single sentence that cannot fit is dropped
+        if current and used + tokens + 1 > budget:
+            parts.append(" ".join(current))
+            current, used = [], 0
+        current.append(sentence)
+        used += tokens + 1
+    if current:
+        parts.append(" ".join(current))
+    samples = [dict(sample, output=part) for part in parts]
+    counts = counter.count([sample_text(s) for s in samples]) if samples else []
+    return [(s, n) for s, n in zip(samples, counts) if n <= MAX_SEQ_LENGTH]
+
+def padding_efficiency(lengths: List[int], batch_size: int, bucketed: bool, seed: int = 3407) -> float:
+    # Real tokens / tokens after padding each batch to its longest sample
+    rng = random.Random(seed)
+    groups = {}
+    for n in lengths:
+        groups.setdefault(bucket_of(n) if bucketed else 0, []).append(n)
+    real = padded = 0
+    for group in groups.values():
+        rng.shuffle(group)
+        for start in range(0, len(group), batch_size):
+            batch = group[start:start + batch_size]
+            real += sum(batch)
+            padded += max(batch) * len(batch)
+    return real / padded if padded else 1.0
+
+class ShardWriter:
+    # finetune_data/<split>/bucket-<max tokens>/<source report>.jsonl. Entries of one report are
+    # contiguous in the dataset log, so only the current report's shards are kept open.
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self.source = None
+        self.files = {}
+
+    def write(self, split: str, bucket: int, source: str, record: Dict):
+        if source != self.source:
+            self.close()
+            self.source = source
+        key = (split, bucket)
+        if key not in self.files:
+            directory = os.path.join(self.output_dir, split, f"bucket-{bucket:04d}")
+            os.makedirs(directory, exist_ok=True)
+            self.files[key] = open(os.path.join(directory, shard_name(source)), 'a', encoding='utf-8')
+        self.files[key].write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+def iter_samples(entries: Iterator[Dict], source: str, stats: Dict,
+                 index: Optional[NearDuplicateIndex], duplicate_of: set) -> Iterator[Dict]:
+    # Near-duplicate Q&A pairs (boilerplate repeated across years) are dropped. The index is
+    # kept with the output, so a new report is checked against every report already prepared.
+    # duplicate_of collects the other reports the dropped pairs matched.
+    for i, entry in enumerate(entries):
+        stats["loaded"] += 1
+        match = None
+        if index is not None:
+            match = index.check_and_add(f"{source}#{i}", f"{entry['question']}\n{entry['answer']}")
+        if match:
+            stats["duplicates"] += 1
+            if not match.startswith(f"{source}#"):
+                duplicate_of.add(match.rsplit("#", 1)[0])
+            continue
+        yield convert_to_alpaca(entry)
+
+def chunked(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def config_fingerprint(tokenizer_identity: str) -> str:
+    # Anything that changes the samples of every report forces a full rebuild
+    config = [MAX_SEQ_LENGTH, OVER_BUDGET, BUCKET_BOUNDARIES, VAL_FRACTION, INSTRUCTION, DEDUPLICATE_PAIRS,
+              tokenizer_identity, format_chatml("\0instruction\0", "\0input\0", "\0output\0")]
+    return hashlib.sha256(json.dumps(config).encode('utf-8')).hexdigest()
+
+def source_path(source: str) -> str:
+    return os.path.join(SOURCES_DIR, shard_name(source)[:-len(".jsonl")] + ".json")
+
+def read_source(source: str) -> Optional[Dict]:
+    if not os.path.exists(source_path(source)):
+        return None
+    with open(source_path(source), 'r') as f:
+        return json.load(f)
+
+def add_totals(manifest: Dict, record: Dict, sign: int = 1):
+    # Running totals over the prepared reports: a histogram of sample lengths per split (JSON keys
+    # are strings) and samples per bucket; sign=-1 takes a report's sidecar record back out
+    for split, lengths in record["lengths"].items():
+        counts = manifest["length_counts"][split]
+        for n in lengths:
+            counts[str(n)] = counts.get(str(n), 0) + sign
+            if not counts[str(n)]:
+                del counts[str(n)]
+    for key, n in record["buckets"].items():
+        manifest["buckets"][key] = manifest["buckets"].get(key, 0) + sign * n
+        if not manifest["buckets"][key]:
+            del manifest["buckets"][key]
+
+def remove_source(source: str, index: Optional[NearDuplicateIndex]):
+    # Globbed rather than taken from the manifest, so shards of an interrupted run are found too
+    for path in glob.glob(os.path.join(glob.escape(OUTPUT_DIR), "*", "bucket-*", glob.escape(shard_name(source)))):
+        os.remove(path)
+    if os.path.exists(source_path(source)):
+        os.remove(source_path(source))
+    if index is not None:
+        index.remove_prefix(f"{source}#")
+
+def prepare_source(source: str, active: Dict, counter: TokenCounter, writer: ShardWriter,
+                   index: Optional[NearDuplicateIndex]) -> Dict:
+    # Writes the shards of one report's active generation and returns its sidecar record
+    stats = {"loaded": 0, "duplicates": 0, "over_budget": 0, "split_parts": 0, "dropped": 0}
+    lengths = {"train": [], "validation": []}
+    buckets = {}
+    sample_entry = None
+    duplicate_of = set()
+    samples = iter_samples(iter_file_entries(active, source, INPUT_FILE), source, stats, index, duplicate_of)
+    for chunk in chunked(samples, CHUNK_SIZE):
+        counts = counter.count([sample_text(sample) for sample in chunk])
+        for sample, num_tokens in zip(chunk, counts):
+            parts = [(sample, num_tokens)]
+            if num_tokens > MAX_SEQ_LENGTH:
+                stats["over_budget"] += 1
+                parts = split_over_budget(sample, counter) if OVER_BUDGET == "split" else []
+                stats["split_parts"] += len(parts)
+                stats["dropped"] += 0 if parts else 1
+            for part, part_tokens in parts:
+                split = split_of(part)
+                bucket = bucket_of(part_tokens)
+                writer.write(split, bucket, source, dict(part, num_tokens=part_tokens))
+                lengths[split].append(part_tokens)
+                buckets[f"{split}/{bucket}"] = buckets.get(f"{split}/{bucket}", 0) + 1
+                sample_entry = sample_entry or part
+    writer.close()
+    return {"generation": active["generation"], "sha256": active["sha256"], "stats": stats,
+            "lengths": lengths, "buckets": buckets, "sample_entry": sample_entry,
+            "duplicate_of": sorted(duplicate_of)}
+
+def dependents(sources: Dict, dirty: List[str]) -> List[str]:
+    # Prepared reports that dropped pairs as near-duplicates of a dirty (removed or changed)
+    # report, transitively: those pairs may no longer have a match, so the report is redone
+    found, pending = set(), list(dirty)
+    while pending:
+        target = pending.pop()
+        for source in sources:
+            if source in found or source in dirty or not os.path.exists(source_path(source)):
+                continue
+            with open(source_path(source), 'r') as f:
+                if target in json.load(f).get("duplicate_of", []):
+                    found.add(source)
+                    pending.append(source)
+    return sorted(found)
+
 def main():
-    try:
-        with open(INPUT_FILE, 'r') as f:
-            data = json.load(f)
-    except FileNotFoundError:
+    # python prepare_finetune_dataset.py [--rebuild]
+    # Only reports whose active generation changed since the last run are (re)written, together
+    # with the reports whose dropped near-duplicates matched them; the rest of finetune_data/ is
+    # left untouched. An untouched report is not re-checked against pairs a redone report now
+    # keeps, so the two may both hold a near-duplicate; --rebuild starts from scratch and gives
+    # exactly the from-scratch result.
+    migrate_legacy()
+    if not os.path.exists(INPUT_FILE):
         print(f"Error: {INPUT_FILE} not found.")
-        return
-
-    print(f"Loaded {len(data)} entries.")
-    
-    alpaca_data = [convert_to_alpaca(entry) for entry in data]
-    
-    # Optional: Split into train/val if we had enough data, but for now just save all
-    # If we want to be fancy:
-    # train, val = train_test_split(alpaca_data, test_size=0.1, random_state=42)
-    
-    with open(OUTPUT_FILE, 'w') as f:
-        json.dump(alpaca_data, f, indent=2)
-    
-    print(f"Saved {len(alpaca_data)} entries to {OUTPUT_FILE} in Alpaca format.")
-    print("Sample entry:")
-    print(json.dumps(alpaca_data[0], indent=2))
+        return False
+
+    counter = TokenCounter()
+    config = config_fingerprint(counter.identity)
+    manifest = {}
+    if os.path.exists(MANIFEST_FILE) and "--rebuild" not in sys.argv[1:]:
+        with open(MANIFEST_FILE, 'r') as f:
+            manifest = json.load(f)
+    if manifest.get("config") != config:
+        if manifest:
+            print("Settings or tokenizer changed since the last run; rebuilding all shards.")
+        shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
+        manifest = {"config": config, "sources": {}}
+    os.makedirs(SOURCES_DIR, exist_ok=True)
+
+    tracker = Tracker(TRACKER_FILE, INPUT_FILE)
+    actives = {filename: s["active"] for filename, s in tracker.data["files"].items() if s["active"]}
+    index = NearDuplicateIndex(filepath=PAIR_INDEX_FILE) if DEDUPLICATE_PAIRS else None
+    writer = ShardWriter(OUTPUT_DIR)
+    sources = manifest["sources"]
+    removed = [source for source in sources if source not in actives]
+    stale = [source for source, active in actives.items()
+             if sources.get(source) != {"generation": active["generation"], "sha256": active["sha256"]}]
+    restored = dependents(sources, removed + stale)
+    changed = [source for source, active in sorted(actives.items(), key=lambda item: item[1]["start_offset"] or 0)
+               if source in stale or source in restored]
+    # Totals cover the reports listed in the manifest whenever it is written: the old records of
+    # removed and redone reports come out here, each redone one goes back in as it is written.
+    # A manifest from before the running totals, or a sidecar an interrupted run already deleted,
+    # means a recount from every sidecar at the end.
+    recount = bool(sources) and "length_counts" not in manifest
+    manifest.setdefault("length_counts", {"train": {}, "validation": {}})
+    manifest.setdefault("buckets", {})
+    for source in removed + [source for source in changed if source in sources]:
+        record = read_source(source)
+        if record is None:
+            recount = True
+        elif not recount:
+            add_totals(manifest, record, -1)
+    for source in removed:
+        remove_source(source, index)
+        del sources[source]
+
+    sample_entry = None
+    totals = {"loaded": 0, "duplicates": 0, "over_budget": 0, "split_parts": 0, "dropped": 0}
+    # Every old pair goes first, so an earlier report is not checked against a later one's old pairs
+    for source in changed:
+        remove_source(source, index)
+        sources.pop(source, None)
+    atomic_write_json(MANIFEST_FILE, manifest, indent=2)
+    for source in changed:
+        record = prepare_source(source, actives[source], counter, writer, index)
+        atomic_write_json(source_path(source), record)
+        for key, value in record["stats"].items():
+            totals[key] += value
+        sample_entry = sample_entry or record["sample_entry"]
+        add_totals(manifest, record)
+        # Shards, then the pair index, then the manifest: an interrupted source is redone next run
+        if index is not None:
+            index.save()
+        sources[source] = {"generation": record["generation"], "sha256": record["sha256"]}
+        atomic_write_json(MANIFEST_FILE, manifest, indent=2)
+    if removed and index is not None:
+        index.save()
+
+    if recount:
+        manifest.update(length_counts={"train": {}, "validation": {}}, buckets={})
+        for source in sources:
+            add_totals(manifest, read_source(source))
+    counts = manifest["length_counts"]
+    manifest.update({
+        "max_seq_length": MAX_SEQ_LENGTH,
+        "tokenizer": counter.identity,
+        "samples": {split: sum(c.values()) for split, c in counts.items()},
+        "tokens": {split: sum(int(n) * k for n, k in c.items()) for split, c in counts.items()},
+    })
+    atomic_write_json(MANIFEST_FILE, manifest, indent=2)
+    counter.close()
+
+    print(f"{len(changed)} reports prepared ({len(restored)} to re-check near-duplicates), "
+          f"{len(sources) - len(changed)} unchanged, {len(removed)} removed.")
+    print(f"Loaded {totals['loaded']} entries.")
+    print(f"Dropped {totals['duplicates']} near-duplicate Q&A pairs.")
+    print(f"{totals['over_budget']} samples exceeded {MAX_SEQ_LENGTH} tokens: "
+          f"{totals['split_parts']} parts kept, {totals['dropped']} dropped.")
+    print(f"Token counts: {counter.hits} cached, {counter.misses} tokenized.")
+    print(f"{manifest['samples']['train']} train / {manifest['samples']['validation']} validation samples "
+          f"in {OUTPUT_DIR}/")
+    train_lengths = sorted(int(n) for n, k in counts["train"].items() for _ in range(k))
+    if train_lengths:
+        random_eff = padding_efficiency(train_lengths, TRAIN_BATCH_SIZE, bucketed=False)
+        bucketed_eff = padding_efficiency(train_lengths, TRAIN_BATCH_SIZE, bucketed=True)
+        print(f"Padding efficiency at batch size {TRAIN_BATCH_SIZE}: {random_eff:.1%} random order -> "
+              f"{bucketed_eff:.1%} length-bucketed ({bucketed_eff / random_eff:.2f}x real tokens per padded token)")
+    if sample_entry:
+        print("Sample entry:")
+        print(json.dumps(sample_entry, indent=2))
+    return True
 
 if __name__ == "__main__":
-    main()
+    sys.exit(0 if main() else 1)
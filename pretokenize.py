@@ -0,0 +1,113 @@
+import os
+import json
+import shutil
+import hashlib
+from typing import Iterator, List, Sequence, Tuple
+import numpy as np
+from chat_format import format_chatml
+
+# Configuration
+PRETOKENIZED_DIR = os.path.join(".cache", "pretokenized")
+KEEP_ARTIFACTS = 3  # Most recently used artifacts kept; older ones are deleted
+ENCODE_CHUNK = 1024  # Samples tokenized per batch
+FORMAT_VERSION = "1"  # Bump when the artifact layout changes
+
+def tokenizer_fingerprint(tokenizer) -> str:
+    digest = hashlib.sha256(type(tokenizer).__name__.encode('utf-8'))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        digest.update(backend.to_str().encode('utf-8'))
+    else:
+        digest.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode('utf-8'))
+    return digest.hexdigest()
+
+def dataset_key(data_files: Sequence[str], tokenizer) -> str:
+    # Hash of the data, the chat template and the tokenizer: any change means re-tokenizing
+    digest = hashlib.sha256(FORMAT_VERSION.encode('utf-8'))
+    digest.update(format_chatml("\0instruction\0", "\0input\0", "\0output\0").encode('utf-8'))
+    digest.update(tokenizer_fingerprint(tokenizer).encode('utf-8'))
+    for path in data_files:
+        digest.update(os.path.basename(path).encode('utf-8') + b"\0")
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+def iter_texts(data_files: Sequence[str]) -> Iterator[str]:
+    for path in data_files:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    sample = json.loads(line)
+                    yield format_chatml(sample["instruction"], sample["input"], sample["output"])
+
+class PretokenizedDataset:
+    # tokens.bin holds every sample's token ids back to back (uint32); offsets.npy has the
+    # n + 1 sample boundaries. Both are memory-mapped, so opening is O(1) and samples are views.
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), 'r') as f:
+            self.meta = json.load(f)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+        if self.meta["num_tokens"]:
+            self.tokens = np.memmap(os.path.join(path, "tokens.bin"), dtype=np.uint32, mode='r')
+        else:
+            self.tokens = np.zeros(0, dtype=np.uint32)  # mmap cannot map an empty file
+        self.lengths = np.diff(self.offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+def build(data_files: Sequence[str], tokenizer, path: str, key: str):
+    # Streams samples through the tokenizer into a temporary directory published by rename
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    offsets: List[int] = [0]
+
+    def encode(chunk: List[str], out):
+        for ids in tokenizer(chunk, add_special_tokens=False)["input_ids"]:
+            out.write(np.asarray(ids, dtype=np.uint32).tobytes())
+            offsets.append(offsets[-1] + len(ids))
+
+    with open(os.path.join(tmp_path, "tokens.bin"), 'wb') as out:
+        chunk = []
+        for text in iter_texts(data_files):
+            chunk.append(text)
+            if len(chunk) == ENCODE_CHUNK:
+                encode(chunk, out)
+                chunk = []
+        if chunk:
+            encode(chunk, out)
+        out.flush()
+        os.fsync(out.fileno())
+    np.save(os.path.join(tmp_path, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+    with open(os.path.join(tmp_path, "meta.json"), 'w') as f:
+        json.dump({"key": key, "num_samples": len(offsets) - 1, "num_tokens": offsets[-1],
+                   "data_files": [os.path.basename(p) for p in data_files]}, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+def prune(cache_dir: str, keep: int = KEEP_ARTIFACTS):
+    entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if not name.endswith(".tmp")]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[keep:]:
+        shutil.rmtree(path, ignore_errors=True)
+
+def load_or_build(data_files: Sequence[str], tokenizer, cache_dir: str = PRETOKENIZED_DIR) -> Tuple[PretokenizedDataset, bool]:
+    # Returns (dataset, cache hit)
+    key = dataset_key(sorted(data_files), tokenizer)
+    path = os.path.join(cache_dir, key[:16])
+    hit = os.path.exists(os.path.join(path, "meta.json"))
+    if hit:
+        os.utime(path)
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        build(sorted(data_files), tokenizer, path, key)
+        prune(cache_dir)
+    return PretokenizedDataset(path), hit
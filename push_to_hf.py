@@ -1,58 +1,299 @@
 import os
-from huggingface_hub import HfApi, create_repo
+import sys
+import json
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from huggingface_hub import CommitOperationAdd, HfApi, create_repo, hf_hub_download
+from huggingface_hub.utils import EntryNotFoundError
 from dotenv import load_dotenv
+from dataset_store import atomic_write_json
 
 load_dotenv()
 
 # Configuration
 # You can set HF_USERNAME in .env or replace it here
-HF_USERNAME = os.getenv("HF_USERNAME", "ravikadam") 
+HF_USERNAME = os.getenv("HF_USERNAME", "ravikadam")
 MODEL_NAME = "qwen2.5-7b-rbi"
 REPO_ID = f"{HF_USERNAME}/{MODEL_NAME}"
 GGUF_FILE = "qwen2.5_7b_finetuned-Q4_K_M.gguf"
 LORA_DIR = "lora_model"
+LORA_PATH_IN_REPO = "lora_adapters"
+PUBLISHED_MANIFEST = "upload_manifest.json"  # In the repo: path -> sha256 and size of what was pushed
+HASH_CACHE = os.path.join(".cache", "push", "hashes.json")  # (size, mtime) -> sha256 of local files
+LOCAL_HUB_DIR = os.environ.get("PUSH_LOCAL_HUB", "")  # Push to a directory instead of the Hub (testing)
+CHUNK_SIZE = 64 * 2**20
+UPLOAD_WORKERS = 8
+
+class HashCache:
+    # Hashing a multi-GB GGUF takes seconds; unchanged files (same size and mtime) reuse the last digest
+    def __init__(self, filepath: Optional[str] = HASH_CACHE):
+        self.filepath = filepath
+        self.data = {}
+        if filepath and os.path.exists(filepath):
+            with open(filepath, 'r') as f:
+                self.data = json.load(f)
+        self.hashed_bytes = 0
+
+    def sha256(self, path: str) -> str:
+        stat = os.stat(path)
+        memo = self.data.get(os.path.abspath(path))
+        if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+            return memo[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        self.hashed_bytes += stat.st_size
+        self.data[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def save(self):
+        if self.filepath:
+            os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+            atomic_write_json(self.filepath, self.data)
+
+def collect_files(gguf_file: str = GGUF_FILE, lora_dir: str = LORA_DIR) -> List[Tuple[str, str]]:
+    # (local path, path in repo) of everything we publish
+    files = []
+    if os.path.exists(gguf_file):
+        files.append((gguf_file, os.path.basename(gguf_file)))
+    else:
+        print(f"Warning: GGUF file {gguf_file} not found. Skipping.")
+    if os.path.isdir(lora_dir):
+        for root, dirs, names in os.walk(lora_dir):
+            dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+            for name in sorted(names):
+                if not name.startswith("."):
+                    path = os.path.join(root, name)
+                    files.append((path, "/".join([LORA_PATH_IN_REPO, os.path.relpath(path, lora_dir).replace(os.sep, "/")])))
+    else:
+        print(f"Warning: LoRA directory {lora_dir} not found. Skipping.")
+    return files
+
+class LocalHub:
+    # Filesystem stand-in for the Hub: a content-addressed object store filled through a multipart
+    # protocol (start / put_part / complete, parts kept until complete so uploads resume), and a repo
+    # directory updated by commit(). part_bandwidth (bytes/s) throttles each part like one connection;
+    # fail_after_parts makes put_part fail after that many parts, as an interrupted upload would.
+    def __init__(self, root: str, repo_id: str = REPO_ID, part_bandwidth: Optional[float] = None,
+                 fail_after_parts: Optional[int] = None):
+        self.repo_dir = os.path.join(root, repo_id)
+        self.objects_dir = os.path.join(root, ".objects")
+        self.uploads_dir = os.path.join(root, ".uploads")
+        for path in (self.repo_dir, self.objects_dir, self.uploads_dir):
+            os.makedirs(path, exist_ok=True)
+        self.part_bandwidth = part_bandwidth
+        self.fail_after_parts = fail_after_parts
+        self.lock = threading.Lock()
+        self.parts_received = 0
+
+    def published(self) -> Dict[str, Dict]:
+        path = os.path.join(self.repo_dir, PUBLISHED_MANIFEST)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def has_object(self, sha256: str) -> bool:
+        return os.path.exists(os.path.join(self.objects_dir, sha256))
+
+    def start(self, sha256: str, size: int, chunk_size: int) -> List[int]:
+        # Returns the parts already received for this object by an earlier, interrupted upload
+        upload_dir = os.path.join(self.uploads_dir, sha256)
+        meta_path = os.path.join(upload_dir, "upload.json")
+        meta = {"size": size, "chunk_size": chunk_size}
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                if json.load(f) == meta:
+                    return sorted(int(name.split("-")[1]) for name in os.listdir(upload_dir) if name.startswith("part-"))
+            shutil.rmtree(upload_dir)
+        os.makedirs(upload_dir, exist_ok=True)
+        atomic_write_json(meta_path, meta)
+        return []
+
+    def put_part(self, sha256: str, index: int, data: bytes):
+        with self.lock:
+            if self.fail_after_parts is not None and self.parts_received >= self.fail_after_parts:
+                raise ConnectionError("Injected upload failure")
+            self.parts_received += 1
+        if self.part_bandwidth:
+            time.sleep(len(data) / self.part_bandwidth)
+        path = os.path.join(self.uploads_dir, sha256, f"part-{index:06d}")
+        with open(f"{path}.tmp", 'wb') as f:
+            f.write(data)
+        os.replace(f"{path}.tmp", path)
+
+    def complete(self, sha256: str, size: int):
+        # Joins the parts and checks the digest; a bad object is discarded with its parts
+        upload_dir = os.path.join(self.uploads_dir, sha256)
+        object_path = os.path.join(self.objects_dir, sha256)
+        digest = hashlib.sha256()
+        with open(f"{object_path}.tmp", 'wb') as out:
+            for name in sorted(n for n in os.listdir(upload_dir) if n.startswith("part-")):
+                with open(os.path.join(upload_dir, name), 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(block)
+                        out.write(block)
+        if digest.hexdigest() != sha256 or os.path.getsize(f"{object_path}.tmp") != size:
+            os.remove(f"{object_path}.tmp")
+            shutil.rmtree(upload_dir)
+            raise ValueError(f"Upload of {sha256[:12]} is corrupt; its parts were discarded")
+        os.replace(f"{object_path}.tmp", object_path)
+        shutil.rmtree(upload_dir)
+
+    def commit(self, entries: List[Dict], manifest: Dict[str, Dict]):
+        for entry in entries:
+            path = os.path.join(self.repo_dir, entry["path"])
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(os.path.join(self.objects_dir, entry["sha256"]), f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        atomic_write_json(os.path.join(self.repo_dir, PUBLISHED_MANIFEST), manifest, indent=2)
+
+class HfHub:
+    # The real Hub. Large files go through huggingface_hub's LFS upload (chunked and parallel, hf_xet
+    # when installed); an LFS object the Hub already holds is not sent again, so an interrupted push
+    # resumes from the files that made it. Everything lands in one commit with the manifest.
+    def __init__(self, repo_id: str = REPO_ID):
+        self.api = HfApi()
+        self.repo_id = repo_id
+
+    def published(self) -> Dict[str, Dict]:
+        try:
+            with open(hf_hub_download(self.repo_id, PUBLISHED_MANIFEST, repo_type="model"), 'r') as f:
+                manifest = json.load(f)
+        except EntryNotFoundError:
+            return {}
+        # Trust an entry only while the repo still has that file (and, for LFS files, that content)
+        remote = {f.path: f for f in self.api.list_repo_tree(self.repo_id, recursive=True, expand=True)
+                  if hasattr(f, "size")}
+        return {path: entry for path, entry in manifest.items() if path in remote and
+                (remote[path].lfs is None or remote[path].lfs.sha256 == entry["sha256"])}
+
+    def upload(self, entries: List[Dict], manifest: Dict[str, Dict], workers: int = UPLOAD_WORKERS):
+        additions = [CommitOperationAdd(path_in_repo=e["path"], path_or_fileobj=e["local"]) for e in entries]
+        self.api.preupload_lfs_files(self.repo_id, additions=additions, num_threads=workers)
+        additions.append(CommitOperationAdd(path_in_repo=PUBLISHED_MANIFEST,
+                                            path_or_fileobj=json.dumps(manifest, indent=2).encode('utf-8')))
+        self.api.create_commit(self.repo_id, operations=additions, repo_type="model",
+                               commit_message=f"Upload {len(entries)} changed file(s)")
+
+def upload_parts(hub: LocalHub, entries: List[Dict], chunk_size: int, workers: int) -> Dict:
+    # Parts of every changed file share one pool; each file is completed once all its parts are in
+    stats = {"bytes_uploaded": 0, "bytes_resumed": 0, "bytes_deduplicated": 0}
+    lock = threading.Lock()
+
+    def send(entry, index):
+        with open(entry["local"], 'rb') as f:
+            f.seek(index * chunk_size)
+            data = f.read(chunk_size)
+        hub.put_part(entry["sha256"], index, data)
+        with lock:
+            stats["bytes_uploaded"] += len(data)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending, started = [], set()
+        for entry in entries:
+            if entry["sha256"] in started or hub.has_object(entry["sha256"]):
+                stats["bytes_deduplicated"] += entry["size"]  # Same content already stored under another name
+                continue
+            started.add(entry["sha256"])
+            done = set(hub.start(entry["sha256"], entry["size"], chunk_size))
+            parts = max(1, -(-entry["size"] // chunk_size))
+            stats["bytes_resumed"] += sum(min(chunk_size, entry["size"] - i * chunk_size) for i in done)
+            pending.append((entry, [pool.submit(send, entry, i) for i in range(parts) if i not in done]))
+        for entry, futures in pending:
+            for future in futures:
+                future.result()
+            hub.complete(entry["sha256"], entry["size"])
+    return stats
+
+def push(hub, files: List[Tuple[str, str]], hashes: HashCache, chunk_size: int = CHUNK_SIZE,
+         workers: int = UPLOAD_WORKERS, force: bool = False, dry_run: bool = False) -> Dict:
+    start = time.perf_counter()
+    hashed_before = hashes.hashed_bytes
+    published = {} if force else hub.published()
+    entries = [{"local": local, "path": path, "sha256": hashes.sha256(local), "size": os.path.getsize(local)}
+               for local, path in files]
+    hashes.save()
+    hash_seconds = time.perf_counter() - start
+    changed = [e for e in entries if published.get(e["path"], {}).get("sha256") != e["sha256"]]
+    report = {"files": len(entries), "changed": [e["path"] for e in changed],
+              "bytes_total": sum(e["size"] for e in entries), "bytes_changed": sum(e["size"] for e in changed),
+              "bytes_uploaded": 0, "bytes_resumed": 0, "bytes_deduplicated": 0,
+              "hashed_bytes": hashes.hashed_bytes - hashed_before, "hash_seconds": hash_seconds}
+    if changed and not dry_run:
+        # Files no longer built locally stay published, as before
+        manifest = dict(published, **{e["path"]: {"sha256": e["sha256"], "size": e["size"]} for e in entries})
+        if isinstance(hub, HfHub):
+            # huggingface_hub does not say which LFS objects the Hub already held, so the bytes
+            # actually sent are unknown; only the changed bytes are reported
+            hub.upload(changed, manifest, workers)
+            report["bytes_uploaded"] = None
+        else:
+            report.update(upload_parts(hub, changed, chunk_size, workers))
+            hub.commit(changed, manifest)
+    report["bytes_skipped"] = report["bytes_total"] - report["bytes_changed"]
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def print_report(report: Dict):
+    mb = 2**20
+    print(f"{len(report['changed'])}/{report['files']} files changed: {report['bytes_changed'] / mb:.1f} MB of "
+          f"{report['bytes_total'] / mb:.1f} MB, {report['bytes_skipped'] / mb:.1f} MB skipped as already published")
+    for path in report["changed"]:
+        print(f"  {path}")
+    if report["bytes_resumed"] or report["bytes_deduplicated"]:
+        print(f"Not re-sent: {report['bytes_resumed'] / mb:.1f} MB from an interrupted upload, "
+              f"{report['bytes_deduplicated'] / mb:.1f} MB already stored under another name")
+    seconds = max(report["seconds"], 1e-9)
+    if report["bytes_uploaded"] is None:
+        sent = (f"Pushed {report['bytes_changed'] / mb:.1f} MB of changed files in {report['seconds']:.1f}s "
+                f"({report['bytes_changed'] / mb / seconds:.1f} MB/s of changed bytes, some possibly already on the Hub; ")
+    else:
+        sent = (f"Uploaded {report['bytes_uploaded'] / mb:.1f} MB in {report['seconds']:.1f}s "
+                f"({report['bytes_uploaded'] / mb / seconds:.1f} MB/s sent, ")
+    print(f"{sent}{report['bytes_total'] / mb / seconds:.1f} MB/s effective; "
+          f"hashed {report['hashed_bytes'] / mb:.1f} MB in {report['hash_seconds']:.1f}s)")
 
 def main():
+    # python push_to_hf.py [--dry-run] [--force] [--workers 8]
+    # PUSH_LOCAL_HUB=DIR pushes to a local directory laid out like the Hub instead
+    args = sys.argv[1:]
+
+    def option(flag, default):
+        return args[args.index(flag) + 1] if flag in args else default
+
     print("=== Pushing Model to Hugging Face ===")
-    
-    # Check for HF Token
-    if "HF_TOKEN" not in os.environ:
-        print("Error: HF_TOKEN not found in environment variables.")
-        print("Please add HF_TOKEN=your_token to your .env file.")
+    if LOCAL_HUB_DIR:
+        print(f"Using local hub at {LOCAL_HUB_DIR}")
+        hub = LocalHub(LOCAL_HUB_DIR, REPO_ID)
+    else:
+        # Check for HF Token
+        if "HF_TOKEN" not in os.environ:
+            print("Error: HF_TOKEN not found in environment variables.")
+            print("Please add HF_TOKEN=your_token to your .env file.")
+            return
+
+        print(f"Creating/Verifying repo: {REPO_ID}")
+        try:
+            create_repo(REPO_ID, repo_type="model", exist_ok=True)
+        except Exception as e:
+            print(f"Repo creation warning (might already exist): {e}")
+        hub = HfHub(REPO_ID)
+
+    report = push(hub, collect_files(), HashCache(), workers=int(option("--workers", UPLOAD_WORKERS)),
+                  force="--force" in args, dry_run="--dry-run" in args)
+    print_report(report)
+    if "--dry-run" in args:
+        print("Dry run: nothing uploaded.")
         return
 
-    api = HfApi()
-    
-    print(f"Creating/Verifying repo: {REPO_ID}")
-    try:
-        create_repo(REPO_ID, repo_type="model", exist_ok=True)
-    except Exception as e:
-        print(f"Repo creation warning (might already exist): {e}")
-
-    if os.path.exists(GGUF_FILE):
-        print(f"Uploading GGUF: {GGUF_FILE}...")
-        api.upload_file(
-            path_or_fileobj=GGUF_FILE,
-            path_in_repo=GGUF_FILE,
-            repo_id=REPO_ID,
-            repo_type="model",
-        )
-    else:
-        print(f"Warning: GGUF file {GGUF_FILE} not found. Skipping.")
-
-    if os.path.exists(LORA_DIR):
-        print(f"Uploading LoRA adapters from {LORA_DIR}...")
-        api.upload_folder(
-            folder_path=LORA_DIR,
-            repo_id=REPO_ID,
-            repo_type="model",
-            path_in_repo="lora_adapters",
-        )
-    else:
-        print(f"Warning: LoRA directory {LORA_DIR} not found. Skipping.")
-    
-    print("Upload complete!")
-    print(f"Model URL: https://huggingface.co/{REPO_ID}")
+    print("Upload complete!" if report["changed"] else "Nothing changed since the last push.")
+    print(f"Model URL: {hub.repo_dir if LOCAL_HUB_DIR else f'https://huggingface.co/{REPO_ID}'}")
 
 if __name__ == "__main__":
     main()
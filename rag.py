@@ -0,0 +1,478 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import hashlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from chat_format import format_chatml
+from dataset_store import atomic_write_json
+from embeddings import DEFAULT_EMBED_MODEL, Embedder, load_embedder
+from generate_dataset import REPORTS_DIR, clean_text, filter_paragraphs
+from pdf_extract import extract_pages, file_sha256
+from prefilter import PREFILTER_THRESHOLD, PageLineCounter, junk_scores
+from prepare_finetune_dataset import INSTRUCTION
+from segment import MAX_PARAGRAPH_TOKENS, estimate_tokens, segment_pages
+
+# Retrieval over the paragraphs generate_dataset.py extracts from Reports/. Each report's
+# passages and embeddings are cached under its content hash; the combined index is a
+# memory-mapped float32 embedding matrix stored in IVF (inverted file) order, so a query
+# reads only the few clusters nearest to it, plus a BM25 inverted index for keyword matches.
+
+# Configuration
+RAG_DIR = os.path.join(".cache", "rag")
+REPORT_CACHE_DIR = os.path.join(RAG_DIR, "reports")
+MANIFEST_FILE = os.path.join(RAG_DIR, "manifest.json")
+RAG_INDEX_VERSION = "1"  # Bump when the passage or index layout changes
+EMBED_MODEL = os.environ.get("RAG_EMBED_MODEL", DEFAULT_EMBED_MODEL)  # "none": BM25 index only
+USE_PREFILTER = True  # Leave TOCs, indexes and disclaimers out of the index (see prefilter.py)
+IVF_MIN_PASSAGES = 100_000  # Below this a flat scan takes a few ms (bench_rag.py), so no clustering
+IVF_NPROBE = 32  # Clusters scanned per query, out of ~sqrt(passages)
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE = 50_000  # Passages used to train the cluster centroids
+SCAN_ROWS = 16_384  # Rows multiplied at a time during a full scan
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60  # Reciprocal rank fusion constant for hybrid search
+FUSION_CANDIDATES = 50  # Results taken from each retriever before fusing
+TOP_K = 4
+CONTEXT_TOKEN_BUDGET = 1536  # Retrieved text that fits in Ollama's default 2048-token context
+SEARCH_MODES = ("hybrid", "dense", "bm25")
+
+WORD_RE = re.compile(r"\w+")
+STOPWORDS = set("a an and are as at be by for from has in is it of on or that the to was were with "
+                "what which who how when why does do did this these those its their".split())
+
+def tokenize(text: str) -> List[str]:
+    return [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+
+def config_fingerprint(embed_model: str) -> str:
+    # Everything that changes a report's passages or their vectors
+    settings = [RAG_INDEX_VERSION, embed_model, MAX_PARAGRAPH_TOKENS, USE_PREFILTER, PREFILTER_THRESHOLD]
+    return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:16]
+
+def report_passages(filepath: str, content_hash: Optional[str] = None) -> List[Tuple[int, str]]:
+    # (paragraph_index, text) with the indices generate_dataset.py gives the same paragraphs,
+    # so dataset entries point straight at their source passage
+    line_counter = PageLineCounter()
+    pages = list(line_counter.observe(extract_pages(filepath, content_hash=content_hash)))
+    paragraphs = list(enumerate(filter_paragraphs(segment_pages(pages))))
+    if USE_PREFILTER and paragraphs:
+        scores = junk_scores([text for _, text in paragraphs], line_counter)
+        paragraphs = [p for p, score in zip(paragraphs, scores) if score < PREFILTER_THRESHOLD]
+    return [(i, clean_text(text)) for i, text in paragraphs]
+
+def report_cache_prefix(content_hash: str, fingerprint: str) -> str:
+    return os.path.join(REPORT_CACHE_DIR, f"{content_hash[:32]}-{fingerprint}")
+
+def load_report_cache(prefix: str) -> Optional[Tuple[List[Tuple[int, str]], Optional[np.ndarray]]]:
+    # The passages file is written last, so its presence means the entry is complete
+    if not os.path.exists(f"{prefix}.json"):
+        return None
+    with open(f"{prefix}.json", 'r', encoding='utf-8') as f:
+        passages = [tuple(p) for p in json.load(f)]
+    embeddings = np.load(f"{prefix}.npy", mmap_mode="r") if os.path.exists(f"{prefix}.npy") else None
+    return passages, embeddings
+
+def save_report_cache(prefix: str, passages: List[Tuple[int, str]], embeddings: Optional[np.ndarray]):
+    os.makedirs(os.path.dirname(prefix), exist_ok=True)
+    if embeddings is not None:
+        np.save(f"{prefix}.tmp.npy", embeddings.astype(np.float32))
+        os.replace(f"{prefix}.tmp.npy", f"{prefix}.npy")
+    atomic_write_json(f"{prefix}.json", passages)
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    # Positions of the k highest scores, best first
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+def train_centroids(vectors: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+    # Spherical k-means on a sample: centroids are re-normalised means of their members
+    rng = np.random.default_rng(seed)
+    if len(vectors) > KMEANS_SAMPLE:
+        vectors = vectors[np.sort(rng.choice(len(vectors), KMEANS_SAMPLE, replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = assign_lists(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_lists)
+        empty = counts == 0
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+def assign_lists(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SCAN_ROWS):
+        block = np.asarray(vectors[start:start + SCAN_ROWS], dtype=np.float32)
+        assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assign
+
+def write_bm25(index_dir: str, texts: List[str]):
+    # CSR postings (one row per term) holding each passage's BM25 term weight, so a query only
+    # sums idf * weight over the postings of its terms
+    vocab: Dict[str, int] = {}
+    term_ids, doc_ids, tfs = [], [], []
+    lengths = np.zeros(len(texts), dtype=np.float32)
+    for doc, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        lengths[doc] = sum(counts.values())
+        for term, tf in counts.items():
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            doc_ids.append(doc)
+            tfs.append(tf)
+    term_ids = np.array(term_ids, dtype=np.int32)
+    doc_ids = np.array(doc_ids, dtype=np.int32)
+    tfs = np.array(tfs, dtype=np.float32)
+    order = np.argsort(term_ids, kind="stable")
+    df = np.bincount(term_ids, minlength=len(vocab))
+    avg_length = lengths.mean() if len(texts) else 1.0
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_ids] / max(avg_length, 1e-6))
+    weights = tfs * (BM25_K1 + 1) / (tfs + norm)
+    np.save(os.path.join(index_dir, "bm25_offsets.npy"), np.concatenate([[0], np.cumsum(df)]).astype(np.int64))
+    np.save(os.path.join(index_dir, "bm25_docs.npy"), doc_ids[order])
+    np.save(os.path.join(index_dir, "bm25_weights.npy"), weights[order].astype(np.float32))
+    np.save(os.path.join(index_dir, "bm25_idf.npy"),
+            np.log1p((len(texts) - df + 0.5) / (df + 0.5)).astype(np.float32))
+    with open(os.path.join(index_dir, "bm25_vocab.json"), 'w', encoding='utf-8') as f:
+        json.dump(list(vocab), f, ensure_ascii=False)
+
+def write_dense(index_dir: str, chunks: List[np.ndarray], seed: int = 0) -> int:
+    # Rows are written grouped by nearest centroid, so each cluster is one contiguous slice
+    total = sum(len(c) for c in chunks)
+    dim = chunks[0].shape[1]
+    n_lists = int(np.sqrt(total)) if total >= IVF_MIN_PASSAGES else 1
+    if n_lists > 1:
+        rng = np.random.default_rng(seed)
+        # Proportional sample of every report for training the centroids
+        sample = np.concatenate([np.asarray(c[np.sort(rng.choice(len(c), min(len(c), KMEANS_SAMPLE * len(c) // total + 1),
+                                                                 replace=False))]) for c in chunks])
+        centroids = train_centroids(sample, n_lists, seed)
+        assign = np.concatenate([assign_lists(c, centroids) for c in chunks])
+    else:
+        centroids = np.zeros((1, dim), dtype=np.float32)
+        assign = np.zeros(total, dtype=np.int32)
+    order = np.argsort(assign, kind="stable")
+    position = np.empty(total, dtype=np.int64)
+    position[order] = np.arange(total)
+    matrix = np.lib.format.open_memmap(os.path.join(index_dir, "embeddings.npy"), mode="w+",
+                                       dtype=np.float32, shape=(total, dim))
+    start = 0
+    for chunk in chunks:
+        matrix[position[start:start + len(chunk)]] = chunk
+        start += len(chunk)
+    matrix.flush()
+    del matrix
+    np.save(os.path.join(index_dir, "ivf_ids.npy"), order.astype(np.int32))
+    np.save(os.path.join(index_dir, "ivf_offsets.npy"),
+            np.searchsorted(assign[order], np.arange(n_lists + 1)).astype(np.int64))
+    np.save(os.path.join(index_dir, "ivf_centroids.npy"), centroids.astype(np.float32))
+    return n_lists
+
+def write_index(index_dir: str, reports: List[Tuple[str, List[Tuple[int, str]], Optional[np.ndarray]]],
+                embed_model: str) -> Dict:
+    # reports: (filename, [(paragraph_index, text)], embeddings or None) in passage id order
+    os.makedirs(index_dir, exist_ok=True)
+    offsets = [0]
+    with open(os.path.join(index_dir, "passages.jsonl"), 'wb') as f:
+        for filename, passages, _ in reports:
+            for paragraph_index, text in passages:
+                line = json.dumps({"file": filename, "paragraph_index": paragraph_index, "text": text},
+                                  ensure_ascii=False).encode('utf-8') + b"\n"
+                f.write(line)
+                offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(index_dir, "passage_offsets.npy"), np.array(offsets, dtype=np.int64))
+    write_bm25(index_dir, [text for _, passages, _ in reports for _, text in passages])
+    chunks = [embeddings for _, passages, embeddings in reports if embeddings is not None and len(passages)]
+    dense = embed_model != "none" and bool(chunks)
+    n_lists = write_dense(index_dir, chunks) if dense else 0
+    info = {"passages": len(offsets) - 1, "embed_model": embed_model if dense else "none", "ivf_lists": n_lists}
+    atomic_write_json(os.path.join(index_dir, "index.json"), info, indent=2)
+    return info
+
+def build_index(reports_dir: str = REPORTS_DIR, embed_model: str = EMBED_MODEL, force: bool = False) -> Dict:
+    # Incremental: only new or changed reports are extracted and embedded; the combined index is
+    # rebuilt into a fresh directory and published by rewriting the manifest
+    fingerprint = config_fingerprint(embed_model)
+    manifest = {}
+    if os.path.exists(MANIFEST_FILE):
+        with open(MANIFEST_FILE, 'r') as f:
+            manifest = json.load(f)
+    known = manifest.get("reports", {})
+
+    files = sorted(f for f in os.listdir(reports_dir) if f.endswith('.pdf'))
+    contents = {}
+    for filename in files:
+        filepath = os.path.join(reports_dir, filename)
+        stat = os.stat(filepath)
+        previous = known.get(filename)
+        if previous and (previous["size"], previous["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+            sha = previous["sha256"]
+        else:
+            sha = file_sha256(filepath)
+        contents[filename] = {"sha256": sha, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    unchanged = ({f: c["sha256"] for f, c in contents.items()} == {f: c["sha256"] for f, c in known.items()})
+    if not force and unchanged and manifest.get("fingerprint") == fingerprint and \
+            os.path.exists(os.path.join(RAG_DIR, manifest.get("index_dir", ""), "index.json")):
+        print(f"RAG index up to date: {manifest['passages']} passages from {len(files)} reports.")
+        return manifest
+
+    embedder = load_embedder(embed_model)
+    if embedder is None and embed_model != "none":
+        print("Building a BM25-only index.")
+        embed_model = "none"
+        fingerprint = config_fingerprint(embed_model)
+    start = time.perf_counter()
+    reports, embedded = [], 0
+    for filename in files:
+        prefix = report_cache_prefix(contents[filename]["sha256"], fingerprint)
+        cached = None if force else load_report_cache(prefix)
+        if cached is None:
+            passages = report_passages(os.path.join(reports_dir, filename), contents[filename]["sha256"])
+            vectors = embedder.encode([text for _, text in passages]) if embedder and passages else None
+            save_report_cache(prefix, passages, vectors)
+            cached = load_report_cache(prefix)
+            embedded += 1
+            print(f"Indexed {filename}: {len(passages)} passages.")
+        reports.append((filename, *cached))
+
+    index_name = f"index-{int(time.time() * 1000)}"
+    info = write_index(os.path.join(RAG_DIR, index_name), reports, embed_model)
+    manifest = {"version": RAG_INDEX_VERSION, "fingerprint": fingerprint, "index_dir": index_name,
+                "reports": contents, "extracted": embedded, **info}
+    old_index = manifest_index_dir()
+    atomic_write_json(MANIFEST_FILE, manifest, indent=2)
+    if old_index and os.path.basename(old_index) != index_name:
+        shutil.rmtree(old_index, ignore_errors=True)
+    remove_stale_report_caches({report_cache_prefix(c["sha256"], fingerprint) for c in contents.values()})
+    print(f"RAG index: {info['passages']} passages from {len(files)} reports ({embedded} extracted/embedded, "
+          f"{len(files) - embedded} cached), {info['ivf_lists']} IVF lists, {time.perf_counter() - start:.1f}s.")
+    return manifest
+
+def manifest_index_dir() -> Optional[str]:
+    if not os.path.exists(MANIFEST_FILE):
+        return None
+    with open(MANIFEST_FILE, 'r') as f:
+        return os.path.join(RAG_DIR, json.load(f)["index_dir"])
+
+def remove_stale_report_caches(keep: set):
+    # Cached passages of reports that were removed or republished, or built with other settings
+    if not os.path.isdir(REPORT_CACHE_DIR):
+        return
+    for name in os.listdir(REPORT_CACHE_DIR):
+        prefix = os.path.join(REPORT_CACHE_DIR, name.split(".", 1)[0])
+        if prefix not in keep:
+            os.remove(os.path.join(REPORT_CACHE_DIR, name))
+
+class RagIndex:
+    def __init__(self, index_dir: Optional[str] = None, embedder: Optional[Embedder] = None):
+        self.index_dir = index_dir or manifest_index_dir()
+        if not self.index_dir or not os.path.exists(os.path.join(self.index_dir, "index.json")):
+            raise FileNotFoundError("No RAG index found. Run `python rag.py --build` first.")
+        with open(os.path.join(self.index_dir, "index.json"), 'r') as f:
+            self.info = json.load(f)
+
+        def load(name, mmap=False):
+            return np.load(os.path.join(self.index_dir, name), mmap_mode="r" if mmap else None)
+
+        self.passage_offsets = load("passage_offsets.npy")
+        self.passage_fd = os.open(os.path.join(self.index_dir, "passages.jsonl"), os.O_RDONLY)
+        with open(os.path.join(self.index_dir, "bm25_vocab.json"), 'r', encoding='utf-8') as f:
+            self.vocab = {term: i for i, term in enumerate(json.load(f))}
+        self.bm25_offsets = load("bm25_offsets.npy")
+        self.bm25_docs = load("bm25_docs.npy", mmap=True)
+        self.bm25_weights = load("bm25_weights.npy", mmap=True)
+        self.bm25_idf = load("bm25_idf.npy")
+
+        self.embedder = None
+        if self.info["embed_model"] != "none":
+            self.embeddings = load("embeddings.npy", mmap=True)
+            self.ivf_ids = load("ivf_ids.npy")
+            self.ivf_offsets = load("ivf_offsets.npy")
+            self.centroids = load("ivf_centroids.npy")
+            self.embedder = embedder or load_embedder(self.info["embed_model"])
+
+    def __len__(self):
+        return self.info["passages"]
+
+    def close(self):
+        os.close(self.passage_fd)
+
+    def passage(self, passage_id: int) -> Dict:
+        start, end = int(self.passage_offsets[passage_id]), int(self.passage_offsets[passage_id + 1])
+        return json.loads(os.pread(self.passage_fd, end - start, start))
+
+    def _scan(self, start: int, end: int, vector: np.ndarray) -> np.ndarray:
+        return np.concatenate([self.embeddings[i:min(i + SCAN_ROWS, end)] @ vector
+                               for i in range(start, end, SCAN_ROWS)] or [np.zeros(0, dtype=np.float32)])
+
+    def dense_search(self, vector: np.ndarray, k: int = TOP_K, nprobe: int = IVF_NPROBE,
+                     exact: bool = False) -> List[Tuple[int, float]]:
+        n_lists = len(self.centroids)
+        if exact or n_lists <= nprobe:
+            ranges = [(0, len(self.ivf_ids))]
+        else:
+            lists = np.sort(np.argpartition(-(self.centroids @ vector), nprobe)[:nprobe])
+            ranges = [(int(self.ivf_offsets[i]), int(self.ivf_offsets[i + 1])) for i in lists]
+        scores = np.concatenate([self._scan(start, end, vector) for start, end in ranges])
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        best = top_k(scores, k)
+        return [(int(self.ivf_ids[rows[i]]), float(scores[i])) for i in best]
+
+    def bm25_search(self, query: str, k: int = TOP_K) -> List[Tuple[int, float]]:
+        scores = np.zeros(len(self), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.bm25_offsets[term_id], self.bm25_offsets[term_id + 1]
+            scores[self.bm25_docs[start:end]] += self.bm25_idf[term_id] * self.bm25_weights[start:end]
+        best = [i for i in top_k(scores, k) if scores[i] > 0]
+        return [(int(i), float(scores[i])) for i in best]
+
+    def search(self, query: str, k: int = TOP_K, mode: str = "hybrid", nprobe: int = IVF_NPROBE,
+               exact: bool = False) -> List[Dict]:
+        # Hybrid merges the dense and BM25 rankings with reciprocal rank fusion; without an
+        # embedding model every mode falls back to BM25
+        if self.embedder is None or mode == "bm25":
+            hits = self.bm25_search(query, k)
+        elif mode == "dense":
+            hits = self.dense_search(self.embedder.encode([query])[0], k, nprobe, exact)
+        else:
+            candidates = max(k, FUSION_CANDIDATES)
+            fused: Dict[int, float] = {}
+            for ranking in (self.dense_search(self.embedder.encode([query])[0], candidates, nprobe, exact),
+                            self.bm25_search(query, candidates)):
+                for rank, (passage_id, _) in enumerate(ranking):
+                    fused[passage_id] = fused.get(passage_id, 0.0) + 1 / (RRF_K + rank + 1)
+            hits = sorted(fused.items(), key=lambda item: -item[1])[:k]
+        return [dict(self.passage(passage_id), id=passage_id, score=score) for passage_id, score in hits]
+
+def build_prompt(question: str, passages: List[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    # The training template with the retrieved passages as the "provided context" that
+    # INSTRUCTION refers to; lower-ranked passages are dropped once the budget is spent
+    context, used = [], 0
+    for passage in passages:
+        block = f"[{len(context) + 1}] ({passage['file']}) {passage['text']}"
+        if context and used + estimate_tokens(block) > token_budget:
+            break
+        context.append(block)
+        used += estimate_tokens(block)
+    text = "Context:\n" + "\n\n".join(context) + "\n\n" if context else ""
+    return format_chatml(INSTRUCTION, f"{text}Question: {question}")
+
+def answer(question: str, index: RagIndex, k: int = TOP_K, mode: str = "hybrid", model: Optional[str] = None,
+           api_url: Optional[str] = None) -> Dict:
+    # Retrieves, then sends the complete ChatML prompt to Ollama in raw mode (no Modelfile template)
+    from compare_models import API_URL, FINETUNED_MODEL, OPTIONS, make_session, query_ollama
+    start = time.perf_counter()
+    passages = index.search(question, k, mode)
+    retrieval_s = time.perf_counter() - start
+    session = make_session(1)
+    result = query_ollama(session, model or FINETUNED_MODEL, build_prompt(question, passages), OPTIONS,
+                          api_url or API_URL, raw=True)
+    session.close()
+    return dict(result, passages=passages, retrieval_s=retrieval_s)
+
+def evaluate(index: RagIndex, queries: List[Tuple[str, Tuple[str, int]]], ks: Tuple[int, ...] = (1, 5, 10),
+             modes: Tuple[str, ...] = SEARCH_MODES, nprobe: int = IVF_NPROBE) -> Dict:
+    # recall@k: share of queries whose source passage (file, paragraph_index) is in the top k.
+    # "dense-exact" scans every row, which also gives the IVF's recall against brute force.
+    from compare_models import percentile
+    runs = [(mode, False) for mode in modes]
+    if index.embedder is not None and "dense" in modes:
+        runs.append(("dense", True))
+    results = {}
+    for mode, exact in runs:
+        latencies, hits, ids = [], {k: 0 for k in ks}, []
+        for query, source in queries:
+            start = time.perf_counter()
+            found = index.search(query, max(ks), mode, nprobe, exact)
+            latencies.append(time.perf_counter() - start)
+            keys = [(p["file"], p["paragraph_index"]) for p in found]
+            ids.append([p["id"] for p in found])
+            for k in ks:
+                hits[k] += source in keys[:k]
+        name = f"{mode}-exact" if exact else mode
+        results[name] = {"recall": {f"@{k}": hits[k] / len(queries) for k in ks},
+                         "latency_ms": {f"p{q}": percentile(latencies, q) * 1000 for q in (50, 95, 99)},
+                         "ids": ids}
+    if "dense-exact" in results:
+        k = max(ks)
+        overlap = [len(set(a) & set(b)) / max(len(b), 1)
+                   for a, b in zip(results["dense"]["ids"], results["dense-exact"]["ids"])]
+        results["dense"]["ann_recall_vs_exact"] = float(np.mean(overlap)) if overlap else None
+        results["dense"]["ann_k"] = k
+    for result in results.values():
+        del result["ids"]
+    return results
+
+def print_evaluation(results: Dict, queries: int):
+    print(f"{queries} queries")
+    print(f"{'mode':<12} " + " ".join(f"{'R' + k:>6}" for k in next(iter(results.values()))["recall"]) +
+          f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for mode, r in results.items():
+        recall = " ".join(f"{v:>6.3f}" for v in r["recall"].values())
+        latency = r["latency_ms"]
+        print(f"{mode:<12} {recall} {latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f}")
+    if results.get("dense", {}).get("ann_recall_vs_exact") is not None:
+        print(f"IVF top-{results['dense']['ann_k']} overlap with exact search: "
+              f"{results['dense']['ann_recall_vs_exact']:.3f}")
+
+def dataset_queries(limit: int) -> List[Tuple[str, Tuple[str, int]]]:
+    # Generated questions labelled with the paragraph they were written from
+    from dataset_store import DATASET_FILE, TRACKER_FILE, Tracker, iter_active_dataset
+    queries = []
+    for entry in iter_active_dataset(Tracker(TRACKER_FILE), DATASET_FILE):
+        queries.append((entry["question"], (entry["file"], entry["paragraph_index"])))
+        if len(queries) >= limit:
+            break
+    return queries
+
+def main():
+    # python rag.py --build [--force]            index Reports/ (only new or changed reports are embedded)
+    # python rag.py --query "..." [--k 4] [--mode hybrid|dense|bm25] [--answer]
+    # python rag.py --eval [--limit 500]         recall@k and latency against dataset.jsonl questions
+    args = sys.argv[1:]
+
+    def option(flag, default):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    if "--build" in args or not args:
+        build_index(force="--force" in args)
+    if "--query" in args:
+        index = RagIndex()
+        question = option("--query", "")
+        k, mode = int(option("--k", TOP_K)), option("--mode", "hybrid")
+        if "--answer" in args:
+            result = answer(question, index, k, mode)
+            passages = result["passages"]
+        else:
+            passages = index.search(question, k, mode)
+        for n, passage in enumerate(passages, 1):
+            print(f"[{n}] {passage['file']} #{passage['paragraph_index']} ({passage['score']:.3f}): "
+                  f"{passage['text'][:300]}")
+        if "--answer" in args:
+            print(f"\n{result['error'] or result['response']}")
+            print(f"[retrieval {result['retrieval_s'] * 1000:.0f} ms, {result['latency_s']:.2f}s total]")
+        index.close()
+    if "--eval" in args:
+        queries = dataset_queries(int(option("--limit", 500)))
+        if not queries:
+            print("No dataset entries to evaluate against. Run generate_dataset.py first.")
+            sys.exit(1)
+        index = RagIndex()
+        print_evaluation(evaluate(index, queries), len(queries))
+        index.close()
+
+if __name__ == "__main__":
+    main()
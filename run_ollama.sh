@@ -44,7 +44,11 @@ EOF
 echo "Creating model '$MODEL_NAME'..."
 ollama create $MODEL_NAME -f Modelfile
 
-# 5. Run Finetuned Model
+# 5. Run Finetuned Model (skipped with --create-only, e.g. from orchestrate.py)
+if [ "$1" == "--create-only" ]; then
+    echo "Model '$MODEL_NAME' created."
+    exit 0
+fi
 echo "Running finetuned model '$MODEL_NAME'..."
 echo "Type /bye to exit."
 ollama run $MODEL_NAME
@@ -0,0 +1,46 @@
+import re
+import json
+import glob
+import os
+from typing import Dict, List, Sequence
+
+# Answer scoring and held-out sample loading shared by training-time evaluation
+# (eval_metrics.py) and the served-model comparison (compare_models.py). No torch imports.
+
+# Configuration
+GEN_EVAL_SAMPLES = 32  # Held-out questions answered at every evaluation
+
+def normalize_answer(text: str) -> List[str]:
+    return re.sub(r"[^a-z0-9%.]+", " ", text.lower()).split()
+
+def exact_match(prediction: str, reference: str) -> float:
+    return float(normalize_answer(prediction) == normalize_answer(reference))
+
+def rouge_l(prediction: str, reference: str) -> float:
+    # F1 over the longest common subsequence of words
+    pred, ref = normalize_answer(prediction), normalize_answer(reference)
+    if not pred or not ref:
+        return float(pred == ref)
+    previous = [0] * (len(ref) + 1)
+    for p in pred:
+        current = [0]
+        for j, r in enumerate(ref):
+            current.append(previous[j] + 1 if p == r else max(previous[j + 1], current[j]))
+        previous = current
+    lcs = previous[-1]
+    if lcs == 0:
+        return 0.0
+    precision, recall = lcs / len(pred), lcs / len(ref)
+    return 2 * precision * recall / (precision + recall)
+
+def load_eval_samples(data_files: Sequence[str], limit: int = GEN_EVAL_SAMPLES) -> List[Dict]:
+    samples = []
+    for path in sorted(data_files):
+        with open(path, 'r', encoding='utf-8') as f:
+            samples += [json.loads(line) for line in f if line.strip()]
+    # Spread the subset across reports and lengths rather than taking the first shard
+    step = max(1, len(samples) // limit) if samples else 1
+    return samples[::step][:limit]
+
+def validation_files(finetune_dir: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(finetune_dir, "validation", "*", "*.jsonl")))
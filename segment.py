@@ -0,0 +1,150 @@
+import re
+from collections import Counter, deque
+from typing import Iterable, Iterator, List
+
+# Configuration
+MAX_PARAGRAPH_TOKENS = 512  # Longer paragraphs are split at sentence boundaries
+HEADER_SAMPLE_PAGES = 8  # Pages buffered up front to learn running headers/footers
+HEADER_MIN_FRACTION = 0.4  # A top/bottom line on this share of pages seen is a running header/footer
+HEADER_MIN_PAGES = 3
+EDGE_LINES = 2  # Lines at the top and bottom of a page checked for headers/footers
+WIDTH_SLACK = 1  # Characters of tolerance when deciding whether the next word would have fit on a line
+
+PAGE_NUMBER_RE = re.compile(r"^\s*(page\s*)?[-–]?\s*\d+\s*[-–]?\s*(of\s*\d+)?\s*$", re.I)
+TERMINAL_RE = re.compile(r"[.?!:;]['\")\]]?$")
+LIST_ITEM_RE = re.compile(r"^\s*([•▪●◦\-–*]|\(?([ivxlc]+|\d+|[a-z])[.)])\s+", re.I)
+HYPHEN_END_RE = re.compile(r"[A-Za-z]-$")
+SENTENCE_SPLIT_RE = re.compile(r"(?<=[.?!])\s+(?=[A-Z(\"'])")
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+def normalize_edge_line(line: str) -> str:
+    return re.sub(r"\d+", "#", " ".join(line.lower().split()))
+
+def split_to_budget(paragraph: str, max_tokens: int = MAX_PARAGRAPH_TOKENS) -> List[str]:
+    # Split an over-long paragraph at sentence boundaries (words as a last resort)
+    if estimate_tokens(paragraph) <= max_tokens:
+        return [paragraph]
+    chunks, current = [], ""
+    for sentence in SENTENCE_SPLIT_RE.split(paragraph):
+        while estimate_tokens(sentence) > max_tokens:
+            words = sentence.split(" ")
+            head, size = [], 0
+            while words and size + len(words[0]) + 1 <= max_tokens * 4:
+                size += len(words[0]) + 1
+                head.append(words.pop(0))
+            if not head:
+                head.append(words.pop(0))
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(" ".join(head))
+            sentence = " ".join(words)
+        if not sentence:
+            continue
+        if current and estimate_tokens(current + " " + sentence) > max_tokens:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+class Segmenter:
+    # Single pass over pypdf's per-page text: strips running headers/footers and page numbers,
+    # dehyphenates line breaks, finds paragraph ends from line geometry, carries paragraphs across
+    # page breaks and caps them at MAX_PARAGRAPH_TOKENS. Only HEADER_SAMPLE_PAGES pages are ever
+    # buffered. A line that ends a sentence although the next word would still have fit on it
+    # was broken by the author, not by wrapping, so it ends the paragraph; blank lines and list
+    # items also start a new one.
+    def __init__(self, max_tokens: int = MAX_PARAGRAPH_TOKENS):
+        self.max_tokens = max_tokens
+        self.edge_counts = Counter()
+        self.pages_seen = 0
+        self.lines: List[str] = []  # Lines of the paragraph being built (kept for layout features)
+        self.last_line = ""
+        self.width = 0  # Wrap width: the longest body line seen so far
+
+    def _observe_edges(self, lines: List[str]):
+        self.pages_seen += 1
+        edges = {normalize_edge_line(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]}
+        self.edge_counts.update(edges)
+
+    def _is_running(self, line: str) -> bool:
+        if PAGE_NUMBER_RE.match(line):
+            return True
+        if self.pages_seen < HEADER_MIN_PAGES:
+            return False
+        count = self.edge_counts[normalize_edge_line(line)]
+        return count >= HEADER_MIN_PAGES and count >= HEADER_MIN_FRACTION * self.pages_seen
+
+    def _body_range(self, lines: List[str]):
+        start, end = 0, len(lines)
+        for _ in range(EDGE_LINES):
+            if start < end and self._is_running(lines[start]):
+                start += 1
+        for _ in range(EDGE_LINES):
+            if end > start and self._is_running(lines[end - 1]):
+                end -= 1
+        return start, end
+
+    def _flush(self) -> Iterator[str]:
+        if self.lines:
+            paragraph = "\n".join(self.lines).strip()
+            self.lines = []
+            if paragraph:
+                yield from split_to_budget(paragraph, self.max_tokens)
+
+    def _ended_early(self, next_line: str) -> bool:
+        if not self.lines or not TERMINAL_RE.search(self.last_line.strip()):
+            return False
+        first_word = next_line.split()[0]
+        return len(self.last_line) + 1 + len(first_word) <= self.width - WIDTH_SLACK
+
+    def _add_line(self, line: str):
+        if self.lines and HYPHEN_END_RE.search(self.lines[-1]) and line[:1].islower():
+            self.lines[-1] = self.lines[-1][:-1] + line
+        else:
+            self.lines.append(line)
+
+    def _segment_page(self, text: str) -> Iterator[str]:
+        entries = []  # (line, preceded by a blank line)
+        blank = False
+        for line in text.splitlines():
+            if line.strip():
+                entries.append((line.rstrip(), blank))
+                blank = False
+            else:
+                blank = True
+        start, end = self._body_range([line for line, _ in entries])
+        entries = entries[start:end]
+        if not entries:
+            return
+        self.width = max(self.width, max(len(line) for line, _ in entries))
+
+        for n, (line, blank_before) in enumerate(entries):
+            stripped = line.strip()
+            # A blank line at the top of the page only separates the (removed) header
+            if (blank_before and n > 0) or LIST_ITEM_RE.match(stripped) or self._ended_early(stripped):
+                yield from self._flush()
+            self._add_line(stripped)
+            self.last_line = line
+
+    def segment(self, pages: Iterable[str]) -> Iterator[str]:
+        buffered = deque()
+        for text in pages:
+            lines = [line for line in text.splitlines() if line.strip()]
+            self._observe_edges(lines)
+            buffered.append(text)
+            if self.pages_seen < HEADER_SAMPLE_PAGES:
+                continue
+            while buffered:
+                yield from self._segment_page(buffered.popleft())
+        while buffered:
+            yield from self._segment_page(buffered.popleft())
+        yield from self._flush()
+
+def segment_pages(pages: Iterable[str], max_tokens: int = MAX_PARAGRAPH_TOKENS) -> Iterator[str]:
+    return Segmenter(max_tokens).segment(pages)
@@ -0,0 +1,450 @@
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import hashlib
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+import numpy as np
+import requests
+from compare_models import make_session, percentile
+from embeddings import DEFAULT_EMBED_MODEL, Embedder, load_embedder
+
+# Caching proxy for the Ollama API. /api/generate responses are stored per model digest and
+# generation settings, and returned for the same prompt (after case/whitespace normalisation)
+# or for a prompt whose embedding is within SIMILARITY_THRESHOLD of a stored one. Entries expire
+# after CACHE_TTL_S, the least recently used are evicted beyond CACHE_MAX_ENTRIES, and a model
+# whose digest changes upstream (e.g. `ollama create` after a new export) loses its entries.
+# Everything else is passed through. GET /cache/metrics returns hit rates and latencies.
+
+# Configuration
+UPSTREAM_URL = os.environ.get("CACHE_UPSTREAM_URL", "http://localhost:11434")
+PROXY_PORT = 11436  # Point OLLAMA_API_URL at http://localhost:11436/api/generate
+SEMANTIC_CACHE_FILE = os.path.join(".cache", "semantic_cache.sqlite")
+CACHE_EMBED_MODEL = os.environ.get("CACHE_EMBED_MODEL", DEFAULT_EMBED_MODEL)  # "none": exact matches only
+SIMILARITY_THRESHOLD = 0.95  # Cosine similarity; lower values start merging questions that differ in one word
+CACHE_TTL_S = 7 * 24 * 3600
+CACHE_MAX_ENTRIES = 10_000
+TAGS_REFRESH_S = 30  # How often model digests are re-read from /api/tags
+METRICS_WINDOW = 10_000  # Latest requests kept for latency percentiles
+UPSTREAM_TIMEOUT = 300
+POOL_SIZE = 16
+# Options that change speed or placement but not the generated text
+IGNORED_OPTIONS = {"num_thread", "num_gpu", "main_gpu", "num_batch", "use_mmap", "use_mlock", "low_vram"}
+TIMING_FIELDS = ("created_at", "total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+def partition_key(request: Dict, digest: str) -> str:
+    # Everything besides the prompt that decides the answer; only entries with the same
+    # partition can be returned for a request
+    options = {k: v for k, v in (request.get("options") or {}).items() if k not in IGNORED_OPTIONS}
+    settings = [request.get("model"), digest, request.get("system"), request.get("template"),
+                bool(request.get("raw")), request.get("format"), options]
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+
+def is_cacheable(request: Dict) -> bool:
+    # Images and carried-over conversation context make the prompt text an incomplete key
+    return bool(request.get("model")) and not request.get("images") and not request.get("context") \
+        and not request.get("suffix")
+
+class SemanticCache:
+    # SQLite store of responses plus an in-memory matrix of prompt embeddings for the
+    # near-duplicate lookup. All methods are thread-safe.
+    def __init__(self, filepath: Optional[str] = SEMANTIC_CACHE_FILE, embedder: Optional[Embedder] = None,
+                 threshold: float = SIMILARITY_THRESHOLD, ttl: float = CACHE_TTL_S,
+                 max_entries: int = CACHE_MAX_ENTRIES):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.digests: Dict[str, str] = {}
+
+        if filepath:
+            os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(filepath or ":memory:", check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                model TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                partition TEXT NOT NULL,
+                prompt_key TEXT NOT NULL,
+                embedding BLOB,
+                value TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_access REAL NOT NULL,
+                UNIQUE (partition, prompt_key)
+            )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_model ON entries (model, digest)")
+        self.conn.commit()
+        # Embeddings of the stored prompts with their creation times; the matrix is rebuilt from
+        # them after the table changes
+        self.vectors: Dict[int, Tuple[str, np.ndarray, float]] = {}
+        for entry_id, partition, blob, created in self.conn.execute(
+                "SELECT id, partition, embedding, created FROM entries WHERE embedding IS NOT NULL"):
+            self.vectors[entry_id] = (partition, np.frombuffer(blob, dtype=np.float32), created)
+        self.matrix = None
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def embed(self, prompt: str) -> Optional[np.ndarray]:
+        if self.embedder is None:
+            return None
+        vector = self.embedder.encode([normalize_prompt(prompt)])[0]
+        return vector if np.linalg.norm(vector) > 0 else None
+
+    def _check_digest(self, model: str, digest: str):
+        # A re-created model tag gets a new digest: drop everything generated by the old weights
+        if not digest or self.digests.get(model) == digest:
+            return
+        removed = [row[0] for row in self.conn.execute(
+            "SELECT id FROM entries WHERE model = ? AND digest != ?", (model, digest))]
+        if removed:
+            self._delete(removed)
+            self.invalidations += len(removed)
+        self.digests[model] = digest
+
+    def _delete(self, ids):
+        self.conn.executemany("DELETE FROM entries WHERE id = ?", [(i,) for i in ids])
+        self.conn.commit()
+        for entry_id in ids:
+            self.vectors.pop(entry_id, None)
+        self.matrix = None
+
+    def _semantic_match(self, partition: str, vector: np.ndarray, now: float) -> Tuple[Optional[int], float]:
+        # Best unexpired entry of the partition, so an expired closer match cannot hide a live one
+        if self.matrix is None:
+            ids = list(self.vectors)
+            self.matrix = (np.array(ids, dtype=np.int64), np.array([self.vectors[i][0] for i in ids]),
+                           np.stack([self.vectors[i][1] for i in ids]) if ids else np.zeros((0, 0), np.float32),
+                           np.array([self.vectors[i][2] for i in ids], dtype=np.float64))
+        ids, partitions, matrix, created = self.matrix
+        mask = (partitions == partition) & (now - created <= self.ttl)
+        if not mask.any():
+            return None, 0.0
+        scores = matrix[mask] @ vector
+        best = int(np.argmax(scores))
+        return int(ids[mask][best]), float(scores[best])
+
+    def lookup(self, model: str, digest: str, partition: str,
+               prompt: str) -> Tuple[Optional[str], Optional[Dict], Optional[np.ndarray]]:
+        # (kind, value, prompt embedding): kind is "exact", "semantic" or None for a miss. The
+        # prompt is only embedded after an exact miss, and outside the lock.
+        with self.lock:
+            self._check_digest(model, digest)
+            row = self.conn.execute("SELECT id, value, created FROM entries WHERE partition = ? AND prompt_key = ?",
+                                    (partition, normalize_prompt(prompt))).fetchone()
+        if row is not None:
+            kind, value, _ = self._hit("exact", row, None)
+            if kind is not None:
+                return kind, value, None
+        vector = self.embed(prompt)
+        if vector is None:
+            return None, None, None
+        with self.lock:
+            if not self.vectors:
+                return None, None, vector
+            entry_id, similarity = self._semantic_match(partition, vector, time.time())
+            if entry_id is None or similarity < self.threshold:
+                return None, None, vector
+            row = self.conn.execute("SELECT id, value, created FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return self._hit("semantic", row, vector)
+
+    def _hit(self, kind: str, row, vector: Optional[np.ndarray]):
+        now = time.time()
+        with self.lock:
+            if now - row[2] > self.ttl:
+                self._delete([row[0]])
+                self.expirations += 1
+                return None, None, vector
+            self.conn.execute("UPDATE entries SET last_access = ? WHERE id = ?", (now, row[0]))
+            self.conn.commit()
+        return kind, json.loads(row[1]), vector
+
+    def put(self, model: str, digest: str, partition: str, prompt: str, vector: Optional[np.ndarray], value: Dict):
+        now = time.time()
+        blob = vector.astype(np.float32).tobytes() if vector is not None else None
+        with self.lock:
+            self._check_digest(model, digest)
+            old = self.conn.execute("SELECT id FROM entries WHERE partition = ? AND prompt_key = ?",
+                                    (partition, normalize_prompt(prompt))).fetchone()
+            if old:
+                self._delete([old[0]])
+            cursor = self.conn.execute(
+                "INSERT INTO entries (model, digest, partition, prompt_key, embedding, value, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (model, digest, partition, normalize_prompt(prompt), blob, json.dumps(value, ensure_ascii=False),
+                 now, now))
+            if vector is not None:
+                self.vectors[cursor.lastrowid] = (partition, vector.astype(np.float32), now)
+                self.matrix = None
+            self.conn.commit()
+            self._evict(now)
+
+    def _evict(self, now: float):
+        expired = [row[0] for row in self.conn.execute("SELECT id FROM entries WHERE created < ?", (now - self.ttl,))]
+        if expired:
+            self._delete(expired)
+            self.expirations += len(expired)
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            victims = [row[0] for row in self.conn.execute(
+                "SELECT id FROM entries ORDER BY last_access ASC LIMIT ?", (excess,))]
+            self._delete(victims)
+            self.evictions += len(victims)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class ModelTags:
+    # Model name -> digest from upstream /api/tags, re-read every TAGS_REFRESH_S
+    def __init__(self, upstream: str, session: requests.Session, refresh: float = TAGS_REFRESH_S):
+        self.upstream = upstream
+        self.session = session
+        self.refresh = refresh
+        self.digests: Dict[str, str] = {}
+        self.fetched = 0.0
+        self.lock = threading.Lock()
+
+    def digest(self, model: str) -> str:
+        with self.lock:
+            if time.monotonic() - self.fetched > self.refresh:
+                try:
+                    response = self.session.get(f"{self.upstream}/api/tags", timeout=10)
+                    response.raise_for_status()
+                    self.digests = {m["name"]: m.get("digest", "") for m in response.json().get("models", [])}
+                    self.fetched = time.monotonic()
+                except (requests.RequestException, ValueError):
+                    pass  # Keep the last known digests; retried on the next request
+            return self.digests.get(model) or self.digests.get(f"{model}:latest", "")
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"exact": 0, "semantic": 0, "miss": 0, "bypass": 0, "upstream_error": 0}
+        self.latencies = deque(maxlen=METRICS_WINDOW)  # (kind, seconds)
+
+    def record(self, kind: str, seconds: float):
+        with self.lock:
+            self.counts[kind] += 1
+            self.latencies.append((kind, seconds))
+
+    def snapshot(self, cache: SemanticCache) -> Dict:
+        with self.lock:
+            counts = dict(self.counts)
+            latencies = list(self.latencies)
+        lookups = counts["exact"] + counts["semantic"] + counts["miss"]
+        hits = counts["exact"] + counts["semantic"]
+        by_kind = {}
+        for kind in ("exact", "semantic", "miss"):
+            values = [s for k, s in latencies if k == kind]
+            by_kind[kind] = {f"p{q}": percentile(values, q) for q in (50, 95, 99)}
+        miss_p50 = by_kind["miss"]["p50"] or 0.0
+        return {"requests": sum(counts.values()), **counts, "hit_rate": hits / lookups if lookups else 0.0,
+                "latency_s": by_kind, "upstream_seconds_saved": hits * miss_p50, "entries": len(cache),
+                "evictions": cache.evictions, "expirations": cache.expirations, "invalidations": cache.invalidations}
+
+class ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: Dict, cache_status: Optional[str] = None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if cache_status:
+            self.send_header("X-Cache", cache_status)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_chunked(self, status: int, content_type: str, cache_status: Optional[str] = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        if cache_status:
+            self.send_header("X-Cache", cache_status)
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        if data:
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        if self.path == "/cache/metrics":
+            self._send_json(200, self.server.metrics.snapshot(self.server.cache))
+        else:
+            self._forward("GET", b"")
+
+    def do_DELETE(self):
+        self._forward("DELETE", self._read_body())
+
+    def do_POST(self):
+        body = self._read_body()
+        if self.path != "/api/generate":
+            self._forward("POST", body)
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        self._generate(request, body)
+
+    def _forward(self, method: str, body: bytes):
+        # Pass-through, streamed back as it arrives
+        headers = {"Content-Type": self.headers["Content-Type"]} if self.headers.get("Content-Type") else {}
+        try:
+            with self.server.session.request(method, f"{self.server.upstream}{self.path}", data=body or None,
+                                             headers=headers, stream=True, timeout=UPSTREAM_TIMEOUT) as response:
+                self._start_chunked(response.status_code, response.headers.get("Content-Type", "application/json"))
+                for data in response.iter_content(chunk_size=None):
+                    self._write_chunk(data)
+                self.wfile.write(b"0\r\n\r\n")
+        except requests.RequestException as e:
+            self._send_json(502, {"error": f"upstream unavailable: {e}"})
+
+    def _generate(self, request: Dict, body: bytes):
+        start = time.perf_counter()
+        server = self.server
+        stream = request.get("stream", True)
+        if not is_cacheable(request) or self.headers.get("Cache-Control") == "no-cache":
+            self._forward("POST", body)
+            server.metrics.record("bypass", time.perf_counter() - start)
+            return
+
+        model = request["model"]
+        digest = server.tags.digest(model)
+        if not digest:
+            # /api/tags not reachable yet or the model is not listed: serving or storing would tie
+            # entries to an unknown version, and "" must never look like a re-created model
+            self._forward("POST", body)
+            server.metrics.record("bypass", time.perf_counter() - start)
+            return
+        partition = partition_key(request, digest)
+        prompt = request.get("prompt", "")
+        kind, value, vector = server.cache.lookup(model, digest, partition, prompt)
+        if kind:
+            self._replay(request, value, kind, stream, start)
+            server.metrics.record(kind, time.perf_counter() - start)
+            return
+
+        parts, final, failed = [], None, False
+        try:
+            with server.session.post(f"{server.upstream}/api/generate", data=body, stream=True,
+                                     headers={"Content-Type": "application/json"}, timeout=UPSTREAM_TIMEOUT) as response:
+                if response.status_code != 200:
+                    server.metrics.record("upstream_error", time.perf_counter() - start)
+                    self._start_chunked(response.status_code, response.headers.get("Content-Type", "application/json"))
+                    self._write_chunk(response.content)
+                    self.wfile.write(b"0\r\n\r\n")
+                    return
+                if stream:
+                    self._start_chunked(200, "application/x-ndjson", "miss")
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        self._write_chunk(line + b"\n")
+                        chunk = json.loads(line)
+                        failed |= bool(chunk.get("error"))
+                        parts.append(chunk.get("response", ""))
+                        if chunk.get("done"):
+                            final = chunk
+                    self.wfile.write(b"0\r\n\r\n")
+                else:
+                    data = response.content
+                    final = json.loads(data)
+                    parts.append(final.get("response", ""))
+                    self._send_json(200, final, "miss")
+        except requests.RequestException as e:
+            server.metrics.record("upstream_error", time.perf_counter() - start)
+            if not parts:
+                self._send_json(502, {"error": f"upstream unavailable: {e}"})
+            return
+
+        server.metrics.record("miss", time.perf_counter() - start)
+        if final is not None and not failed and not final.get("error"):
+            stored = {k: v for k, v in final.items() if k not in TIMING_FIELDS and k != "response"}
+            if vector is None and server.cache.embedder is not None:
+                vector = server.cache.embed(prompt)  # Exact hit that expired
+            server.cache.put(model, digest, partition, prompt, vector, {"response": "".join(parts), "final": stored})
+
+    def _replay(self, request: Dict, value: Dict, kind: str, stream: bool, start: float):
+        # Same shape as an Ollama response: the stored text in one chunk, then the final summary
+        created_at = datetime.now(timezone.utc).isoformat()
+        final = dict(value["final"], model=request["model"], created_at=created_at, done=True,
+                     total_duration=int((time.perf_counter() - start) * 1e9))
+        if not stream:
+            self._send_json(200, dict(final, response=value["response"]), kind)
+            return
+        self._start_chunked(200, "application/x-ndjson", kind)
+        self._write_chunk(json.dumps({"model": request["model"], "created_at": created_at,
+                                      "response": value["response"], "done": False}).encode('utf-8') + b"\n")
+        self._write_chunk(json.dumps(dict(final, response="")).encode('utf-8') + b"\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+def start_proxy(cache: SemanticCache, upstream: str = UPSTREAM_URL, port: int = 0,
+                tags_refresh: float = TAGS_REFRESH_S) -> ThreadingHTTPServer:
+    # Serves in a background thread; port 0 picks a free port (server.server_address[1])
+    server = ThreadingHTTPServer(("127.0.0.1", port), ProxyHandler)
+    server.daemon_threads = True
+    server.upstream = upstream.rstrip("/")
+    server.cache = cache
+    server.session = make_session(POOL_SIZE)
+    server.tags = ModelTags(server.upstream, server.session, tags_refresh)
+    server.metrics = Metrics()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    # python semantic_cache.py [--port 11436] [--upstream http://localhost:11434] [--threshold 0.95]
+    #                          [--ttl SECONDS] [--max-entries N]
+    args = sys.argv[1:]
+
+    def option(flag, default):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    cache = SemanticCache(embedder=load_embedder(CACHE_EMBED_MODEL),
+                          threshold=float(option("--threshold", SIMILARITY_THRESHOLD)),
+                          ttl=float(option("--ttl", CACHE_TTL_S)),
+                          max_entries=int(option("--max-entries", CACHE_MAX_ENTRIES)))
+    if cache.embedder is None:
+        print("Caching exact prompt matches only.")
+    server = start_proxy(cache, option("--upstream", UPSTREAM_URL), int(option("--port", PROXY_PORT)))
+    print(f"Semantic cache listening on http://127.0.0.1:{server.server_address[1]} -> {server.upstream} "
+          f"({len(cache)} entries)", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(server.metrics.snapshot(cache), indent=2))
+        cache.close()
+
+if __name__ == "__main__":
+    main()
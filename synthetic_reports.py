@@ -0,0 +1,118 @@
+import os
+import random
+from typing import List
+
+# Generates small, RBI-flavoured PDFs without any PDF library so benchmarks can run offline.
+# Pages have a running header and footer, wrapped body text and blank-line paragraph gaps.
+
+TOPICS = [
+    "monetary policy transmission", "liquidity adjustment facility", "priority sector lending",
+    "payment and settlement systems", "prepaid payment instruments", "foreign exchange reserves",
+    "non-banking financial companies", "deposit insurance", "financial inclusion", "currency management",
+    "consumer protection", "digital lending", "cooperative banks", "government securities market",
+]
+WORDS = ("the reserve bank reviewed framework regulated entities guidelines were issued during year "
+         "to strengthen supervision risk capital adequacy credit growth inflation remained within "
+         "tolerance band while liquidity conditions eased and the committee decided that banks "
+         "should ensure compliance with prudential norms reporting requirements and customer data").split()
+
+LINE_WIDTH = 90
+LINES_PER_PAGE = 48
+
+
+def make_paragraph(rng: random.Random) -> str:
+    topic = rng.choice(TOPICS)
+    sentences = []
+    for _ in range(rng.randint(3, 6)):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(10, 22))]
+        words.insert(rng.randint(0, len(words)), topic)
+        sentence = " ".join(words)
+        sentences.append(sentence[0].upper() + sentence[1:] + ".")
+    return " ".join(sentences)
+
+
+def wrap(text: str, width: int = LINE_WIDTH, hyphenate: bool = True) -> List[str]:
+    # Greedy wrap; long plain words that overflow are hyphenated like typeset reports
+    lines, current = [], ""
+    for word in text.split():
+        if current and len(current) + 1 + len(word) > width:
+            room = width - len(current) - 2
+            if hyphenate and word.isalpha() and len(word) >= 8 and room >= 4 and len(word) - room >= 3:
+                lines.append(f"{current} {word[:room]}-")
+                current = word[room:]
+                continue
+            lines.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        lines.append(current)
+    return lines
+
+
+def layout_pages(paragraphs: List[str], title: str) -> List[List[str]]:
+    pages, body = [], []
+    for para in paragraphs:
+        for line in wrap(para):
+            if len(body) == LINES_PER_PAGE:
+                pages.append(body)
+                body = []
+            body.append(line)
+        if body and len(body) < LINES_PER_PAGE:
+            body.append("")
+    if body:
+        pages.append(body)
+    return [[title, ""] + lines + ["", f"Page {n + 1}"] for n, lines in enumerate(pages)]
+
+
+def _escape(line: str) -> str:
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        ops = ["BT", "/F1 9 Tf", "11 TL", "50 800 Td"]
+        for line in lines:
+            ops.append(f"({_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                        f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>").encode())
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_report(path: str, num_paragraphs: int = 60, seed: int = 0, title: str = "Reserve Bank of India Annual Report") -> List[str]:
+    rng = random.Random(seed)
+    paragraphs = [make_paragraph(rng) for _ in range(num_paragraphs)]
+    write_pdf(path, layout_pages(paragraphs, title))
+    return paragraphs
+
+
+def make_corpus(directory: str, num_reports: int = 3, paragraphs_per_report: int = 60, seed: int = 0) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for n in range(num_reports):
+        path = os.path.join(directory, f"synthetic_report_{n:03d}.pdf")
+        make_report(path, paragraphs_per_report, seed=seed + n, title=f"Reserve Bank of India Report {2000 + n}")
+        paths.append(path)
+    return paths
@@ -0,0 +1,32 @@
+import os
+import re
+import sys
+import hashlib
+import numpy as np
+import pytest
+
+# The modules are flat scripts at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+class HashingEmbedder:
+    # Offline stand-in for embeddings.Embedder: signed word hashes in DIMENSIONS buckets,
+    # L2-normalised, so texts sharing words have a high cosine similarity
+    DIMENSIONS = 256
+
+    def __init__(self):
+        self.name = "hashing"
+        self.calls = 0
+
+    def encode(self, texts):
+        self.calls += 1
+        vectors = np.zeros((len(texts), self.DIMENSIONS), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"\w+", text.lower()):
+                h = int.from_bytes(hashlib.md5(word.encode('utf-8')).digest()[:4], "little")
+                vectors[row, h % self.DIMENSIONS] += 1.0 if h & 1 << 31 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+@pytest.fixture
+def hashing_embedder():
+    return HashingEmbedder()
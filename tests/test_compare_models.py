@@ -0,0 +1,76 @@
+import json
+import random
+import pytest
+from compare_models import BASE_MODEL, FINETUNED_MODEL, query_ollama, make_session, run_batch, user_prompt
+from ollama_stub import StubModel, start_stub
+
+NUM_PROMPTS = 8
+BASE_TTFT, FINETUNED_TTFT = 0.08, 0.04
+TOKENS_PER_S = 400.0
+GENERIC_ANSWER = " ".join(["The report discusses monetary policy and its effects."] * 4)
+WORDS = ("the reserve bank revised repo rate inflation target liquidity credit growth banks payment "
+         "systems deposits regulation monetary committee percent basis points").split()
+
+def make_samples(rng: random.Random):
+    return [{"instruction": "Answer the question based on the provided context from the financial report.",
+             "input": f"Question: What did the report say about {rng.choice(WORDS)} in year {2000 + i}?",
+             "output": " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 40)))}
+            for i in range(NUM_PROMPTS)]
+
+@pytest.fixture
+def stub():
+    # The fine-tuned model answers with the reference, the base model with a generic answer
+    samples = make_samples(random.Random(3407))
+    models = {
+        BASE_MODEL: StubModel(BASE_TTFT, TOKENS_PER_S, default_answer=GENERIC_ANSWER),
+        FINETUNED_MODEL: StubModel(FINETUNED_TTFT, TOKENS_PER_S, answers={user_prompt(s): s["output"] for s in samples}),
+    }
+    server = start_stub(models)
+    yield samples, models, server, f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+    server.shutdown()
+
+def test_batch_scores_both_models(stub):
+    samples, _, _, api_url = stub
+    report = run_batch(samples, [BASE_MODEL, FINETUNED_MODEL], concurrency=4, api_url=api_url)
+    base, tuned = report["summary"][BASE_MODEL], report["summary"][FINETUNED_MODEL]
+    assert base["errors"] == tuned["errors"] == 0
+    assert tuned["rouge_l"] == 1.0 and tuned["exact_match"] == 1.0
+    assert base["rouge_l"] < 0.5 and base["exact_match"] == 0.0
+    assert report["summary"]["wins"] == {BASE_MODEL: 0, FINETUNED_MODEL: NUM_PROMPTS}
+    assert all(set(row["answers"]) == {BASE_MODEL, FINETUNED_MODEL} for row in report["rows"])
+    json.dumps(report)  # comparison_report.json must be serializable
+
+def test_batch_measures_ttft_and_decode(stub):
+    samples, _, _, api_url = stub
+    report = run_batch(samples, [BASE_MODEL, FINETUNED_MODEL], concurrency=4, api_url=api_url)
+    for model, ttft in ((BASE_MODEL, BASE_TTFT), (FINETUNED_MODEL, FINETUNED_TTFT)):
+        summary = report["summary"][model]
+        assert ttft <= summary["ttft_s"]["p50"] < ttft + 0.05
+        assert summary["latency_s"]["p50"] > summary["ttft_s"]["p50"]
+        assert 0 < summary["tokens_per_s_median"] <= TOKENS_PER_S * 1.1
+
+def test_batch_reuses_connections(stub):
+    samples, _, server, api_url = stub
+    server.RequestHandlerClass.connections = 0
+    run_batch(samples, [BASE_MODEL, FINETUNED_MODEL], concurrency=4, api_url=api_url)
+    assert server.RequestHandlerClass.connections <= 4
+
+def test_system_prompt_only_when_asked(stub):
+    samples, models, _, api_url = stub
+    run_batch(samples[:2], [BASE_MODEL, FINETUNED_MODEL], concurrency=2, api_url=api_url)
+    assert all("system" not in r for m in models.values() for r in m.received)
+    run_batch(samples[:2], [BASE_MODEL], concurrency=2, api_url=api_url, system="Be brief.")
+    assert [r["system"] for r in list(models[BASE_MODEL].received)[2:]] == ["Be brief.", "Be brief."]
+
+def test_errors_are_counted_not_scored(stub):
+    samples, models, _, api_url = stub
+    models[BASE_MODEL].error_rate = 1.0
+    report = run_batch(samples, [BASE_MODEL, FINETUNED_MODEL], concurrency=4, api_url=api_url)
+    assert report["summary"][BASE_MODEL]["errors"] == NUM_PROMPTS
+    assert report["summary"][BASE_MODEL]["rouge_l"] == 0.0
+    assert report["summary"][FINETUNED_MODEL]["errors"] == 0
+
+def test_query_ollama_unknown_model(stub):
+    _, _, _, api_url = stub
+    result = query_ollama(make_session(1), "missing-model", "hello", api_url=api_url)
+    assert result["error"] and result["response"] == ""
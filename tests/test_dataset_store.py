@@ -0,0 +1,28 @@
+import os
+import json
+import generate_dataset
+from dataset_store import DATASET_FILE, TRACKER_FILE, Tracker, iter_active_dataset
+from fake_llm import FakeLLM
+from synthetic_reports import make_corpus
+
+def run_generate(monkeypatch):
+    monkeypatch.setattr(generate_dataset, "LLM_CACHE_MODE", "off")
+    monkeypatch.setattr(generate_dataset, "REQUESTS_PER_MINUTE", 10**9)
+    monkeypatch.setattr(generate_dataset, "TOKENS_PER_MINUTE", 10**12)
+    generate_dataset.main(llm_fn=FakeLLM(latency=0, seed=0))
+
+def test_partial_legacy_report_restarts_from_paragraph_0(tmp_path, monkeypatch):
+    # The legacy paragraph_index counted '\n\n'-split paragraphs; resuming at it would skip segments
+    monkeypatch.chdir(tmp_path)
+    name = os.path.basename(make_corpus(generate_dataset.REPORTS_DIR, 1, 40)[0])
+    with open(TRACKER_FILE, 'w') as f:
+        json.dump({name: {"paragraph_index": 7, "completed": False}}, f)
+    with open("dataset.json", 'w') as f:
+        json.dump([{"question": "old?", "answer": "old", "file": name}], f)
+    run_generate(monkeypatch)
+
+    tracker = Tracker(TRACKER_FILE, DATASET_FILE)
+    entries = list(iter_active_dataset(tracker))
+    assert tracker.get_file_status(name)["completed"]
+    assert entries and all(e["question"] != "old?" for e in entries)
+    assert min(e["paragraph_index"] for e in entries) < 7
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import pytest
+import fix_export
+from fix_export import export, target_path
+
+# Stand-ins for llama.cpp's tools: each output records how it was made, and every call is
+# appended to calls.jsonl, so the export plan can be checked without building llama.cpp
+CONVERT = """import sys, json
+args = sys.argv[1:]
+out, outtype = args[args.index("--outfile") + 1], args[args.index("--outtype") + 1]
+with open("calls.jsonl", "a") as f:
+    f.write(json.dumps(["convert", outtype]) + "\\n")
+with open(out, "w") as f:
+    f.write(f"converted {outtype}")
+"""
+QUANTIZE = """#!{python}
+import sys, json
+source, out, quant = sys.argv[1:4]
+with open("calls.jsonl", "a") as f:
+    f.write(json.dumps(["quantize", quant]) + "\\n")
+with open(source) as f, open(out, "w") as g:
+    g.write(f"{{quant}} from {{f.read()}}")
+"""
+QUANTS = ["Q4_K_M", "Q5_K_M", "Q8_0"]
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tools = tmp_path / "llama.cpp"
+    (tools / "build" / "bin").mkdir(parents=True)
+    (tools / "convert_hf_to_gguf.py").write_text(CONVERT)
+    quantize = tools / "build" / "bin" / "llama-quantize"
+    quantize.write_text(QUANTIZE.format(python=sys.executable))
+    quantize.chmod(0o755)
+    monkeypatch.setattr(fix_export, "llama_cpp_dir", str(tools))
+    source_dir = tmp_path / "merged"
+    source_dir.mkdir()
+    (source_dir / "model.safetensors").write_bytes(b"weights")
+    return str(source_dir)
+
+def calls():
+    if not os.path.exists("calls.jsonl"):
+        return []
+    with open("calls.jsonl") as f:
+        return [tuple(json.loads(line)) for line in f]
+
+def test_k_quants_share_one_f16_gguf(source, tmp_path):
+    output_dir = tmp_path / "out"
+    output_dir.mkdir()
+    result = export(source, QUANTS, str(output_dir))
+    assert set(result["targets"]) == {"f16-source", *QUANTS}
+    assert sorted(calls()) == sorted([("convert", "f16")] + [("quantize", q) for q in QUANTS])
+    for quant in QUANTS:
+        with open(target_path(quant, str(output_dir))) as f:
+            assert f.read() == f"{quant} from converted f16"
+    # Neither the f16 GGUF nor temporary files are left behind
+    assert sorted(os.listdir(output_dir)) == sorted([fix_export.EXPORT_MANIFEST] +
+                                                    [os.path.basename(target_path(q, str(output_dir))) for q in QUANTS])
+
+def test_q8_only_converts_directly(source, tmp_path):
+    export(source, ["Q8_0"], str(tmp_path))
+    assert calls() == [("convert", "q8_0")]
+    assert not os.path.exists(os.path.join(tmp_path, f"{fix_export.output_prefix}.gguf"))
+
+def test_unchanged_source_is_skipped(source, tmp_path):
+    export(source, QUANTS, str(tmp_path))
+    before = calls()
+    assert export(source, QUANTS, str(tmp_path))["targets"] == {}
+    assert calls() == before
+
+    with open(os.path.join(source, "model.safetensors"), "wb") as f:
+        f.write(b"new weights")
+    assert set(export(source, ["Q8_0"], str(tmp_path))["targets"]) == {"Q8_0"}
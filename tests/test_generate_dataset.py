@@ -0,0 +1,155 @@
+import json
+import time
+import random
+import pytest
+import generate_dataset
+from fake_llm import BATCH_TARGETS_RE, FakeLLM
+from generate_dataset import (LLMStats, RateLimiter, backoff_delay, generate_ordered, parse_batch_response,
+                              process_window, request_with_retries, window_paragraphs)
+from synthetic_reports import make_paragraph
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    # Retries without waiting; records the attempts backed off from
+    attempts = []
+    monkeypatch.setattr(generate_dataset, "backoff_delay", lambda attempt: attempts.append(attempt) or 0.0)
+    return attempts
+
+def make_items(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return list(window_paragraphs([make_paragraph(rng) for _ in range(count)]))
+
+def test_rate_limiter_allows_a_burst_then_paces_requests():
+    limiter = RateLimiter(requests_per_minute=1200, tokens_per_minute=10**9)
+    start = time.monotonic()
+    for _ in range(1200):
+        limiter.acquire(1)
+    assert time.monotonic() - start < 0.5
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire(1)
+    # 20 requests a second once the bucket is empty
+    assert 0.15 <= time.monotonic() - start < 0.5
+
+def test_rate_limiter_paces_tokens():
+    limiter = RateLimiter(requests_per_minute=10**6, tokens_per_minute=60_000)
+    limiter.acquire(60_000)
+    start = time.monotonic()
+    limiter.acquire(200)
+    assert 0.15 <= time.monotonic() - start < 0.5
+    # A request larger than the whole quota waits for a full bucket instead of forever
+    limiter = RateLimiter(requests_per_minute=10**6, tokens_per_minute=60_000)
+    start = time.monotonic()
+    limiter.acquire(10**9)
+    assert time.monotonic() - start < 0.1
+
+def test_backoff_is_exponential_with_full_jitter():
+    random.seed(0)
+    for attempt in range(8):
+        cap = min(generate_dataset.RETRY_MAX_DELAY, generate_dataset.RETRY_BASE_DELAY * 2 ** attempt)
+        delays = [backoff_delay(attempt) for _ in range(200)]
+        assert all(0 <= d <= cap for d in delays)
+        assert max(delays) > 0.8 * cap and min(delays) < 0.2 * cap
+
+def test_request_retries_until_the_call_succeeds(no_backoff):
+    failures = iter([RuntimeError("503"), RuntimeError("429")])
+
+    def flaky(prompt):
+        error = next(failures, None)
+        if error:
+            raise error
+        return '{"valid": false}'
+
+    stats = LLMStats()
+    assert request_with_retries(flaky, "prompt", RateLimiter(10**6, 10**9), stats) == '{"valid": false}'
+    assert no_backoff == [0, 1]
+    assert stats.calls == 3
+
+def test_request_gives_up_after_max_retries(no_backoff, monkeypatch):
+    monkeypatch.setattr(generate_dataset, "MAX_RETRIES", 4)
+    llm = FakeLLM(latency=0.0, error_rate=1.0)
+    assert request_with_retries(llm, "prompt") is None
+    assert llm.calls == 4 and no_backoff == [0, 1, 2]
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_results_come_back_in_input_order(no_backoff, batch_size):
+    items = make_items(40)
+    fake = FakeLLM(latency=0.0, error_rate=0.2, seed=1)
+
+    def llm_fn(prompt):
+        # Random latency per prompt, so later windows often finish first
+        time.sleep(random.Random(prompt).uniform(0, 0.02))
+        return fake(prompt)
+
+    results = list(generate_ordered(items, llm_fn, batch_size=batch_size, max_workers=4))
+    assert [index for index, _ in results] == [index for index, _, _ in items]
+    assert [result["answer"] for _, result in results] == [target for _, _, target in items]
+    assert fake.errors > 0
+
+def item(index=None, valid=True, question="What changed?", answer="The rate was raised."):
+    fields = {"paragraph_index": index, "valid": valid, "question": question, "answer": answer}
+    return {k: v for k, v in fields.items() if v is not None}
+
+def test_parse_batch_keeps_only_valid_requested_items():
+    response = [item(3), item("4"), item(5, valid=False, question=None, answer=None), item(3, answer="Duplicate."),
+                item(9), item(6, answer=" "), item(7, valid="yes"), "not an object"]
+    parsed = parse_batch_response(json.dumps(response), [3, 4, 5, 6, 7])
+    assert sorted(parsed) == [3, 4, 5]
+    assert parsed[3]["answer"] == "The rate was raised." and parsed[5]["valid"] is False
+
+def test_parse_batch_response_shapes():
+    # Un-indexed items align by position only when there is exactly one per target
+    assert sorted(parse_batch_response(json.dumps([item(), item()]), [10, 11])) == [10, 11]
+    assert parse_batch_response(json.dumps([item()]), [10, 11]) == {}
+    assert sorted(parse_batch_response(json.dumps({"items": [item(10)]}), [10, 11])) == [10]
+    assert sorted(parse_batch_response(json.dumps(item(11)), [10, 11])) == [11]
+    assert parse_batch_response('[{"paragraph_index": 10, "valid": tru', [10]) == {}
+    assert parse_batch_response('"just text"', [10]) == {}
+
+class ScriptedLLM:
+    # Batched calls answer only the targets allowed by `answer_batch(call number, index)`;
+    # single-paragraph calls are answered by FakeLLM
+    def __init__(self, answer_batch):
+        self.answer_batch = answer_batch
+        self.batches = []
+        self.singles = 0
+        self.fake = FakeLLM(latency=0.0, invalid_rate=0.0)
+
+    def __call__(self, prompt):
+        batch = BATCH_TARGETS_RE.search(prompt)
+        if not batch:
+            self.singles += 1
+            return self.fake(prompt)
+        targets = json.loads(batch.group(1))
+        self.batches.append([t["paragraph_index"] for t in targets])
+        return json.dumps([item(t["paragraph_index"], answer=t["text"]) for t in targets
+                           if self.answer_batch(len(self.batches), t["paragraph_index"])])
+
+def test_partial_batch_requeues_only_the_missing_items():
+    window = make_items(8)
+    llm = ScriptedLLM(lambda call, index: call > 1 or index % 2 == 0)
+    results = process_window(window, llm)
+    assert llm.batches == [list(range(8)), [1, 3, 5, 7]] and llm.singles == 0
+    assert [(index, result["answer"]) for index, result in results] == [(i, target) for i, _, target in window]
+
+def test_items_still_missing_fall_back_to_single_calls(monkeypatch):
+    monkeypatch.setattr(generate_dataset, "BATCH_REQUEUE_ATTEMPTS", 2)
+    window = make_items(6)
+    llm = ScriptedLLM(lambda call, index: index not in (2, 4))
+    stats = LLMStats()
+    results = process_window(window, llm, stats=stats)
+    assert llm.batches == [list(range(6)), [2, 4]] and llm.singles == 2
+    assert [(index, result["answer"]) for index, result in results] == [(i, target) for i, _, target in window]
+    assert stats.calls == 4 and stats.paragraphs == 6
+
+def test_malformed_batch_response_falls_back_to_single_calls():
+    window = make_items(3)
+    calls = []
+
+    def llm_fn(prompt):
+        calls.append("batch" if BATCH_TARGETS_RE.search(prompt) else "single")
+        return "Sorry, I cannot help with that." if calls[-1] == "batch" else json.dumps(item(answer="ok"))
+
+    results = process_window(window, llm_fn)
+    assert calls == ["batch", "batch", "single", "single", "single"]
+    assert [result["answer"] for _, result in results] == ["ok"] * 3
@@ -0,0 +1,54 @@
+import pytest
+from compare_models import FINETUNED_MODEL
+from load_test import run_load, summarize
+from ollama_stub import StubModel, start_stub
+
+# Two server slots: closed-loop throughput saturates at 2 x 1 / service time and extra users only queue
+TTFT = 0.05
+TOKENS_PER_S = 400.0
+PREFILL_TOKENS_PER_S = 10000.0
+PARALLEL = 2
+DURATION = 2.0
+OPTIONS = {"temperature": 0.0, "num_predict": 16}
+
+def stub_url(server) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/api/generate"
+
+@pytest.fixture(scope="module")
+def closed_runs():
+    server = start_stub({FINETUNED_MODEL: StubModel(TTFT, TOKENS_PER_S, prefill_tokens_per_s=PREFILL_TOKENS_PER_S)},
+                        parallel=PARALLEL)
+    runs = {users: run_load(stub_url(server), OPTIONS, mode="closed", concurrency=users, duration=DURATION)["summary"]
+            for users in (1, 2, 8)}
+    server.shutdown()
+    return runs
+
+def test_throughput_saturates_at_the_server_slots(closed_runs):
+    one, two, eight = closed_runs[1], closed_runs[2], closed_runs[8]
+    assert one["errors"] == two["errors"] == eight["errors"] == 0
+    assert 1.5 < two["throughput_rps"] / one["throughput_rps"] < 2.5
+    assert eight["throughput_rps"] < two["throughput_rps"] * 1.3
+
+def test_queueing_shows_in_ttft_and_littles_law(closed_runs):
+    one, eight = closed_runs[1], closed_runs[8]
+    assert eight["ttft_s"]["p50"] > 2 * one["ttft_s"]["p50"]
+    # Little's law: requests in flight = throughput x latency, close to the 8 users
+    assert 5 < eight["throughput_rps"] * eight["latency_s"]["p50"] < 11
+
+def test_long_prompts_are_slower(closed_runs):
+    by_class = closed_runs[1]["by_prompt_class"]
+    assert by_class["long"]["latency_p95_s"] > by_class["short"]["latency_p95_s"]
+
+def test_open_loop_error_rate_and_windows():
+    server = start_stub({FINETUNED_MODEL: StubModel(0.005, 4000.0, error_rate=0.2)}, parallel=4)
+    run = run_load(stub_url(server), OPTIONS, mode="open", rate=60.0, duration=DURATION)
+    server.shutdown()
+    summary = run["summary"]
+    assert summary["requests"] > 60
+    assert abs(summary["error_rate"] - 0.2) < 0.1
+    assert not summary["meets_slo"]
+    assert sum(w["requests"] for w in run["windows"]) == summary["requests"]
+
+def test_summary_of_no_requests():
+    summary = summarize([], 1.0)
+    assert summary["requests"] == 0 and summary["error_rate"] == 0.0 and not summary["meets_slo"]
@@ -0,0 +1,107 @@
+import copy
+import random
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+import torch
+from lora_server import BASE_NAME, Batcher, GenerationRequest, LoraEngine, start_server
+from synthetic_reports import make_paragraph
+from tiny_model import make_tiny_tokenizer
+
+HIDDEN_SIZE = 64
+LAYERS = 2
+LORA_RANK = 8
+ADAPTERS = ["circulars", "kyc", "payments"]
+PROMPTS = ["What is the repo rate?", "Explain the KYC norms for small accounts.", "How are frauds reported?"]
+NEW_TOKENS = 12
+TARGET_MODULES = ["q_proj", "k_proj", "v_proj", "o_proj", "gate_proj", "up_proj", "down_proj"]
+
+@pytest.fixture(scope="module")
+def setup(tmp_path_factory):
+    # A tiny random base, random (non-zero) LoRA adapters and their merged copies as the reference
+    from peft import LoraConfig, PeftModel, get_peft_model
+    from transformers import Qwen2Config, Qwen2ForCausalLM
+    rng = random.Random(0)
+    tokenizer = make_tiny_tokenizer([make_paragraph(rng) for _ in range(200)] + PROMPTS)
+    torch.manual_seed(3407)
+    config = Qwen2Config(vocab_size=len(tokenizer), hidden_size=HIDDEN_SIZE, intermediate_size=4 * HIDDEN_SIZE,
+                         num_hidden_layers=LAYERS, num_attention_heads=4, num_key_value_heads=2,
+                         tie_word_embeddings=False, eos_token_id=tokenizer.eos_token_id,
+                         pad_token_id=tokenizer.pad_token_id)
+    base = Qwen2ForCausalLM(config).eval()
+    adapters_dir = tmp_path_factory.mktemp("adapters")
+    adapters, merged = {}, {None: base}
+    for seed, name in enumerate(ADAPTERS):
+        torch.manual_seed(seed)
+        lora = LoraConfig(r=LORA_RANK, lora_alpha=LORA_RANK, init_lora_weights=False, task_type="CAUSAL_LM",
+                          target_modules=TARGET_MODULES)
+        adapters[name] = str(adapters_dir / name)
+        get_peft_model(copy.deepcopy(base), lora).save_pretrained(adapters[name])
+        merged[name] = PeftModel.from_pretrained(copy.deepcopy(base), adapters[name]).merge_and_unload().eval()
+    tokenizer.padding_side = "left"
+    expected = {(name, prompt): greedy(model, tokenizer, prompt) for name, model in merged.items() for prompt in PROMPTS}
+    return base, tokenizer, adapters, expected
+
+def greedy(model, tokenizer, prompt: str):
+    inputs = tokenizer([prompt], return_tensors="pt")
+    with torch.inference_mode():
+        output = model.generate(**inputs, max_new_tokens=NEW_TOKENS, do_sample=False, pad_token_id=tokenizer.pad_token_id)
+    row = output[0, inputs["input_ids"].shape[1]:].tolist()
+    return row[:row.index(tokenizer.eos_token_id)] if tokenizer.eos_token_id in row else row
+
+def make_engine(setup, **kwargs):
+    base, tokenizer, adapters, _ = setup
+    return LoraEngine(copy.deepcopy(base), tokenizer, adapters, **kwargs)
+
+def test_adapters_change_the_output(setup):
+    _, _, _, expected = setup
+    assert len({tuple(expected[(name, PROMPTS[0])]) for name in [None] + ADAPTERS}) > 2
+
+@pytest.mark.parametrize("mode", ["mixed", "swap"])
+def test_runtime_adapters_match_merged_models(setup, mode):
+    _, _, _, expected = setup
+    engine = make_engine(setup, max_loaded=len(ADAPTERS), mode=mode)
+    single = {key: engine.generate([GenerationRequest(key[0], key[1], NEW_TOKENS)])[0]["tokens"] for key in expected}
+    assert single == expected
+    # One batch mixing every adapter and the base model; left padding may flip a near-tie
+    batch = [GenerationRequest(name, prompt, NEW_TOKENS) for name, prompt in expected]
+    batched = {(r.adapter, r.prompt): out["tokens"] for r, out in zip(batch, engine.generate(batch))}
+    assert sum(batched[key] == expected[key] for key in expected) >= 0.9 * len(expected)
+
+def test_shared_base_is_smaller_than_merged_variants(setup):
+    base, _, _, _ = setup
+    engine = make_engine(setup, max_loaded=len(ADAPTERS))
+    engine.generate([GenerationRequest(name, PROMPTS[0], 1) for name in ADAPTERS])
+    shared = sum(p.numel() for p in engine.model.parameters())
+    assert shared < (len(ADAPTERS) + 1) * sum(p.numel() for p in base.parameters()) / 2
+
+def test_lru_loads_and_evicts(setup):
+    engine = make_engine(setup, max_loaded=2)
+    for name in ["circulars", "kyc", "circulars", "payments", "circulars", "kyc"]:
+        engine.generate([GenerationRequest(name, PROMPTS[0], 1)])
+    assert engine.stats["loads"] == 4 and engine.stats["evictions"] == 2
+    assert list(engine.loaded) == ["circulars", "kyc"]
+
+def test_batcher_serves_concurrent_requests(setup):
+    _, _, _, expected = setup
+    engine = make_engine(setup, max_loaded=len(ADAPTERS))
+    batcher = Batcher(engine, window=0.05)
+    with ThreadPoolExecutor(max_workers=len(expected)) as pool:
+        results = list(pool.map(lambda key: batcher.submit(GenerationRequest(key[0], key[1], NEW_TOKENS)).result(),
+                                expected))
+    assert engine.stats["batches"] < len(expected)
+    assert sum(r["tokens"] == expected[key] for r, key in zip(results, expected)) >= 0.9 * len(expected)
+
+def test_http_api_picks_the_adapter_by_model_name(setup):
+    _, tokenizer, adapters, expected = setup
+    server = start_server(make_engine(setup), port=0)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    body = requests.post(f"{url}/api/generate", json={"model": "kyc", "prompt": PROMPTS[1], "raw": True, "stream": False,
+                                                     "options": {"temperature": 0, "num_predict": NEW_TOKENS}},
+                         timeout=30).json()
+    missing = requests.post(f"{url}/api/generate", json={"model": "missing", "prompt": "x"}, timeout=30)
+    tags = [m["name"] for m in requests.get(f"{url}/api/tags", timeout=10).json()["models"]]
+    server.shutdown()
+    assert body["response"] == tokenizer.decode(expected[("kyc", PROMPTS[1])], skip_special_tokens=True)
+    assert missing.status_code == 404
+    assert tags == [BASE_NAME] + list(adapters)
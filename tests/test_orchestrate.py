@@ -0,0 +1,50 @@
+import sys
+import pytest
+import orchestrate
+from orchestrate import StageSpec
+
+def write(path: str, text: str) -> list:
+    return [sys.executable, "-c", f"open({path!r}, 'w').write({text!r})"]
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "input.txt").write_text("a")
+    return tmp_path
+
+def test_stage_runs_then_is_skipped(workspace, monkeypatch):
+    monkeypatch.setattr(orchestrate, "STAGES", [StageSpec("make", write("out.txt", "x"), ["input.txt"], ["out.txt"])])
+    assert orchestrate.run([], set())
+    assert orchestrate.Manifest().data["runs"][-1]["stages"]["make"]["status"] == "ran"
+    assert orchestrate.run([], set())
+    assert orchestrate.Manifest().data["runs"][-1]["stages"]["make"]["status"] == "skipped"
+    (workspace / "input.txt").write_text("b")
+    assert orchestrate.run([], set())
+    assert orchestrate.Manifest().data["runs"][-1]["stages"]["make"]["status"] == "ran"
+
+@pytest.mark.parametrize("command", [[sys.executable, "-c", "pass"], write("out.txt", "")],
+                         ids=["no output", "empty output"])
+def test_exit_0_without_output_fails(workspace, monkeypatch, command):
+    # e.g. generate_dataset.py without an API key: the stage must not be recorded as up to date
+    monkeypatch.setattr(orchestrate, "STAGES", [
+        StageSpec("make", command, ["input.txt"], ["out.txt"]),
+        StageSpec("after", write("after.txt", "x"), ["out.txt"], ["after.txt"], deps=["make"])])
+    assert not orchestrate.run([], set())
+    manifest = orchestrate.Manifest()
+    assert manifest.data["runs"][-1]["stages"]["make"]["status"] == "failed"
+    assert manifest.data["runs"][-1]["stages"]["after"]["status"] == "blocked"
+    assert "make" not in manifest.data["stages"]
+    assert not orchestrate.run([], set())  # Still not fresh on the next run
+
+def test_failing_exit_code(workspace, monkeypatch):
+    monkeypatch.setattr(orchestrate, "STAGES", [StageSpec("make", [sys.executable, "-c", "exit(3)"], ["input.txt"])])
+    assert not orchestrate.run([], set())
+    assert orchestrate.Manifest().data["runs"][-1]["stages"]["make"]["returncode"] == 3
+
+def test_scripts_exit_non_zero_on_failure(workspace, monkeypatch):
+    import generate_dataset
+    import prepare_finetune_dataset
+    monkeypatch.setattr(generate_dataset, "GEMINI_API_KEY", None)
+    monkeypatch.setattr(generate_dataset, "LLM_CACHE_MODE", "on")
+    assert generate_dataset.main() is False
+    assert prepare_finetune_dataset.main() is False  # No dataset.jsonl
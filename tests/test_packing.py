@@ -0,0 +1,87 @@
+import random
+import pytest
+import torch
+import torch.nn.functional as F
+from packing import IGNORE_INDEX, PackedCollator, PackedDataset, pack_ffd, pack_samples
+from tiny_model import TINY_VOCAB_SIZE, make_tiny_model
+
+NUM_SAMPLES = 24
+MAX_LENGTH = 256
+PARITY_TOLERANCE = 1e-4
+
+@pytest.fixture(scope="module")
+def samples():
+    rng = random.Random(3407)
+    lengths = [max(16, min(MAX_LENGTH, int(rng.lognormvariate(4.5, 0.6)))) for _ in range(NUM_SAMPLES)]
+    return [[rng.randrange(1, TINY_VOCAB_SIZE) for _ in range(n)] for n in lengths]
+
+def padded_batch(sample):
+    return {"input_ids": torch.tensor([sample]), "attention_mask": torch.ones(1, len(sample), dtype=torch.long),
+            "labels": torch.tensor([sample])}
+
+def total_loss(model, batches):
+    # Token-averaged next-token loss over all batches and the gradients of its sum
+    model.zero_grad()
+    total, tokens = 0.0, 0
+    for batch in batches:
+        logits = model(**{k: v for k, v in batch.items() if k != "labels"}).logits[:, :-1]
+        labels = batch["labels"][:, 1:]
+        loss = F.cross_entropy(logits.reshape(-1, logits.shape[-1]).float(), labels.reshape(-1),
+                               ignore_index=IGNORE_INDEX, reduction="sum")
+        loss.backward()
+        total += loss.item()
+        tokens += int((labels != IGNORE_INDEX).sum())
+    return total / tokens, [p.grad.clone() for p in model.parameters()]
+
+@pytest.fixture(scope="module")
+def reference(samples):
+    return total_loss(make_tiny_model(attn_implementation="sdpa"), [padded_batch(s) for s in samples])
+
+def test_ffd_bins_hold_every_sample_once():
+    rng = random.Random(0)
+    lengths = [rng.randint(1, 600) for _ in range(500)]
+    bins = pack_ffd(lengths, 512)
+    assert sorted(i for b in bins for i in b) == list(range(len(lengths)))
+    assert all(sum(min(lengths[i], 512) for i in b) <= 512 for b in bins)
+
+def test_packed_rows(samples):
+    packed = pack_samples(samples, MAX_LENGTH)
+    assert len(packed) < len(samples)
+    assert sum(len(p["input_ids"]) for p in packed) == sum(len(s) for s in samples)
+    for row in packed:
+        assert len(row["input_ids"]) <= MAX_LENGTH
+        # Each sample restarts at position 0 and its first token is not a target
+        starts = [i for i, position in enumerate(row["position_ids"]) if position == 0]
+        assert all(row["labels"][i] == IGNORE_INDEX for i in starts)
+    assert len(PackedDataset(samples, MAX_LENGTH)) == len(packed)
+    assert len(PackedDataset(samples, MAX_LENGTH, pack=False)) == len(samples)
+
+@pytest.mark.parametrize("attention,implementation", [("mask", "sdpa"), ("mask", "eager"), ("position_ids", "sdpa")])
+def test_packed_matches_unpacked(samples, reference, attention, implementation):
+    reference_loss, reference_grads = reference
+    collator = PackedCollator(pad_token_id=0, attention=attention)
+    model = make_tiny_model(attn_implementation=implementation)
+    loss, grads = total_loss(model, [collator([p]) for p in pack_samples(samples, MAX_LENGTH)])
+    assert loss == pytest.approx(reference_loss, rel=PARITY_TOLERANCE)
+    assert max((g - r).abs().max().item() for g, r in zip(grads, reference_grads)) <= PARITY_TOLERANCE
+
+def test_padded_batch_of_packed_rows(samples, reference):
+    # Two rows of different lengths in one batch: the padding must not join the shorter row's last sample
+    collator = PackedCollator(pad_token_id=0)
+    packed = pack_samples(samples, MAX_LENGTH)
+    batches = [collator(packed[i:i + 2]) for i in range(0, len(packed), 2)]
+    loss, _ = total_loss(make_tiny_model(attn_implementation="sdpa"), batches)
+    assert loss == pytest.approx(reference[0], rel=PARITY_TOLERANCE)
+
+def test_packing_without_isolation_leaks(samples):
+    # Logits of a row's second sample: packed with isolation they equal the sample on its own;
+    # under plain causal attention (the control) they see the first sample
+    first, second = samples[0][:64], samples[1][:48]  # FFD places the longer sample first
+    row = pack_samples([first, second], MAX_LENGTH)[0]
+    model = make_tiny_model(attn_implementation="sdpa")
+    with torch.no_grad():
+        alone = model(input_ids=torch.tensor([second])).logits[0]
+        isolated = model(**{k: v for k, v in PackedCollator(pad_token_id=0)([row]).items() if k != "labels"}).logits[0]
+        leaky = model(input_ids=torch.tensor([row["input_ids"]])).logits[0]
+    assert torch.allclose(isolated[len(first):], alone, atol=PARITY_TOLERANCE)
+    assert (leaky[len(first):] - alone).abs().max().item() > 100 * PARITY_TOLERANCE
@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import pdf_extract
+from pdf_extract import PAGES_PER_TASK, TASKS_IN_FLIGHT, extract_pages
+from synthetic_reports import make_report
+
+@pytest.fixture(scope="module")
+def report(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("reports") / "report.pdf")
+    make_report(path, 300)
+    return path
+
+def test_parallel_matches_serial(report):
+    serial = list(extract_pages(report, workers=1, cache_dir=None))
+    assert len(serial) > 4 * PAGES_PER_TASK
+    assert list(extract_pages(report, workers=2, cache_dir=None)) == serial
+
+def test_in_flight_ranges_are_bounded(report, monkeypatch):
+    # Threads stand in for worker processes so the submissions can be counted
+    submitted = []
+
+    class CountingExecutor(ThreadPoolExecutor):
+        def submit(self, fn, *args):
+            submitted.append(args[1])
+            return super().submit(fn, *args)
+
+    monkeypatch.setattr(pdf_extract, "ProcessPoolExecutor", CountingExecutor)
+    workers = 2
+    for i, _ in enumerate(extract_pages(report, workers=workers, cache_dir=None)):
+        ranges_consumed = i // PAGES_PER_TASK
+        assert len(submitted) <= ranges_consumed + 1 + TASKS_IN_FLIGHT * workers
+    assert submitted == sorted(submitted)
+
+def test_cache_published_only_when_complete(report, tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    pages = extract_pages(report, workers=1, cache_dir=cache_dir)
+    next(pages)
+    pages.close()  # Abandoned part-way
+    assert os.listdir(cache_dir) == []
+    full = list(extract_pages(report, workers=1, cache_dir=cache_dir))
+    assert len(os.listdir(cache_dir)) == 1
+    assert list(extract_pages(report, workers=1, cache_dir=cache_dir)) == full
@@ -0,0 +1,68 @@
+import os
+import glob
+import json
+from functools import partial
+import torch
+import generate_dataset
+import prepare_finetune_dataset
+from dataset_store import DATASET_FILE, iter_dataset
+from fake_llm import FakeLLM
+from generate_dataset import filter_paragraphs
+from packing import PackedCollator, PackedDataset
+from pdf_extract import extract_pages
+from pretokenize import load_or_build
+from segment import segment_pages
+from synthetic_reports import make_corpus
+from tiny_model import make_tiny_model, make_tiny_tokenizer
+from token_counts import TokenCounter
+
+NUM_REPORTS = 2
+PARAGRAPHS_PER_REPORT = 60
+TRAIN_STEPS = 10
+TRAIN_MAX_LENGTH = 512
+
+def test_synthetic_corpus_runs_through_every_stage(tmp_path, monkeypatch):
+    # The stages bench_pipeline.py times, at a size that runs in seconds
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(generate_dataset, "LLM_CACHE_MODE", "off")
+    monkeypatch.setattr(generate_dataset, "REQUESTS_PER_MINUTE", 10**9)
+    monkeypatch.setattr(generate_dataset, "TOKENS_PER_MINUTE", 10**12)
+    paths = make_corpus(generate_dataset.REPORTS_DIR, NUM_REPORTS, PARAGRAPHS_PER_REPORT)
+    pages = [list(extract_pages(path, cache_dir=None)) for path in paths]
+    paragraphs = sum(len(list(filter_paragraphs(segment_pages(report)))) for report in pages)
+
+    assert generate_dataset.main(llm_fn=FakeLLM(latency=0.0, seed=0))
+    entries = sum(1 for _ in iter_dataset(DATASET_FILE))
+    # FakeLLM marks 10% of answers invalid; the prefilter and near-duplicate check drop a few more
+    assert 0.8 * paragraphs <= entries <= paragraphs
+
+    tokenizer = make_tiny_tokenizer(p for report in pages for p in report)
+    tokenizer.backend_tokenizer.save("tokenizer.json")
+    monkeypatch.setattr(prepare_finetune_dataset, "TokenCounter",
+                        partial(TokenCounter, tokenizer_path=str(tmp_path / "tokenizer.json")))
+    monkeypatch.setattr("sys.argv", ["prepare_finetune_dataset.py"])
+    prepare_finetune_dataset.main()
+    train_files = sorted(glob.glob(os.path.join(prepare_finetune_dataset.OUTPUT_DIR, "train", "*", "*.jsonl")))
+    written = {path: os.stat(path).st_mtime_ns for path in train_files}
+    # An unchanged re-run leaves every shard alone
+    prepare_finetune_dataset.main()
+    assert {path: os.stat(path).st_mtime_ns for path in train_files} == written
+    with open(prepare_finetune_dataset.MANIFEST_FILE, 'r') as f:
+        splits = json.load(f)["samples"]
+    assert 0 < splits["train"] <= entries
+
+    samples, _ = load_or_build(train_files, tokenizer, "pretokenized")
+    assert len(samples) == splits["train"]
+
+    model = make_tiny_model()
+    dataset = PackedDataset(samples, TRAIN_MAX_LENGTH)
+    collator = PackedCollator(pad_token_id=0)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-3)
+    losses = []
+    for step in range(TRAIN_STEPS):
+        loss = model(**collator([dataset[step % len(dataset)]])).loss
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+        losses.append(loss.item())
+    assert losses[-1] < losses[0]
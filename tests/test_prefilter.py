@@ -0,0 +1,20 @@
+from prefilter import PageLineCounter
+from segment import HEADER_SAMPLE_PAGES, segment_pages
+
+FOOTER = "Reserve Bank of India Bulletin"
+
+def pages(count: int):
+    # The footer only appears once the header sample has been read
+    for n in range(count):
+        body = f"Paragraph on page {n} about the conduct of monetary policy during the year."
+        yield body if n < HEADER_SAMPLE_PAGES else f"{body}\n\n{FOOTER}"
+
+def test_counts_are_final_before_the_first_paragraph():
+    counter = PageLineCounter()
+    paragraphs = segment_pages(counter.observe(pages(40)))
+    next(paragraphs)
+    counts = dict(counter.counts)
+    assert counter.pages_seen == HEADER_SAMPLE_PAGES
+    list(paragraphs)
+    assert dict(counter.counts) == counts
+    assert not counter.is_repeated(FOOTER)
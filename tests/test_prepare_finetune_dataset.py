@@ -0,0 +1,139 @@
+import os
+import glob
+import json
+import shutil
+import hashlib
+from functools import partial
+import pytest
+import prepare_finetune_dataset as prepare
+from dataset_store import DATASET_FILE, TRACKER_FILE, DatasetWriter, Tracker
+from tiny_model import make_tiny_tokenizer
+from token_counts import TokenCounter
+
+BOILERPLATE = [("What does the Reserve Bank say about {} in its annual statement on policy?",
+                "The Reserve Bank stated that {} remained within the tolerance band set by the committee "
+                "and that it would continue to monitor the evolving conditions closely.")]
+TOPICS = ["inflation", "liquidity", "credit growth", "payment systems", "deposit rates", "bank capital"]
+
+def pairs(report: str, shared: int, unique: int):
+    # `shared` boilerplate pairs repeated across reports, then pairs specific to this report
+    question, answer = BOILERPLATE[0]
+    items = [(question.format(t), answer.format(t)) for t in TOPICS[:shared]]
+    items += [(f"What was new in {report} for item {i}?", f"{report} introduced measure {i} on {TOPICS[i % 6]} "
+               f"with specific targets for regulated entities in year {2000 + i}.") for i in range(unique)]
+    return [{"question": q, "answer": a, "file": report} for q, a in items]
+
+def write_report(tracker: Tracker, report: str, entries):
+    # One completed generation of a report at the tail of the log, as generate_dataset.py leaves it
+    writer = DatasetWriter(DATASET_FILE, tracker.dataset_offset)
+    sha256 = hashlib.sha256(json.dumps(entries).encode('utf-8')).hexdigest()
+    tracker.begin_generation(writer, report, {"sha256": sha256, "size": 1, "mtime_ns": 1})
+    for entry in entries:
+        writer.append(entry)
+    tracker.checkpoint(writer, tracker.dataset_count + len(entries), report, len(entries), completed=True,
+                       entries=len(entries))
+    writer.close()
+
+def outputs():
+    records = []
+    for path in glob.glob(os.path.join(prepare.OUTPUT_DIR, "*", "bucket-*", "*.jsonl")):
+        with open(path, 'r') as f:
+            records += [line for line in f]
+    return sorted(records)
+
+def run_prepare(monkeypatch, *args):
+    monkeypatch.setattr("sys.argv", ["prepare_finetune_dataset.py", *args])
+    prepare.main()
+    return outputs()
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    tokenizer = make_tiny_tokenizer([e["question"] + " " + e["answer"] for e in pairs("r", 6, 12)])
+    tokenizer.backend_tokenizer.save("tokenizer.json")
+    monkeypatch.setattr(prepare, "TokenCounter", partial(TokenCounter, tokenizer_path=str(tmp_path / "tokenizer.json")))
+    return Tracker(TRACKER_FILE, DATASET_FILE)
+
+def rebuilt(monkeypatch):
+    # What a from-scratch run makes of the same inputs
+    shutil.copytree(prepare.OUTPUT_DIR, "incremental")
+    result = run_prepare(monkeypatch, "--rebuild")
+    shutil.rmtree(prepare.OUTPUT_DIR)
+    shutil.move("incremental", prepare.OUTPUT_DIR)
+    return result
+
+def test_removed_report_restores_its_duplicates(workspace, monkeypatch):
+    write_report(workspace, "a.pdf", pairs("a.pdf", 6, 4))
+    write_report(workspace, "b.pdf", pairs("b.pdf", 6, 4))
+    first = run_prepare(monkeypatch)
+    assert len(first) == 6 + 4 + 4  # b.pdf's boilerplate is dropped as near-duplicates of a.pdf's
+
+    del workspace.data["files"]["a.pdf"]
+    workspace.save()
+    after = run_prepare(monkeypatch)
+    assert len(after) == 6 + 4
+    assert after == rebuilt(monkeypatch)
+
+def test_changed_report_restores_its_duplicates(workspace, monkeypatch):
+    write_report(workspace, "a.pdf", pairs("a.pdf", 6, 4))
+    write_report(workspace, "b.pdf", pairs("b.pdf", 6, 4))
+    run_prepare(monkeypatch)
+
+    write_report(workspace, "a.pdf", pairs("a.pdf", 0, 5))  # Boilerplate no longer in a.pdf
+    after = run_prepare(monkeypatch)
+    assert len(after) == 6 + 4 + 5
+    assert after == rebuilt(monkeypatch)
+
+def test_unrelated_report_left_alone(workspace, monkeypatch):
+    write_report(workspace, "a.pdf", pairs("a.pdf", 6, 4))
+    write_report(workspace, "b.pdf", pairs("b.pdf", 0, 4))
+    run_prepare(monkeypatch)
+    shard = glob.glob(os.path.join(prepare.OUTPUT_DIR, "*", "bucket-*", "b.pdf.jsonl"))[0]
+    mtime = os.stat(shard).st_mtime_ns
+
+    write_report(workspace, "a.pdf", pairs("a.pdf", 3, 4))
+    run_prepare(monkeypatch)
+    assert os.stat(shard).st_mtime_ns == mtime
+
+def totals():
+    with open(prepare.MANIFEST_FILE, 'r') as f:
+        manifest = json.load(f)
+    return {key: manifest[key] for key in ("samples", "tokens", "buckets", "length_counts")}
+
+def test_running_totals_match_a_rebuild(workspace, monkeypatch):
+    for report, shared in (("a.pdf", 6), ("b.pdf", 6), ("c.pdf", 0)):
+        write_report(workspace, report, pairs(report, shared, 4))
+    run_prepare(monkeypatch)
+    reads = []
+    read_source = prepare.read_source
+    monkeypatch.setattr(prepare, "read_source", lambda source: reads.append(source) or read_source(source))
+    run_prepare(monkeypatch)
+    assert reads == []  # Nothing changed, no sidecar is read
+
+    write_report(workspace, "a.pdf", pairs("a.pdf", 0, 5))
+    del workspace.data["files"]["c.pdf"]
+    workspace.save()
+    run_prepare(monkeypatch)
+    # a.pdf and c.pdf come out, b.pdf is redone for its restored near-duplicates
+    assert sorted(reads) == ["a.pdf", "b.pdf", "c.pdf"]
+    incremental = totals()
+    assert incremental["samples"]["train"] + incremental["samples"]["validation"] == 5 + 6 + 4
+    run_prepare(monkeypatch, "--rebuild")
+    assert totals() == incremental
+
+def test_manifest_without_running_totals_is_recounted(workspace, monkeypatch):
+    write_report(workspace, "a.pdf", pairs("a.pdf", 6, 4))
+    write_report(workspace, "b.pdf", pairs("b.pdf", 0, 4))
+    run_prepare(monkeypatch)
+    expected = totals()
+    with open(prepare.MANIFEST_FILE, 'r') as f:
+        manifest = json.load(f)
+    del manifest["length_counts"], manifest["buckets"]
+    with open(prepare.MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f)
+    write_report(workspace, "b.pdf", pairs("b.pdf", 0, 4)[:2])
+    run_prepare(monkeypatch)
+    after = totals()
+    assert sum(after["samples"].values()) == sum(expected["samples"].values()) - 2
+    run_prepare(monkeypatch, "--rebuild")
+    assert totals() == after
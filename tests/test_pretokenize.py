@@ -0,0 +1,51 @@
+import os
+import json
+import random
+import pytest
+from pretokenize import iter_texts, load_or_build
+from tiny_model import make_tiny_tokenizer
+
+NUM_SHARDS = 3
+SAMPLES_PER_SHARD = 40
+WORDS = "the reserve bank revised policy repo rate inflation target liquidity credit growth banks".split()
+
+def write_shard(path: str, rng: random.Random):
+    with open(path, 'w', encoding='utf-8') as f:
+        for _ in range(SAMPLES_PER_SHARD):
+            answer = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 60)))
+            f.write(json.dumps({"instruction": "Answer the question.", "input": f"Question: {rng.choice(WORDS)}?",
+                                "output": answer}) + "\n")
+
+@pytest.fixture
+def shards(tmp_path):
+    rng = random.Random(3407)
+    paths = [str(tmp_path / f"report_{n}.jsonl") for n in range(NUM_SHARDS)]
+    for path in paths:
+        write_shard(path, rng)
+    return paths
+
+@pytest.fixture
+def tokenizer(shards):
+    return make_tiny_tokenizer(iter_texts(shards))
+
+def test_cached_ids_match_per_sample_tokenization(shards, tokenizer, tmp_path):
+    cache_dir = str(tmp_path / "pretokenized")
+    samples, hit = load_or_build(shards, tokenizer, cache_dir)
+    assert not hit
+    expected = [tokenizer(text, add_special_tokens=False)["input_ids"] for text in iter_texts(shards)]
+    assert len(samples) == NUM_SHARDS * SAMPLES_PER_SHARD
+    assert [samples[i].tolist() for i in range(len(samples))] == expected
+    assert samples.meta["num_tokens"] == sum(len(ids) for ids in expected)
+
+    warm, hit = load_or_build(list(reversed(shards)), tokenizer, cache_dir)
+    assert hit
+    assert warm.path == samples.path
+
+def test_changed_data_is_retokenized(shards, tokenizer, tmp_path):
+    cache_dir = str(tmp_path / "pretokenized")
+    before, _ = load_or_build(shards, tokenizer, cache_dir)
+    write_shard(shards[1], random.Random(1))
+    after, hit = load_or_build(shards, tokenizer, cache_dir)
+    assert not hit
+    assert after.path != before.path
+    assert sorted(os.listdir(cache_dir)) == sorted([os.path.basename(before.path), os.path.basename(after.path)])
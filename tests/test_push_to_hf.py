@@ -0,0 +1,98 @@
+import os
+import json
+import random
+import shutil
+import filecmp
+import pytest
+from push_to_hf import PUBLISHED_MANIFEST, HashCache, LocalHub, collect_files, push
+
+GGUF_SIZE = 2**20
+CHUNK_SIZE = 64 * 2**10
+WORKERS = 4
+REPO_ID = "test/qwen2.5-7b-rbi"
+GGUF_NAME = "qwen2.5_7b_finetuned-Q4_K_M.gguf"
+
+def write_random(path, size: int, seed: int):
+    with open(path, 'wb') as f:
+        f.write(random.Random(seed).randbytes(size))
+
+@pytest.fixture
+def artifacts(tmp_path):
+    gguf = tmp_path / "build" / GGUF_NAME
+    lora_dir = tmp_path / "build" / "lora_model"
+    lora_dir.mkdir(parents=True)
+    write_random(gguf, GGUF_SIZE, 1)
+    write_random(lora_dir / "adapter_model.safetensors", GGUF_SIZE // 4, 2)
+    (lora_dir / "adapter_config.json").write_text(json.dumps({"r": 16, "lora_alpha": 16}))
+    files = collect_files(str(gguf), str(lora_dir))
+    return files, str(tmp_path / "hub"), HashCache(str(tmp_path / "hashes.json"))
+
+def run(hub_dir: str, files, hashes, fail_after_parts=None, **kwargs):
+    return push(LocalHub(hub_dir, REPO_ID, fail_after_parts=fail_after_parts), files, hashes,
+                chunk_size=CHUNK_SIZE, workers=WORKERS, **kwargs)
+
+def test_first_push_publishes_every_file(artifacts):
+    files, hub_dir, hashes = artifacts
+    report = run(hub_dir, files, hashes)
+    total = sum(os.path.getsize(local) for local, _ in files)
+    assert report["bytes_uploaded"] == report["bytes_total"] == total
+    repo_dir = os.path.join(hub_dir, REPO_ID)
+    assert all(filecmp.cmp(local, os.path.join(repo_dir, path), shallow=False) for local, path in files)
+    manifest = LocalHub(hub_dir, REPO_ID).published()
+    assert manifest == {path: {"sha256": hashes.sha256(local), "size": os.path.getsize(local)} for local, path in files}
+    assert [path for _, path in files] == [GGUF_NAME, "lora_adapters/adapter_config.json",
+                                           "lora_adapters/adapter_model.safetensors"]
+
+def test_unchanged_push_sends_and_hashes_nothing(artifacts):
+    files, hub_dir, hashes = artifacts
+    run(hub_dir, files, hashes)
+    again = run(hub_dir, files, HashCache(hashes.filepath))
+    assert again["changed"] == [] and again["bytes_uploaded"] == 0 and again["hashed_bytes"] == 0
+    assert again["bytes_skipped"] == again["bytes_total"]
+
+def test_edited_file_is_the_only_one_sent(artifacts):
+    files, hub_dir, hashes = artifacts
+    run(hub_dir, files, hashes)
+    config = next(local for local, path in files if path.endswith("adapter_config.json"))
+    with open(config, 'w') as f:
+        json.dump({"r": 16, "lora_alpha": 32}, f)
+    edited = run(hub_dir, files, hashes)
+    assert edited["changed"] == ["lora_adapters/adapter_config.json"]
+    assert edited["bytes_uploaded"] == os.path.getsize(config)
+    assert filecmp.cmp(config, os.path.join(hub_dir, REPO_ID, "lora_adapters", "adapter_config.json"), shallow=False)
+
+def test_interrupted_upload_resumes_from_received_parts(artifacts):
+    files, hub_dir, hashes = artifacts
+    run(hub_dir, files, hashes)
+    gguf = files[0][0]
+    write_random(gguf, GGUF_SIZE, 7)
+    with pytest.raises(ConnectionError):
+        run(hub_dir, files, hashes, fail_after_parts=5)
+    # The repo still points at the old content until the upload completes
+    assert LocalHub(hub_dir, REPO_ID).published()[GGUF_NAME]["sha256"] != hashes.sha256(gguf)
+    resumed = run(hub_dir, files, hashes)
+    assert resumed["bytes_resumed"] == 5 * CHUNK_SIZE
+    assert resumed["bytes_uploaded"] == GGUF_SIZE - 5 * CHUNK_SIZE
+    assert filecmp.cmp(gguf, os.path.join(hub_dir, REPO_ID, GGUF_NAME), shallow=False)
+
+def test_same_content_under_a_new_name_is_not_sent(artifacts, tmp_path):
+    files, hub_dir, hashes = artifacts
+    run(hub_dir, files, hashes)
+    copy_path = tmp_path / "build" / "renamed.gguf"
+    shutil.copyfile(files[0][0], copy_path)
+    renamed = run(hub_dir, files + [(str(copy_path), "renamed.gguf")], hashes)
+    assert renamed["changed"] == ["renamed.gguf"]
+    assert renamed["bytes_uploaded"] == 0 and renamed["bytes_deduplicated"] == GGUF_SIZE
+    assert filecmp.cmp(copy_path, os.path.join(hub_dir, REPO_ID, "renamed.gguf"), shallow=False)
+
+def test_dry_run_and_force(artifacts):
+    files, hub_dir, hashes = artifacts
+    plan = run(hub_dir, files, hashes, dry_run=True)
+    assert len(plan["changed"]) == len(files) and plan["bytes_uploaded"] == 0
+    assert not os.path.exists(os.path.join(hub_dir, REPO_ID, PUBLISHED_MANIFEST))
+
+    run(hub_dir, files, hashes)
+    forced = run(hub_dir, files, hashes, force=True)
+    # Every file is committed again; the hub already holds their content
+    assert len(forced["changed"]) == len(files)
+    assert forced["bytes_uploaded"] == 0 and forced["bytes_deduplicated"] == forced["bytes_total"]
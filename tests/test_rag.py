@@ -0,0 +1,95 @@
+import os
+import time
+import numpy as np
+import pytest
+import rag
+from rag import RagIndex, build_index, build_prompt, write_index
+from generate_dataset import clean_items, filter_paragraphs, window_paragraphs
+from pdf_extract import extract_pages
+from segment import segment_pages
+from synthetic_reports import make_corpus, make_report
+
+NUM_REPORTS = 3
+PARAGRAPHS = 40
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch, hashing_embedder):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(rag, "load_embedder", lambda name: hashing_embedder if name != "none" else None)
+    paths = make_corpus("Reports", num_reports=NUM_REPORTS, paragraphs_per_report=PARAGRAPHS)
+    return paths, build_index("Reports", "hashing")
+
+def test_passages_are_keyed_like_dataset_entries(corpus, hashing_embedder):
+    paths, _ = corpus
+    index = RagIndex(embedder=hashing_embedder)
+    passages = [index.passage(i) for i in range(len(index))]
+    index.close()
+    # Indices and text match what generate_dataset.py feeds the LLM, so dataset entries'
+    # paragraph_index points at their source passage
+    expected = set()
+    for path in paths:
+        items = window_paragraphs(filter_paragraphs(segment_pages(extract_pages(path))))
+        expected |= {(os.path.basename(path), i, target) for i, _, target in clean_items(items)}
+    assert {(p["file"], p["paragraph_index"], p["text"]) for p in passages} == expected
+
+@pytest.mark.parametrize("mode", rag.SEARCH_MODES)
+def test_search_finds_a_passage_from_an_excerpt(corpus, hashing_embedder, mode):
+    index = RagIndex(embedder=hashing_embedder)
+    sampled = range(0, len(index), 7)
+    found = sum(any(hit["id"] == i for hit in index.search(" ".join(index.passage(i)["text"].split()[5:35]), 5, mode))
+                for i in sampled)
+    index.close()
+    assert found >= 0.9 * len(sampled)
+
+def test_prompt_uses_the_training_layout(corpus, hashing_embedder):
+    index = RagIndex(embedder=hashing_embedder)
+    prompt = build_prompt("What was reviewed?", index.search("reserve bank reviewed framework", 2))
+    index.close()
+    assert prompt.startswith("<|im_start|>system\n")
+    assert "Context:\n[1] (synthetic_report_" in prompt
+    assert prompt.endswith("Question: What was reviewed?<|im_end|>\n<|im_start|>assistant\n")
+
+def test_only_changed_reports_are_reindexed(corpus, hashing_embedder):
+    _, first = corpus
+    calls = hashing_embedder.calls
+    again = build_index("Reports", "hashing")
+    assert again["index_dir"] == first["index_dir"]
+    assert hashing_embedder.calls == calls
+
+    time.sleep(0.01)
+    make_report(os.path.join("Reports", "synthetic_report_001.pdf"), PARAGRAPHS // 2, seed=99)
+    changed = build_index("Reports", "hashing")
+    assert changed["extracted"] == 1
+    assert changed["passages"] < first["passages"]
+    assert hashing_embedder.calls == calls + 1
+    assert not os.path.exists(os.path.join(rag.RAG_DIR, first["index_dir"]))
+
+def test_ivf_probe_recall(tmp_path, monkeypatch):
+    # Clustered random vectors: probing every IVF list is an exact search, fewer lists trade recall
+    monkeypatch.setattr(rag, "IVF_MIN_PASSAGES", 0)
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(20, 32))
+    vectors = (centers[rng.integers(0, 20, 2000)] + 0.5 * rng.normal(size=(2000, 32))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    info = write_index(str(tmp_path), [("synthetic", [(i, f"passage {i}") for i in range(2000)], vectors)], "stub")
+    index = RagIndex(str(tmp_path), embedder=object())
+    overlaps = []
+    for nprobe in (1, 4, info["ivf_lists"]):
+        overlap = 0.0
+        for query in vectors[:50]:
+            exact = {i for i, _ in index.dense_search(query, 10, exact=True)}
+            overlap += len(exact & {i for i, _ in index.dense_search(query, 10, nprobe=nprobe)}) / 10
+        overlaps.append(overlap / 50)
+    index.close()
+    assert overlaps == sorted(overlaps)
+    assert overlaps[-1] == 1.0
+
+def test_bm25_only_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    make_corpus("Reports", num_reports=1, paragraphs_per_report=PARAGRAPHS)
+    info = build_index("Reports", "none")
+    assert info["embed_model"] == "none" and info["ivf_lists"] == 0
+    index = RagIndex()
+    hits = index.search(" ".join(index.passage(3)["text"].split()[:30]), 3, mode="dense")
+    index.close()
+    assert hits[0]["id"] == 3
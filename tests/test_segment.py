@@ -0,0 +1,72 @@
+import pytest
+from pdf_extract import extract_pages
+from segment import MAX_PARAGRAPH_TOKENS, estimate_tokens, segment_pages
+from synthetic_reports import make_report
+
+# Paragraph ends whose last line is full width cannot be told apart from wrapping, so a few
+# neighbouring paragraphs merge; MIN_EXACT_MATCH bounds that and everything else is forbidden.
+MIN_EXACT_MATCH = 0.75
+TITLE = "Reserve Bank of India Report 2024"
+
+GOLDEN_PAGES = [
+    "Annual Report 2023-24\n"
+    "1. The Reserve Bank revised the framework for regu-\n"
+    "lated entities during the year, covering prepaid payment\n"
+    "instruments and card networks.\n"
+    "2. Banks were advised to strengthen their grievance redressal mechanisms and to report\n"
+    "complaints to the ombudsman, which continued to review the",
+    "Annual Report 2023-24\n"
+    "trends on a quarterly basis.\n"
+    "Liquidity conditions eased in the second half of the year.\n"
+    "12",
+    "Annual Report 2023-24\n"
+    "Monetary policy remained focused on bringing inflation back to the target.\n"
+    "13",
+]
+GOLDEN_PARAGRAPHS = [
+    "1. The Reserve Bank revised the framework for regulated entities during the year, covering prepaid payment instruments and card networks.",
+    "2. Banks were advised to strengthen their grievance redressal mechanisms and to report complaints to the ombudsman, which continued to review the trends on a quarterly basis.",
+    "Liquidity conditions eased in the second half of the year.",
+    "Monetary policy remained focused on bringing inflation back to the target.",
+]
+
+def normalize(text: str) -> str:
+    return " ".join(text.split())
+
+def test_golden_pages():
+    # Running headers, page numbers, hyphenation and a paragraph carried over a page break
+    assert [normalize(p) for p in segment_pages(GOLDEN_PAGES)] == GOLDEN_PARAGRAPHS
+
+def test_blank_lines_and_list_items_start_paragraphs():
+    pages = ["First paragraph of text.\n\nSecond paragraph of text.\n- a list item\n- another item"]
+    assert [normalize(p) for p in segment_pages(pages)] == [
+        "First paragraph of text.", "Second paragraph of text.", "- a list item", "- another item"]
+
+def test_long_paragraph_split_at_sentences():
+    sentence = "The committee reviewed the liquidity framework in detail. "
+    paragraphs = list(segment_pages([sentence * 200]))
+    assert len(paragraphs) > 1
+    assert all(estimate_tokens(p) <= MAX_PARAGRAPH_TOKENS for p in paragraphs)
+    assert all(normalize(p).endswith(".") for p in paragraphs)
+    assert normalize(" ".join(paragraphs)) == normalize(sentence * 200)
+
+@pytest.fixture(scope="module", params=[100, 400])
+def synthetic_report(request, tmp_path_factory):
+    pdf_path = str(tmp_path_factory.mktemp("reports") / f"report_{request.param}.pdf")
+    paragraphs = make_report(pdf_path, request.param, seed=request.param, title=TITLE)
+    return [normalize(p) for p in paragraphs], list(extract_pages(pdf_path, workers=1, cache_dir=None))
+
+def test_synthetic_report_structure(synthetic_report):
+    truth, pages = synthetic_report
+    # Structure is checked without the token cap, which may legitimately split merged paragraphs
+    got = [normalize(p) for p in segment_pages(pages, max_tokens=10**9)]
+    assert len(set(got) & set(truth)) / len(truth) >= MIN_EXACT_MATCH
+    # No true paragraph may be split: each must sit inside a single output paragraph
+    joined = "\n".join(got)
+    assert [t for t in truth if t not in joined] == []
+    assert [g for g in got if TITLE in g or "Page " in g] == []
+    assert [w for g in got for w in g.split() if w.endswith("-") and w[:-1].isalpha()] == []
+
+def test_synthetic_report_within_budget(synthetic_report):
+    _, pages = synthetic_report
+    assert all(estimate_tokens(p) <= MAX_PARAGRAPH_TOKENS for p in segment_pages(pages))
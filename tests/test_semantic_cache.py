@@ -0,0 +1,125 @@
+import json
+import time
+import pytest
+import requests
+from compare_models import FINETUNED_MODEL
+from ollama_stub import StubModel, start_stub
+from semantic_cache import SemanticCache, start_proxy
+
+STUB_TTFT = 0.05
+OPTIONS = {"temperature": 0.0, "num_predict": 32}
+QUESTIONS = [
+    "Can a PPI issuer store customer transaction data for future use?",
+    "What is the current repo rate set by the Monetary Policy Committee?",
+    "What are the KYC requirements for opening a small account?",
+    "How much deposit insurance cover does DICGC provide per depositor?",
+    "What is the limit for UPI Lite transactions without a PIN?",
+]
+# Same question, reworded: answered from the cache by embedding similarity
+PARAPHRASE = (0, "can a ppi issuer store customer transaction data for future use")
+# Different questions that share many words with a cached one: never served from it
+NEAR_MISSES = ["Can a payment aggregator store customer card data for future use?",
+               "What is the limit for UPI Lite wallet balance?"]
+
+@pytest.fixture
+def proxy(hashing_embedder):
+    answers = {q: f"Answer {i}: regulated entities must comply with the directions." for i, q in enumerate(QUESTIONS)}
+    model = StubModel(STUB_TTFT, 400.0, answers=answers, digest="v1")
+    stub = start_stub({FINETUNED_MODEL: model, "broken": StubModel(STUB_TTFT, error_rate=1.0)})
+    cache = SemanticCache(filepath=None, embedder=hashing_embedder)
+    server = start_proxy(cache, f"http://127.0.0.1:{stub.server_address[1]}", tags_refresh=0)
+    yield f"http://127.0.0.1:{server.server_address[1]}", cache, model
+    server.shutdown()
+    stub.shutdown()
+    cache.close()
+
+def ask(url: str, prompt: str, options=OPTIONS, stream: bool = True, model: str = FINETUNED_MODEL):
+    # (X-Cache header, response text or None on an error)
+    response = requests.post(f"{url}/api/generate", json={"model": model, "prompt": prompt, "stream": stream,
+                                                          "options": options}, stream=stream, timeout=30)
+    if stream:
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+        text = "".join(chunk.get("response", "") for chunk in lines)
+        done = bool(lines) and lines[-1].get("done")
+    else:
+        body = response.json()
+        text, done = body.get("response", ""), body.get("done")
+    return response.headers.get("X-Cache"), text if response.status_code == 200 and done else None
+
+def metrics(url: str):
+    return requests.get(f"{url}/cache/metrics", timeout=10).json()
+
+def test_exact_hits(proxy):
+    url, _, _ = proxy
+    status, first = ask(url, QUESTIONS[0])
+    assert status == "miss" and first.startswith("Answer 0")
+    assert ask(url, QUESTIONS[0]) == ("exact", first)
+    assert ask(url, "  " + QUESTIONS[0].upper() + " ") == ("exact", first)
+    # A non-streaming request is served from the streamed entry
+    assert ask(url, QUESTIONS[0], stream=False) == ("exact", first)
+
+def test_semantic_hits_and_near_misses(proxy):
+    url, _, _ = proxy
+    for question in QUESTIONS:
+        ask(url, question)
+    index, paraphrase = PARAPHRASE
+    status, text = ask(url, paraphrase)
+    assert status == "semantic" and text.startswith(f"Answer {index}")
+    assert [ask(url, p)[0] for p in NEAR_MISSES] == ["miss", "miss"]
+    assert ask(url, QUESTIONS[1], options={"temperature": 0.7, "num_predict": 32})[0] == "miss"
+    assert metrics(url)["semantic"] == 1
+
+def test_upstream_errors_are_not_cached(proxy):
+    url, cache, _ = proxy
+    assert [ask(url, QUESTIONS[2], model="broken")[1] for _ in range(2)] == [None, None]
+    assert metrics(url)["upstream_error"] == 2
+    assert len(cache) == 0
+
+def test_expired_entries_miss(proxy):
+    url, cache, _ = proxy
+    ask(url, QUESTIONS[3])
+    cache.ttl = 0.2
+    time.sleep(0.3)
+    assert ask(url, QUESTIONS[3])[0] == "miss"
+    assert metrics(url)["expirations"] == 1
+
+def test_lru_keeps_the_newest_entries(proxy):
+    url, cache, _ = proxy
+    cache.max_entries = 3
+    for question in QUESTIONS[:4]:
+        ask(url, question)
+    assert len(cache) == 3
+    assert ask(url, QUESTIONS[3])[0] == "exact"
+    assert ask(url, QUESTIONS[0])[0] == "miss"
+    assert metrics(url)["evictions"] >= 1
+
+def test_new_model_digest_invalidates_entries(proxy):
+    url, cache, model = proxy
+    ask(url, QUESTIONS[4])
+    model.digest = "v2"
+    assert ask(url, QUESTIONS[4])[0] == "miss"
+    assert metrics(url)["invalidations"] == 1
+
+    # Digest unknown (model missing from /api/tags): passed through, every entry kept
+    model.digest = ""
+    status, text = ask(url, QUESTIONS[4])
+    assert status is None and text is not None
+    model.digest = "v2"
+    assert ask(url, QUESTIONS[4])[0] == "exact"
+    assert len(cache) == 1 and metrics(url)["invalidations"] == 1
+
+def test_expired_match_falls_through_to_a_live_one(hashing_embedder):
+    cache = SemanticCache(filepath=None, embedder=hashing_embedder)
+    closest = "What is the current repo rate set by the Monetary Policy Committee?"
+    other = "What is the current reverse repo rate set by the Monetary Policy Committee?"
+    cache.put(FINETUNED_MODEL, "v1", "p", closest, cache.embed(closest), {"response": "closest"})
+    time.sleep(0.3)
+    cache.put(FINETUNED_MODEL, "v1", "p", other, cache.embed(other), {"response": "other"})
+    cache.ttl = 0.2
+    # The expired entry is the closer match, but the live one is still above the threshold
+    kind, value, _ = cache.lookup(FINETUNED_MODEL, "v1", "p", closest.lower().rstrip("?"))
+    assert (kind, value) == ("semantic", {"response": "other"})
+    kind, value, vector = cache.lookup(FINETUNED_MODEL, "v1", "p", closest)
+    assert (kind, value) == ("semantic", {"response": "other"}) and vector is not None
+    assert cache.expirations == 1 and len(cache) == 1
+    cache.close()
@@ -0,0 +1,78 @@
+import json
+import os
+import time
+import pytest
+import torch
+from transformers import Trainer, TrainingArguments
+from tiny_model import make_tiny_model
+from train_profiler import PROFILE_FILE, attach_profiler
+
+BATCH_SIZE = 2
+ACCUMULATION = 2
+STEPS = 4
+COLLATE_DELAY_S = 0.05
+LENGTHS = [5 + 3 * i for i in range(BATCH_SIZE * ACCUMULATION * STEPS)]
+
+class SlowPaddingCollator:
+    # Right-pads to the longest sequence in the batch; the sleep stands in for a slow data pipeline
+    def __init__(self, delay_s: float):
+        self.delay_s = delay_s
+        self.calls = 0
+
+    def __call__(self, features):
+        self.calls += 1
+        time.sleep(self.delay_s)
+        width = max(len(f["input_ids"]) for f in features)
+        input_ids = torch.zeros(len(features), width, dtype=torch.long)
+        labels = torch.full((len(features), width), -100, dtype=torch.long)
+        attention_mask = torch.zeros(len(features), width, dtype=torch.long)
+        for row, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[row, :n] = torch.tensor(f["input_ids"])
+            labels[row, :n] = input_ids[row, :n]
+            attention_mask[row, :n] = 1
+        return {"input_ids": input_ids, "labels": labels, "attention_mask": attention_mask}
+
+@pytest.fixture
+def trained(tmp_path):
+    dataset = [{"input_ids": [(7 * i + j) % 500 + 3 for j in range(n)]} for i, n in enumerate(LENGTHS)]
+    collator = SlowPaddingCollator(COLLATE_DELAY_S)
+    args = TrainingArguments(
+        output_dir=str(tmp_path), per_device_train_batch_size=BATCH_SIZE, gradient_accumulation_steps=ACCUMULATION,
+        max_steps=STEPS, learning_rate=1e-3, logging_steps=2, save_strategy="no", report_to=[],
+        remove_unused_columns=False, use_cpu=True, disable_tqdm=True)
+    trainer = Trainer(model=make_tiny_model(), args=args, train_dataset=dataset, data_collator=collator)
+    profiler = attach_profiler(trainer)
+    trainer.train()
+    return profiler, collator, tmp_path
+
+def test_token_counts(trained):
+    profiler, _, _ = trained
+    assert [s["step"] for s in profiler.steps] == list(range(1, STEPS + 1))
+    # One epoch exactly: every sequence is counted once, padding only adds to the padded count
+    assert sum(s["real_tokens"] for s in profiler.steps) == sum(LENGTHS)
+    for step in profiler.steps:
+        assert 0 < step["real_tokens"] <= step["padded_tokens"]
+        assert step["real_tokens_per_s"] == pytest.approx(step["real_tokens"] / step["step_s"])
+
+def test_step_time_split(trained):
+    profiler, collator, _ = trained
+    assert collator.calls == STEPS * ACCUMULATION
+    for step in profiler.steps:
+        parts = step["data_wait_s"] + step["forward_backward_s"] + step["optimizer_s"]
+        # The remainder is the scheduler step and zero_grad after the optimizer
+        assert parts <= step["step_s"] < parts + 0.02
+        assert step["forward_backward_s"] > 0 and step["optimizer_s"] > 0
+        # The step's micro-batches are collated before its forward passes (the dataloader may
+        # fetch one of them ahead, inside the previous step)
+        assert step["data_wait_s"] >= (ACCUMULATION - 1) * COLLATE_DELAY_S
+
+def test_summary_written(trained):
+    profiler, _, output_dir = trained
+    with open(os.path.join(output_dir, PROFILE_FILE)) as f:
+        written = json.load(f)
+    summary = written["summary"]
+    assert summary["steps"] == STEPS
+    assert 0.9 < sum(summary["time_fraction"].values()) <= 1.0
+    assert summary["time_fraction"]["data_wait"] > summary["time_fraction"]["forward_backward"]
+    assert 0 < summary["padding_fraction"] < 1
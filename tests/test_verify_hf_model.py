@@ -0,0 +1,68 @@
+import copy
+import random
+import pytest
+import torch
+from synthetic_reports import make_paragraph
+from tiny_model import make_tiny_tokenizer
+from verify_hf_model import generate_batch
+
+NEW_TOKENS = 24
+LOOKAHEAD = 3
+
+@pytest.fixture(scope="module")
+def models():
+    # Random target; drafts that always agree with it, partly agree, and (almost) never agree
+    from transformers import Qwen2Config, Qwen2ForCausalLM
+    rng = random.Random(0)
+    texts = [make_paragraph(rng) for _ in range(200)]
+    tokenizer = make_tiny_tokenizer(texts)
+
+    def make_model(layers: int, seed: int):
+        torch.manual_seed(seed)
+        config = Qwen2Config(vocab_size=len(tokenizer), hidden_size=64, intermediate_size=256, num_hidden_layers=layers,
+                             num_attention_heads=4, num_key_value_heads=2, tie_word_embeddings=False,
+                             pad_token_id=tokenizer.pad_token_id)
+        return Qwen2ForCausalLM(config).eval()
+
+    target = make_model(2, 0)
+    perturbed = copy.deepcopy(target)
+    with torch.no_grad():
+        for p in perturbed.parameters():
+            p.add_(torch.randn_like(p) * 0.002)
+    drafts = {"self": copy.deepcopy(target), "perturbed": perturbed, "untrained": make_model(1, 1)}
+    # Prompts of different lengths, so batches are left-padded
+    prompts = [text[:rng.randint(20, 120)] for text in texts[:6]]
+    return tokenizer, target, drafts, prompts
+
+@pytest.mark.parametrize("draft_name", ["self", "perturbed", "untrained"])
+@pytest.mark.parametrize("batch_size", [1, 3])
+def test_speculative_output_equals_greedy(models, draft_name, batch_size):
+    tokenizer, target, drafts, prompts = models
+    for i in range(0, len(prompts), batch_size):
+        batch = prompts[i:i + batch_size]
+        plain = generate_batch(target, tokenizer, batch, max_new_tokens=NEW_TOKENS)
+        spec = generate_batch(target, tokenizer, batch, drafts[draft_name], LOOKAHEAD, NEW_TOKENS)
+        assert spec["responses"] == plain["responses"]
+
+def test_agreeing_draft_is_always_accepted(models):
+    tokenizer, target, drafts, prompts = models
+    result = generate_batch(target, tokenizer, prompts[:3], drafts["self"], LOOKAHEAD, NEW_TOKENS)
+    assert result["row_accepted"] == result["accepted"] == result["drafted"]
+    # Every target pass adds the LOOKAHEAD accepted tokens plus its own
+    assert result["target_passes"] == -(-NEW_TOKENS // (LOOKAHEAD + 1))
+
+def test_lookahead_longer_than_the_answer(models):
+    tokenizer, target, drafts, prompts = models
+    plain = generate_batch(target, tokenizer, prompts[:2], max_new_tokens=4)
+    spec = generate_batch(target, tokenizer, prompts[:2], drafts["perturbed"], 8, 4)
+    assert spec["responses"] == plain["responses"]
+
+def test_matches_transformers_assisted_generation(models):
+    tokenizer, target, drafts, prompts = models
+    inputs = tokenizer(prompts[:1], return_tensors="pt")
+    with torch.inference_mode():
+        output = target.generate(**inputs, assistant_model=drafts["perturbed"], num_assistant_tokens=LOOKAHEAD,
+                                 num_assistant_tokens_schedule="constant", max_new_tokens=NEW_TOKENS,
+                                 do_sample=False, pad_token_id=tokenizer.pad_token_id)
+    spec = generate_batch(target, tokenizer, prompts[:1], drafts["perturbed"], LOOKAHEAD, NEW_TOKENS)
+    assert tokenizer.decode(output[0, inputs["input_ids"].shape[1]:], skip_special_tokens=True) == spec["responses"][0]
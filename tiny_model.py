@@ -0,0 +1,38 @@
+from typing import Iterable
+import torch
+
+# Tiny randomly initialised Qwen2 model and tokenizer for offline CPU tests and benchmarks
+# of the training code paths (packing, pre-tokenization, callbacks). Not meant to learn anything.
+TINY_VOCAB_SIZE = 512
+TINY_HIDDEN_SIZE = 64
+TINY_LAYERS = 2
+TINY_HEADS = 4
+SPECIAL_TOKENS = ["<|endoftext|>", "<|im_start|>", "<|im_end|>"]
+
+def make_tiny_model(vocab_size: int = TINY_VOCAB_SIZE, attn_implementation: str = "sdpa", seed: int = 3407):
+    from transformers import Qwen2Config, Qwen2ForCausalLM
+    torch.manual_seed(seed)
+    config = Qwen2Config(
+        vocab_size=vocab_size,
+        hidden_size=TINY_HIDDEN_SIZE,
+        intermediate_size=4 * TINY_HIDDEN_SIZE,
+        num_hidden_layers=TINY_LAYERS,
+        num_attention_heads=TINY_HEADS,
+        num_key_value_heads=TINY_HEADS // 2,
+        max_position_embeddings=4096,
+        attn_implementation=attn_implementation,
+        use_cache=False,  # Training only; a KV cache also disables packed-sequence detection
+    )
+    return Qwen2ForCausalLM(config)
+
+def make_tiny_tokenizer(texts: Iterable[str], vocab_size: int = TINY_VOCAB_SIZE):
+    # Byte-level BPE trained on the given texts, wrapped as a transformers tokenizer
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import PreTrainedTokenizerFast
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=SPECIAL_TOKENS,
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(texts, trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, eos_token="<|im_end|>", pad_token="<|endoftext|>")
@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import hashlib
+from typing import Dict, List
+
+# Configuration
+# Local tokenizer.json (fastest, works offline) or a Hugging Face model id
+TOKENIZER_PATH = os.environ.get("TOKENIZER_PATH", "Qwen/Qwen2.5-7B-Instruct")
+TOKEN_CACHE_FILE = os.path.join(".cache", "token_counts.sqlite")
+
+def load_tokenizer(path: str = TOKENIZER_PATH):
+    # Returns (encode_batch(texts) -> list of token id lists, identity string for cache keys)
+    if path.endswith(".json") and os.path.exists(path):
+        from tokenizers import Tokenizer
+        tokenizer = Tokenizer.from_file(path)
+        with open(path, 'rb') as f:
+            identity = hashlib.sha256(f.read()).hexdigest()
+        return (lambda texts: [e.ids for e in tokenizer.encode_batch(texts, add_special_tokens=False)]), identity
+
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(path)
+    identity = f"{path}@{len(tokenizer)}"
+    return (lambda texts: tokenizer(texts, add_special_tokens=False)["input_ids"]), identity
+
+class TokenCounter:
+    # Token counts are cached per (tokenizer, text) so every sample is tokenized exactly once
+    # across runs; later stages (length bucketing, packing) read the cached counts.
+    def __init__(self, tokenizer_path: str = TOKENIZER_PATH, cache_file: str = TOKEN_CACHE_FILE):
+        self.encode_batch, self.identity = load_tokenizer(tokenizer_path)
+        os.makedirs(os.path.dirname(cache_file) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(cache_file)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS token_counts (key TEXT PRIMARY KEY, tokens INTEGER NOT NULL)")
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.identity}\0{text}".encode('utf-8')).hexdigest()
+
+    def count(self, texts: List[str]) -> List[int]:
+        keys = [self._key(t) for t in texts]
+        cached: Dict[str, int] = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cached.update(self.conn.execute(
+                f"SELECT key, tokens FROM token_counts WHERE key IN ({placeholders})", chunk).fetchall())
+
+        missing = [i for i, k in enumerate(keys) if k not in cached]
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            encoded = self.encode_batch([texts[i] for i in missing])
+            rows = [(keys[i], len(ids)) for i, ids in zip(missing, encoded)]
+            self.conn.executemany("INSERT OR REPLACE INTO token_counts (key, tokens) VALUES (?, ?)", rows)
+            self.conn.commit()
+            cached.update(rows)
+        return [cached[k] for k in keys]
+
+    def close(self):
+        self.conn.close()
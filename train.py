@@ -1,11 +1,16 @@
 from unsloth import FastLanguageModel
 import torch
 from trl import SFTTrainer
-from transformers import TrainingArguments
-from datasets import load_dataset
+from transformers import EarlyStoppingCallback, TrainingArguments
 import os
+import glob
+import time
 from dotenv import load_dotenv
 from unsloth.chat_templates import get_chat_template
+from packing import PACKING_ATTENTION, PackedCollator, PackedDataset
+from pretokenize import load_or_build
+from eval_metrics import GenerationEvalCallback, load_eval_samples, validation_files
+from train_profiler import attach_profiler
 
 load_dotenv()
 
@@ -19,6 +24,15 @@ os.environ["WANDB_PROJECT"] = "qwen3-8b-finetune-rbi"
 os.environ["WANDB_LOG_MODEL"] = "checkpoint"
 
 model_name = "Qwen/Qwen2.5-7B-Instruct"
+finetune_dir = "finetune_data"
+use_packing = True # First-fit-decreasing pack samples into max_seq_length rows (see packing.py)
+
+# Evaluation / early stopping
+num_train_epochs = 20 # Upper bound; early stopping usually ends the run sooner
+eval_steps = 50 # Also the checkpoint interval, so the best checkpoint can be restored
+early_stopping_patience = 5 # Evaluations without improvement before stopping
+metric_for_best_model = "eval_loss" # Or "eval_rouge_l" (generation metric, higher is better)
+report_to = os.environ.get("REPORT_TO", "wandb") # "none" to run without experiment tracking
 
 def main():
     print(f"Loading model: {model_name}")
@@ -51,30 +65,33 @@ def main():
         loftq_config = None,
     )
 
-    # Load Dataset
-    dataset = load_dataset("json", data_files="finetune_dataset.json", split="train")
-    print(f"Loaded dataset with {len(dataset)} samples")
-
-    # ChatML Formatting Function
-    def formatting_prompts_func(examples):
-        instructions = examples["instruction"]
-        inputs       = examples["input"]
-        outputs      = examples["output"]
-        texts = []
-        for instruction, input, output in zip(instructions, inputs, outputs):
-            # ChatML format
-            text = f"<|im_start|>system\nYou are a helpful financial assistant trained on RBI reports.<|im_end|>\n" \
-                   f"<|im_start|>user\n{instruction}\n{input}<|im_end|>\n" \
-                   f"<|im_start|>assistant\n{output}<|im_end|>"
-            texts.append(text)
-        return texts
+    # Load Dataset: token ids of the length-bucketed shards, memory-mapped from the
+    # pre-tokenized cache (rebuilt only when the data, chat template or tokenizer change)
+    start = time.perf_counter()
+    train_files = glob.glob(os.path.join(finetune_dir, "train", "*", "*.jsonl"))
+    samples, cache_hit = load_or_build(train_files, tokenizer)
+    print(f"{'Mapped cached' if cache_hit else 'Built'} pre-tokenized dataset: {len(samples)} samples, "
+          f"{samples.meta['num_tokens']} tokens in {time.perf_counter() - start:.2f}s")
+
+    # Rows are built on access; packing fills them first-fit-decreasing (see packing.py)
+    train_dataset = PackedDataset(samples, max_seq_length, pack = use_packing)
+    if use_packing:
+        print(f"Packed {len(samples)} samples into {len(train_dataset)} sequences "
+              f"({samples.lengths.sum() / (len(train_dataset) * max_seq_length):.1%} filled, attention: {PACKING_ATTENTION})")
+    # Held-out split written by prepare_finetune_dataset.py
+    eval_samples, _ = load_or_build(validation_files(finetune_dir), tokenizer)
+    eval_dataset = PackedDataset(eval_samples, max_seq_length, pack = use_packing)
+    print(f"Evaluating on {len(eval_samples)} held-out samples every {eval_steps} steps")
+
+    model.config.use_cache = False
+    compute_dtype = torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
 
     # Training Arguments
     training_args = TrainingArguments(
-        per_device_train_batch_size = 2,
+        per_device_train_batch_size = 1 if use_packing else 2, # A packed row holds several samples
         gradient_accumulation_steps = 4,
         warmup_steps = 5,
-        num_train_epochs = 20,
+        num_train_epochs = num_train_epochs,
         learning_rate = 2e-4,
         fp16 = not torch.cuda.is_bf16_supported(),
         bf16 = torch.cuda.is_bf16_supported(),
@@ -83,28 +100,53 @@ def main():
         weight_decay = 0.01,
         lr_scheduler_type = "linear",
         seed = 3407,
+        group_by_length = not use_packing, # Batch similar lengths together to cut padding
+        remove_unused_columns = False, # Keep position_ids for the collator
         output_dir = "outputs",
-        report_to="wandb",
+        eval_strategy = "steps",
+        eval_steps = eval_steps,
+        per_device_eval_batch_size = 1 if use_packing else 2,
+        save_strategy = "steps",
+        save_steps = eval_steps,
+        save_total_limit = 2, # Best checkpoint is always kept in addition to the latest
+        load_best_model_at_end = True,
+        metric_for_best_model = metric_for_best_model,
+        greater_is_better = metric_for_best_model != "eval_loss",
+        report_to = report_to,
         run_name="qwen2.5-7b-finetune-rbi",
     )
 
+    # Registered before EarlyStoppingCallback so eval_rouge_l is in the metrics when early stopping checks them
+    generation_eval = GenerationEvalCallback(tokenizer, load_eval_samples(validation_files(finetune_dir)))
     trainer = SFTTrainer(
         model = model,
         tokenizer = tokenizer,
-        train_dataset = dataset,
-        dataset_text_field = "text",
         max_seq_length = max_seq_length,
-        dataset_num_proc = 2,
-        packing = False,
+        packing = False, # Packing, when enabled, is done above with per-sample attention isolation
         args = training_args,
-        formatting_func = formatting_prompts_func,
+        train_dataset = train_dataset,
+        eval_dataset = eval_dataset,
+        data_collator = PackedCollator(tokenizer.pad_token_id, dtype = compute_dtype),
+        dataset_kwargs = {"skip_prepare_dataset": True},
+        callbacks = [generation_eval, EarlyStoppingCallback(early_stopping_patience = early_stopping_patience)],
     )
+    generation_eval.trainer = trainer
+    # Per-step throughput, time breakdown, memory and MFU (PROFILE_STEPS=a:b adds a torch.profiler trace)
+    attach_profiler(trainer, gradient_checkpointing = True)
 
     print("Starting training...")
+    start = time.perf_counter()
     trainer_stats = trainer.train()
+    elapsed = time.perf_counter() - start
     print("Training completed!")
+    epochs_run = trainer.state.epoch or num_train_epochs
+    projected = elapsed / epochs_run * num_train_epochs
+    print(f"Stopped after {epochs_run:.2f} of {num_train_epochs} epochs in {elapsed / 3600:.2f}h; "
+          f"a fixed {num_train_epochs}-epoch run would take ~{projected / 3600:.2f}h "
+          f"(~{(projected - elapsed) / 3600:.2f}h saved)")
+    print(f"Best {metric_for_best_model}: {trainer.state.best_metric} ({trainer.state.best_model_checkpoint})")
 
-    # Save model
+    # Save model (the best checkpoint, restored by load_best_model_at_end)
     model.save_pretrained("lora_model")
     tokenizer.save_pretrained("lora_model")
     print("Model saved to lora_model")
@@ -0,0 +1,208 @@
+import os
+import json
+import time
+import resource
+import statistics
+from typing import Dict, List, Optional
+import torch
+from transformers import TrainerCallback
+
+# Configuration
+PROFILE_FILE = "train_profile.json"  # Written to the trainer's output_dir
+# Optional torch.profiler window, "first:last" optimizer steps, e.g. PROFILE_STEPS=10:12
+PROFILE_STEPS = os.environ.get("PROFILE_STEPS", "")
+# Peak dense bf16/fp16 FLOP/s used for MFU; PEAK_TFLOPS overrides the lookup by GPU name
+PEAK_TFLOPS = {"H100": 989, "A100": 312, "L40S": 362, "A10G": 125, "L4": 121, "A10": 125, "T4": 65, "V100": 125}
+
+def peak_flops() -> Optional[float]:
+    if os.environ.get("PEAK_TFLOPS"):
+        return float(os.environ["PEAK_TFLOPS"]) * 1e12
+    if torch.cuda.is_available():
+        name = torch.cuda.get_device_name()
+        for key, tflops in PEAK_TFLOPS.items():
+            if key in name:
+                return tflops * 1e12
+    return None  # MFU is not reported without a known peak
+
+def count_parameters(model) -> int:
+    # 4-bit weights are stored packed; their logical size is in quant_state
+    total = 0
+    for p in model.parameters():
+        quant_state = getattr(p, "quant_state", None)
+        total += int(torch.Size(quant_state.shape).numel()) if quant_state is not None else p.numel()
+    return total
+
+class TokenCountingCollator:
+    # Wraps a data collator to count real (unpadded) and padded tokens per batch. Runs in the
+    # main process, so keep dataloader_num_workers=0 (the default) for the counts to arrive.
+    def __init__(self, collator, profiler: "TrainProfiler"):
+        self.collator = collator
+        self.profiler = profiler
+
+    def __call__(self, features: List[Dict]):
+        batch = self.collator(features)
+        self.profiler.pending_real += sum(len(f["input_ids"]) for f in features)
+        self.profiler.pending_padded += batch["input_ids"].numel()
+        self.profiler.pending_seq = max(self.profiler.pending_seq, batch["input_ids"].shape[-1])
+        return batch
+
+class TrainProfiler(TrainerCallback):
+    # Per optimizer step: data wait (batch fetch + collate for all accumulation micro-batches),
+    # forward/backward, optimizer step, real/padded tokens per second, peak memory and MFU.
+    # Metrics are merged into the trainer's logs (so they reach wandb) and summarised in
+    # PROFILE_FILE at the end of training.
+    def __init__(self, model, gradient_checkpointing: bool = False):
+        self.num_params = count_parameters(model)
+        config = getattr(model, "config", None)
+        self.num_layers = getattr(config, "num_hidden_layers", 0)
+        self.hidden_size = getattr(config, "hidden_size", 0)
+        # Recomputing activations repeats the forward pass: 8N instead of 6N FLOPs per token
+        self.flops_per_param = 8 if gradient_checkpointing else 6
+        self.peak_flops = peak_flops()
+        self.cuda = torch.cuda.is_available()
+        self.steps: List[Dict] = []
+        self.unlogged: List[Dict] = []
+        self.pending_real = self.pending_padded = self.pending_seq = 0
+        self.last_event = None  # End of the previous step, or of logging/eval/saving after it
+        self.step_begin = self.pre_optimizer = self.post_optimizer = None
+        self.profile_range = tuple(int(s) for s in PROFILE_STEPS.split(":")) if PROFILE_STEPS else None
+        self.torch_profiler = None
+
+    def _now(self) -> float:
+        if self.cuda:
+            torch.cuda.synchronize()
+        return time.perf_counter()
+
+    def _mark_event(self):
+        self.last_event = self._now()
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        if self.cuda:
+            torch.cuda.reset_peak_memory_stats()
+        self._mark_event()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self.step_begin = self._now()
+        if self.profile_range and state.global_step + 1 == self.profile_range[0]:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.cuda:
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.torch_profiler = torch.profiler.profile(activities=activities, record_shapes=True,
+                                                         profile_memory=True, with_stack=False)
+            self.torch_profiler.__enter__()
+
+    def on_pre_optimizer_step(self, args, state, control, **kwargs):
+        self.pre_optimizer = self._now()
+
+    def on_optimizer_step(self, args, state, control, **kwargs):
+        self.post_optimizer = self._now()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        end = self._now()
+        total = end - self.last_event
+        real, padded, seq = self.pending_real, self.pending_padded, self.pending_seq
+        self.pending_real = self.pending_padded = self.pending_seq = 0
+        step = {
+            "step": state.global_step,
+            "data_wait_s": self.step_begin - self.last_event,
+            "forward_backward_s": (self.pre_optimizer or end) - self.step_begin,
+            "optimizer_s": (self.post_optimizer or end) - (self.pre_optimizer or end),
+            "step_s": total,
+            "real_tokens": real,
+            "padded_tokens": padded,
+            "real_tokens_per_s": real / total if total > 0 else 0.0,
+            "padded_tokens_per_s": padded / total if total > 0 else 0.0,
+            "peak_memory_gb": self._peak_memory_gb(),
+        }
+        if self.peak_flops and total > 0:
+            flops_per_token = self.flops_per_param * self.num_params + 12 * self.num_layers * self.hidden_size * seq
+            step["mfu"] = flops_per_token * real / total / self.peak_flops
+        self.steps.append(step)
+        self.unlogged.append(step)
+        self.pre_optimizer = self.post_optimizer = None
+        self.last_event = end
+
+        if self.torch_profiler is not None and state.global_step == self.profile_range[1]:
+            self._stop_torch_profiler(args.output_dir)
+            self._mark_event()  # Exporting the trace is not part of the next step
+
+    def _peak_memory_gb(self) -> float:
+        if self.cuda:
+            peak = torch.cuda.max_memory_allocated() / 1e9
+            torch.cuda.reset_peak_memory_stats()
+            return peak
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e6  # Process peak RSS (KiB on Linux)
+
+    def _stop_torch_profiler(self, output_dir: str):
+        self.torch_profiler.__exit__(None, None, None)
+        os.makedirs(output_dir, exist_ok=True)
+        self.torch_profiler.export_chrome_trace(os.path.join(output_dir, "profile_trace.json"))
+        sort_by = "cuda_time_total" if self.cuda else "cpu_time_total"
+        with open(os.path.join(output_dir, "profile_ops.txt"), 'w') as f:
+            f.write(self.torch_profiler.key_averages().table(sort_by=sort_by, row_limit=30))
+        self.torch_profiler = None
+        print(f"torch.profiler trace for steps {PROFILE_STEPS} written to {output_dir}/profile_trace.json")
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        # Averages over the steps since the previous log; must run before the reporting callbacks
+        if logs is not None and self.unlogged and "loss" in logs:
+            for key in self.unlogged[0]:
+                if key != "step":
+                    logs[f"profile/{key}"] = statistics.fmean(s[key] for s in self.unlogged)
+            self.unlogged = []
+        self._mark_event()
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        # Evaluation batches also pass through the collator; they are not training tokens
+        self.pending_real = self.pending_padded = self.pending_seq = 0
+        self._mark_event()
+
+    def on_save(self, args, state, control, **kwargs):
+        self._mark_event()
+
+    def summary(self) -> Dict:
+        steps = self.steps[1:] or self.steps  # The first step includes warm-up (compilation, allocator)
+        if not steps:
+            return {}
+        total_time = sum(s["step_s"] for s in steps)
+        real = sum(s["real_tokens"] for s in steps)
+        padded = sum(s["padded_tokens"] for s in steps)
+        summary = {
+            "steps": len(self.steps),
+            "num_parameters": self.num_params,
+            "real_tokens_per_s": real / total_time,
+            "padded_tokens_per_s": padded / total_time,
+            "padding_fraction": 1 - real / padded if padded else 0.0,
+            "peak_memory_gb": max(s["peak_memory_gb"] for s in self.steps),
+            "time_fraction": {
+                phase: sum(s[f"{phase}_s"] for s in steps) / total_time
+                for phase in ("data_wait", "forward_backward", "optimizer")
+            },
+            "median_step_s": statistics.median(s["step_s"] for s in steps),
+        }
+        if "mfu" in steps[0]:
+            summary["mfu"] = statistics.fmean(s["mfu"] for s in steps)
+        return summary
+
+    def on_train_end(self, args, state, control, **kwargs):
+        if self.torch_profiler is not None:
+            self._stop_torch_profiler(args.output_dir)
+        summary = self.summary()
+        os.makedirs(args.output_dir, exist_ok=True)
+        path = os.path.join(args.output_dir, PROFILE_FILE)
+        with open(path, 'w') as f:
+            json.dump({"summary": summary, "steps": self.steps}, f, indent=2)
+        if summary:
+            fractions = ", ".join(f"{k} {v:.0%}" for k, v in summary["time_fraction"].items())
+            mfu = f", MFU {summary['mfu']:.1%}" if "mfu" in summary else ""
+            print(f"Profile: {summary['real_tokens_per_s']:,.0f} real tokens/s "
+                  f"({summary['padding_fraction']:.1%} padding), {fractions}, "
+                  f"peak memory {summary['peak_memory_gb']:.2f} GB{mfu} -> {path}")
+
+def attach_profiler(trainer, gradient_checkpointing: bool = False) -> TrainProfiler:
+    # Wraps the trainer's collator for token counts and registers the callback ahead of the
+    # reporting integrations, so its log entries are included in what they send
+    profiler = TrainProfiler(trainer.model, gradient_checkpointing)
+    trainer.data_collator = TokenCountingCollator(trainer.data_collator, profiler)
+    trainer.callback_handler.callbacks.insert(0, profiler)
+    return profiler
@@ -1,56 +1,172 @@
+import os
+import sys
+import time
+import json
+from typing import Dict, List, Optional
 import torch
-from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
 
-# Path to the merged model we are trying to convert
-model_path = "merged_model" 
+# Configuration
+model_path = "merged_model"  # Path to the merged model we are trying to convert
+DRAFT_MODEL = os.environ.get("DRAFT_MODEL", "")  # e.g. Qwen/Qwen2.5-0.5B-Instruct (same tokenizer); empty = no draft
+LOOKAHEAD = 5  # Draft tokens proposed per target forward pass
+MAX_NEW_TOKENS = 200
+SYSTEM_MESSAGE = "You are a helpful financial assistant trained on RBI reports."
 
-print(f"Loading model from {model_path}...")
-try:
-    tokenizer = AutoTokenizer.from_pretrained(model_path)
+DEFAULT_PROMPT = """We run a prepaid voucher program. We are fintech - we work with issuing bank.
+We acquire customer. Voucher is actually issued by bank. They also share transaction details with us.
+Can we save it in our system for future use?"""
+
+def load_model(path: str):
+    tokenizer = AutoTokenizer.from_pretrained(path)
     model = AutoModelForCausalLM.from_pretrained(
-        model_path, 
+        path,
         torch_dtype=torch.bfloat16,
         device_map="auto"
     )
-except Exception as e:
-    print(f"Error loading model: {e}")
-    exit(1)
+    return model.eval(), tokenizer
 
-print("Model loaded successfully.")
+def chat_text(tokenizer, prompt: str) -> str:
+    messages = [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+    # Apply chat template if available, otherwise raw prompt
+    try:
+        return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+    except Exception:
+        return prompt
 
-prompt = """We run a prepaid voucher program. We are fintech - we work with issuing bank.
-We acquire customer. Voucher is actually issued by bank. They also share transaction details with us.
-Can we save it in our system for future use?"""
+def _forward(model, tokens, attention_mask, cache):
+    # tokens are the ones not in the cache yet; attention_mask covers cache + tokens (left padding)
+    positions = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, -tokens.shape[1]:]
+    return model(input_ids=tokens, attention_mask=attention_mask, position_ids=positions,
+                 past_key_values=cache, use_cache=True).logits
 
-messages = [
-    {"role": "system", "content": "You are a helpful financial assistant trained on RBI reports."},
-    {"role": "user", "content": prompt}
-]
-
-# Apply chat template if available, otherwise raw prompt
-try:
-    text = tokenizer.apply_chat_template(
-        messages, 
-        tokenize=False, 
-        add_generation_prompt=True
-    )
-except Exception:
-    print("Chat template not found, using raw prompt.")
-    text = prompt
-
-print(f"\nInput Text:\n{text}\n")
-
-inputs = tokenizer(text, return_tensors="pt").to(model.device)
-
-print("Generating...")
-with torch.no_grad():
-    outputs = model.generate(
-        **inputs, 
-        max_new_tokens=200,
-        temperature=0.7,
-        top_p=0.9,
-        do_sample=True
-    )
+def speculative_generate(model, draft, input_ids, attention_mask, max_new_tokens: int = MAX_NEW_TOKENS,
+                         lookahead: int = LOOKAHEAD, eos_token_id: Optional[int] = None, pad_token_id: int = 0):
+    # Greedy speculative decoding over a left-padded batch: the draft proposes `lookahead` tokens,
+    # one target pass scores them all, and every row advances by the longest prefix all unfinished
+    # rows agree on plus the target's own next token. Output equals greedy generate() on the target.
+    # Rows move in lockstep so both KV caches can be cropped to one length after a rejection.
+    prompt_length = input_ids.shape[1]
+    sequences, mask = input_ids, attention_mask
+    cache, draft_cache = DynamicCache(), DynamicCache()
+    finished = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+    stats = {"target_passes": 0, "draft_passes": 0, "drafted": 0, "accepted": 0, "row_accepted": 0}
+    while sequences.shape[1] - prompt_length < max_new_tokens and not finished.all():
+        k = min(lookahead, max_new_tokens - (sequences.shape[1] - prompt_length) - 1)
+        proposal, proposal_mask = sequences, mask
+        for _ in range(k):
+            logits = _forward(draft, proposal[:, draft_cache.get_seq_length():], proposal_mask, draft_cache)
+            proposal = torch.cat([proposal, logits[:, -1].argmax(-1, keepdim=True)], dim=1)
+            proposal_mask = torch.cat([proposal_mask, proposal_mask.new_ones(proposal_mask.shape[0], 1)], dim=1)
+        drafted = proposal[:, sequences.shape[1]:]
+        logits = _forward(model, proposal[:, cache.get_seq_length():], proposal_mask, cache)
+        predicted = logits[:, -(k + 1):].argmax(-1)
+        # Leading draft tokens each row's target agrees with; finished rows do not hold the batch back
+        row_accepted = (predicted[:, :k] == drafted).int().cumprod(dim=-1).sum(dim=-1)
+        accepted = int(row_accepted.masked_fill(finished, k).min())
+        new_tokens = torch.cat([drafted[:, :accepted], predicted[:, accepted:accepted + 1]], dim=1)
+        new_tokens = new_tokens.masked_fill(finished.unsqueeze(1), pad_token_id)
+        active = int((~finished).sum())
+        stats["target_passes"] += 1
+        stats["draft_passes"] += k
+        stats["drafted"] += k * active
+        stats["accepted"] += accepted * active
+        stats["row_accepted"] += int(row_accepted[~finished].sum())
+        sequences = torch.cat([sequences, new_tokens], dim=1)
+        mask = torch.cat([mask, mask.new_ones(mask.shape[0], new_tokens.shape[1])], dim=1)
+        if eos_token_id is not None:
+            finished |= (new_tokens == eos_token_id).any(dim=1)
+        # The last token is not in either cache yet: it is fed on the next step
+        for kv in (cache, draft_cache):
+            excess = kv.get_seq_length() - (sequences.shape[1] - 1)
+            if excess > 0:
+                kv.crop(-excess)
+    return sequences, stats
+
+def decode_new(tokenizer, sequences, prompt_length: int) -> List[str]:
+    responses = []
+    for row in sequences[:, prompt_length:].tolist():
+        if tokenizer.eos_token_id in row:
+            row = row[:row.index(tokenizer.eos_token_id)]
+        responses.append(tokenizer.decode(row, skip_special_tokens=True))
+    return responses
+
+def generate_batch(model, tokenizer, prompts: List[str], draft=None, lookahead: int = LOOKAHEAD,
+                   max_new_tokens: int = MAX_NEW_TOKENS, sample: bool = False) -> Dict:
+    # Plain generate() (sampled like the Modelfile, or greedy) or, with a draft model, greedy speculative decoding
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    inputs = tokenizer([chat_text(tokenizer, p) for p in prompts], return_tensors="pt", padding=True).to(model.device)
+    start = time.perf_counter()
+    stats = {}
+    with torch.inference_mode():
+        if draft is not None:
+            sequences, stats = speculative_generate(model, draft, inputs["input_ids"], inputs["attention_mask"],
+                                                    max_new_tokens, lookahead, tokenizer.eos_token_id,
+                                                    tokenizer.pad_token_id)
+        elif sample:
+            sequences = model.generate(**inputs, max_new_tokens=max_new_tokens, temperature=0.7, top_p=0.9,
+                                       do_sample=True, pad_token_id=tokenizer.pad_token_id)
+        else:
+            sequences = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                       pad_token_id=tokenizer.pad_token_id)
+    seconds = time.perf_counter() - start
+    responses = decode_new(tokenizer, sequences, inputs["input_ids"].shape[1])
+    tokens = sum(len(tokenizer(r)["input_ids"]) for r in responses)
+    return dict(stats, responses=responses, seconds=seconds, tokens=tokens)
+
+def read_prompts(path: str) -> List[str]:
+    # One prompt per line, or JSONL with an "instruction" (+ optional "input") per line
+    prompts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                line = "\n".join(part for part in (item.get("instruction", ""), item.get("input", "")) if part)
+            prompts.append(line)
+    return prompts
+
+def main():
+    # python verify_hf_model.py [--model merged_model] [--prompts FILE] [--draft DIR] [--lookahead 5]
+    #                           [--max-new-tokens 200] [--greedy]
+    # Without --draft: the original sampled spot check. With --draft: greedy speculative decoding.
+    args = sys.argv[1:]
+
+    def option(flag, default):
+        return args[args.index(flag) + 1] if flag in args else default
+
+    path = option("--model", model_path)
+    draft_path = option("--draft", DRAFT_MODEL)
+    prompts = read_prompts(option("--prompts", "")) if "--prompts" in args else [DEFAULT_PROMPT]
+
+    print(f"Loading model from {path}...")
+    try:
+        model, tokenizer = load_model(path)
+        draft = load_model(draft_path)[0] if draft_path else None
+    except Exception as e:
+        print(f"Error loading model: {e}")
+        exit(1)
+    print("Model loaded successfully." + (f" Draft model: {draft_path}" if draft is not None else ""))
+    if len(prompts) == 1:
+        print(f"\nInput Text:\n{chat_text(tokenizer, prompts[0])}\n")
+
+    print("Generating...")
+    result = generate_batch(model, tokenizer, prompts, draft, int(option("--lookahead", LOOKAHEAD)),
+                            int(option("--max-new-tokens", MAX_NEW_TOKENS)), sample="--greedy" not in args and draft is None)
+    for prompt, response in zip(prompts, result["responses"]):
+        print(f"\nOutput:\n{response}" if len(prompts) == 1 else f"\n>>> {prompt}\n{response}")
+    print(f"\n{result['tokens']} tokens in {result['seconds']:.1f}s ({result['tokens'] / result['seconds']:.1f} tokens/s)")
+    if draft is not None and result["drafted"]:
+        print(f"Draft acceptance {result['row_accepted'] / result['drafted']:.0%} per row, "
+              f"{result['accepted'] / result['drafted']:.0%} in lockstep; "
+              f"{result['target_passes']} target passes, {result['draft_passes']} draft passes")
 
-response = tokenizer.decode(outputs[0], skip_special_tokens=True)
-print(f"\nOutput:\n{response}")
+if __name__ == "__main__":
+    main()